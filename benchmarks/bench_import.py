@@ -0,0 +1,70 @@
+"""
+Measures the cold import time of the application.
+
+Each run imports `pymasters.main` in a fresh interpreter with `-X importtime`,
+so nothing is cached in the process. Reports the median wall time over the runs
+and the modules with the highest cumulative import time in the last run. With
+`--budget-ms` it exits with status 1 when the median exceeds the budget, so CI
+can catch a heavy import creeping back onto the startup path.
+
+Usage:
+    python -m benchmarks.bench_import [--runs 7] [--top 15] [--budget-ms 1200]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, Tuple
+
+CODE = "import time; start = time.perf_counter(); import pymasters.main; print(time.perf_counter() - start)"
+
+
+def import_once(module_code: str = CODE) -> Tuple[float, List[Tuple[int, str]]]:
+    """
+    Imports the application in a new interpreter.
+
+    Returns:
+        Tuple[float, List[Tuple[int, str]]]: The wall time in seconds, and `(cumulative microseconds, module)`
+        of every top-level package imported.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", module_code],
+                            capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": os.getcwd()})
+    modules = []
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        if "." not in name:  # packages, not their submodules, whose time is already in the cumulative figure
+            modules.append((int(cumulative), name))
+    return float(result.stdout.strip()), modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the application's cold import time.")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--top", type=int, default=15, help="Heaviest imports to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if the median import time exceeds this")
+    args = parser.parse_args(argv)
+
+    times = []
+    for _ in range(args.runs):
+        seconds, modules = import_once()
+        times.append(seconds * 1000)
+    median = statistics.median(times)
+
+    print(f"import pymasters.main: median {median:.0f} ms, min {min(times):.0f} ms, max {max(times):.0f} ms "
+          f"over {args.runs} runs")
+    print(f"{'cumulative ms':>14}  module")
+    for cumulative, name in sorted(modules, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>14.1f}  {name}")
+
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"Import time {median:.0f} ms exceeds the budget of {args.budget_ms:.0f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Measures confirmation email throughput against a local SMTP server.
+
+Compares sending every email through its own `FastMail` connection (the
+original `send_email` path) with the pooled, batched `MailDispatcher`. Uses
+aiosmtpd when it is installed and the bundled `tests/smtp_sink.py` otherwise;
+`--connect-delay` adds a per-connection delay to stand in for the TLS handshake
+with a remote provider.
+
+Usage:
+    python -m benchmarks.bench_mail [--messages 500] [--concurrency 50] [--connect-delay 0.05]
+"""
+import argparse
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
+
+from pymasters.services.mail_dispatcher import MailDispatcher, RateLimiter
+from tests.smtp_sink import SMTPSink, local_config
+
+
+@asynccontextmanager
+async def smtp_server(connect_delay: float):
+    try:
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.handlers import Sink
+    except ImportError:
+        async with SMTPSink(connect_delay=connect_delay) as sink:
+            yield sink.port
+        return
+
+    class SlowSink(Sink):
+        async def handle_EHLO(self, server, session, envelope, hostname, responses):
+            await asyncio.sleep(connect_delay)
+            session.host_name = hostname
+            return responses
+
+    controller = Controller(SlowSink(), hostname="127.0.0.1", port=0)
+    controller.start()
+    try:
+        yield controller.server.sockets[0].getsockname()[1]
+    finally:
+        controller.stop()
+
+
+def make_message(i: int) -> MessageSchema:
+    return MessageSchema(
+        subject="Confirm your email ",
+        recipients=[f"user{i}@example.com"],
+        template_body={"host": "http://localhost/", "token": f"token-{i}"},
+        subtype=MessageType.html,
+    )
+
+
+async def run_fastmail(config: ConnectionConfig, messages: int, concurrency: int) -> float:
+    limit = asyncio.Semaphore(concurrency)
+
+    async def send(i: int):
+        async with limit:
+            await FastMail(config).send_message(make_message(i), template_name="email_tamplate.html")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(messages)))
+    return time.perf_counter() - start
+
+
+async def run_dispatcher(config: ConnectionConfig, messages: int, pool_size: int, batch_size: int) -> float:
+    dispatcher = MailDispatcher(config, pool_size=pool_size, batch_size=batch_size, rate_limiter=RateLimiter(0))
+    await dispatcher.start()
+    start = time.perf_counter()
+    futures = [await dispatcher.submit(make_message(i), "email_tamplate.html") for i in range(messages)]
+    await asyncio.gather(*futures)
+    elapsed = time.perf_counter() - start
+    await dispatcher.stop()
+    return elapsed
+
+
+async def main_async(args):
+    async with smtp_server(args.connect_delay) as port:
+        config = local_config(port)
+        fastmail = await run_fastmail(config, args.messages, args.concurrency)
+        pooled = await run_dispatcher(config, args.messages, args.pool_size, args.batch_size)
+
+    print(f"{args.messages} emails, {args.connect_delay * 1000:.0f} ms per new connection")
+    print(f"{'path':<28}{'seconds':>10}{'emails/s':>12}")
+    print(f"{'FastMail per message':<28}{fastmail:>10.2f}{args.messages / fastmail:>12.0f}")
+    print(f"{'pooled dispatcher':<28}{pooled:>10.2f}{args.messages / pooled:>12.0f}")
+    print(f"speedup: {fastmail / pooled:.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark email delivery paths.")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent FastMail sends")
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--connect-delay", type=float, default=0.05, help="Seconds per new SMTP connection")
+    asyncio.run(main_async(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
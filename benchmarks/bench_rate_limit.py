@@ -0,0 +1,90 @@
+"""
+Measures the overhead of request rate limiting.
+
+Compares the in-memory token bucket of `services.rate_limit` with the fixed and
+moving window limiters of the `limits` package (what slowapi uses) on a mix of
+client keys, and the per-request latency a rate-limited route adds over the
+same route without the dependency.
+
+Usage:
+    python -m benchmarks.bench_rate_limit [--checks 200000] [--keys 1000] [--requests 2000]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+import limits
+from fastapi import Depends, FastAPI
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter, MovingWindowRateLimiter
+
+from pymasters.services.rate_limit import Limit, MemoryBucketStore, limiter, limit_by_ip
+
+RATE = "1000000/minute"
+
+
+async def token_bucket(checks: int, keys: int) -> float:
+    store = MemoryBucketStore()
+    limit = Limit.parse(RATE)
+    start = time.perf_counter()
+    for i in range(checks):
+        await store.acquire(f"login:ip:{i % keys}", limit)
+    return time.perf_counter() - start
+
+
+def window(strategy, checks: int, keys: int) -> float:
+    rate_limiter = strategy(MemoryStorage())
+    item = limits.parse(RATE)
+    start = time.perf_counter()
+    for i in range(checks):
+        rate_limiter.hit(item, "login", f"ip:{i % keys}")
+    return time.perf_counter() - start
+
+
+async def route_latency(requests: int) -> tuple:
+    app = FastAPI()
+
+    @app.get("/plain")
+    async def plain():
+        return {}
+
+    @app.get("/limited", dependencies=[Depends(limit_by_ip("bench"))])
+    async def limited():
+        return {}
+
+    limiter.limits = {"bench": Limit.parse(RATE)}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        results = []
+        for path in ("/plain", "/limited"):
+            await client.get(path)
+            start = time.perf_counter()
+            for _ in range(requests):
+                await client.get(path)
+            results.append((time.perf_counter() - start) / requests)
+    return tuple(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark request rate limiting.")
+    parser.add_argument("--checks", type=int, default=200000)
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    print(f"{'limiter':<30}{'seconds':>10}{'checks/s':>12}{'us/check':>10}")
+    rows = [
+        ("token bucket (memory)", asyncio.run(token_bucket(args.checks, args.keys))),
+        ("limits fixed window", window(FixedWindowRateLimiter, args.checks, args.keys)),
+        ("limits moving window", window(MovingWindowRateLimiter, args.checks, args.keys)),
+    ]
+    for name, seconds in rows:
+        print(f"{name:<30}{seconds:>10.3f}{args.checks / seconds:>12.0f}{seconds / args.checks * 1e6:>10.2f}")
+
+    plain, limited = asyncio.run(route_latency(args.requests))
+    print(f"route latency: {plain * 1e6:.0f} us without, {limited * 1e6:.0f} us with the rate limit "
+          f"(+{(limited - plain) * 1e6:.0f} us)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Measures per-request JSON serialization overhead for photo listings.
+
+Compares FastAPI's default path (response_model validation + jsonable_encoder +
+JSONResponse) with the fast path in `pymasters.responses` (ModelResponse, which
+encodes models once with `model_dump_json`) for lists of 1, 100 and 1000 photos.
+
+Usage:
+    python -m benchmarks.bench_serialization [--repeat 200]
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from pymasters.responses import ModelResponse
+from pymasters.schemas import PhotoDisplay, TransformationDisplay
+
+SIZES = (1, 100, 1000)
+
+
+def make_photos(count: int) -> List[PhotoDisplay]:
+    created_at = datetime(2024, 7, 29, 12, 0, 0)
+    return [
+        PhotoDisplay(
+            id=i,
+            photo_urls=f"http://res.cloudinary.com/demo/image/upload/photo_{i}.jpg",
+            description=f"Photo number {i}",
+            tags=["nature", "sky", f"tag_{i % 50}"],
+            transformations=[
+                TransformationDisplay(
+                    id=i,
+                    transformation_url=f"http://res.cloudinary.com/demo/image/upload/w_300,h_300,c_fill/photo_{i}.jpg",
+                    qr_code_url=f"http://res.cloudinary.com/demo/image/upload/qr_{i}.png",
+                    created_at=created_at,
+                )
+            ],
+        )
+        for i in range(count)
+    ]
+
+
+async def default_path(field, photos) -> bytes:
+    content = await serialize_response(field=field, response_content=photos, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def orjson_path(field, photos) -> bytes:
+    content = await serialize_response(field=field, response_content=photos, is_coroutine=True)
+    return ORJSONResponse(content).body
+
+
+async def model_path(field, photos) -> bytes:
+    return ModelResponse(photos).body
+
+
+async def measure(path, field, photos, repeat: int) -> float:
+    await path(field, photos)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await path(field, photos)
+    return (time.perf_counter() - start) / repeat
+
+
+async def run(repeat: int) -> dict:
+    field = create_response_field(name="Response", type_=List[PhotoDisplay], mode="serialization")
+    results = {}
+    for size in SIZES:
+        photos = make_photos(size)
+        # Every path must produce the same document
+        assert json.loads(await default_path(field, photos)) == json.loads(await model_path(field, photos))
+        results[size] = {
+            name: await measure(path, field, photos, repeat) * 1e6
+            for name, path in (("default", default_path), ("orjson", orjson_path), ("model_dump_json", model_path))
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200, help="Iterations per measurement")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.repeat))
+    print(f"{'items':>6} {'default us':>12} {'orjson us':>12} {'model_dump_json us':>20} {'speedup':>8}")
+    for size, timings in results.items():
+        speedup = timings["default"] / timings["model_dump_json"]
+        print(f"{size:>6} {timings['default']:>12.1f} {timings['orjson']:>12.1f} "
+              f"{timings['model_dump_json']:>20.1f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
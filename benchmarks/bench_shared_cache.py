@@ -0,0 +1,120 @@
+"""
+Compares the shared-memory cache with per-process caches.
+
+1. Single process: get (hit) and set throughput of `LocalCache` and
+   `SharedCache` with a photo-sized value.
+2. Several forked workers serving the same skewed (Zipf) stream of keys, each
+   loading and caching a value on a miss: overall hit rate, the number of
+   loads (database queries in the app) and the cache memory of
+   - a per-process cache of `--entries` entries in every worker,
+   - a per-process cache of `--entries / --workers` entries (the same number of entries in total),
+   - one shared cache of `--entries` slots.
+
+Usage:
+    python -m benchmarks.bench_shared_cache [--workers 4] [--requests 20000] [--keys 5000] [--entries 2000]
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import random
+import tempfile
+import time
+from itertools import accumulate
+
+from pymasters.services.cache import LocalCache
+from pymasters.services.shared_cache import HEADER_SIZE, WAYS, SharedCache
+
+SLOT_SIZE = 2048
+
+
+def value(key: int) -> tuple:
+    # Roughly the (owner ID, PhotoDisplay) of a photo with a few tags and transformations
+    return (key % 97, {
+        "id": key, "url": f"http://res.cloudinary.com/demo/image/upload/v1/photos/{key}.jpg",
+        "description": "A photo " * 8, "created_at": "2024-05-01T12:00:00",
+        "tags": [{"id": n, "name": f"tag{n}"} for n in range(5)],
+        "transformations": [{"id": n, "transformation_url": f"http://res.cloudinary.com/demo/t_{n}/{key}.jpg",
+                             "qr_code_url": f"http://res.cloudinary.com/demo/qr/{key}_{n}.png"} for n in range(2)],
+    })
+
+
+def shared_cache(path: str, entries: int) -> SharedCache:
+    return SharedCache(path, HEADER_SIZE + -(-entries // WAYS) * WAYS * SLOT_SIZE, ttl=300, slot_size=SLOT_SIZE)
+
+
+def rate(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for n in range(repeat):
+        fn(n)
+    return repeat / (time.perf_counter() - start)
+
+
+def single_process(path: str, repeat: int):
+    local, shared = LocalCache(max_size=1000, ttl=300), shared_cache(path, 1000)
+    print(f"{'cache':<14}{'set/s':>12}{'get hit/s':>12}")
+    for name, cache in (("local", local), ("shared", shared)):
+        sets = rate(lambda n: cache.set(str(n % 500), value(n % 500)), repeat)
+        gets = rate(lambda n: cache.get(str(n % 500)), repeat)
+        print(f"{name:<14}{sets:>12,.0f}{gets:>12,.0f}")
+    shared.close()
+
+
+def serve(kind: str, path: str, entries: int, stream: list, results):
+    cache = shared_cache(path, entries) if kind == "shared" else LocalCache(max_size=entries, ttl=300)
+    loads = 0
+    for key in stream:
+        if cache.get(str(key)) is None:
+            token = cache.begin()
+            loads += 1
+            cache.set(str(key), value(key), token)
+    results.put(loads)
+
+
+def workers(kind: str, path: str, entries: int, streams: list) -> int:
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [context.Process(target=serve, args=(kind, path, entries, stream, results)) for stream in streams]
+    for process in processes:
+        process.start()
+    loads = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return loads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the shared-memory cache against per-process caches.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20000, help="requests per worker")
+    parser.add_argument("--keys", type=int, default=5000, help="distinct objects requested")
+    parser.add_argument("--entries", type=int, default=2000, help="cache size")
+    parser.add_argument("--repeat", type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.cache")
+    single_process(path, args.repeat)
+
+    rng = random.Random(1)
+    weights = list(accumulate(1 / rank for rank in range(1, args.keys + 1)))
+    streams = [rng.choices(range(args.keys), cum_weights=weights, k=args.requests) for _ in range(args.workers)]
+    total = args.workers * args.requests
+    entry_bytes = len(pickle.dumps(value(1))) + 100  # with the key and dict/LRU overhead
+
+    print(f"\n{args.workers} workers, {total:,} requests over {args.keys:,} keys (Zipf)")
+    print(f"{'cache':<30}{'hit rate':>10}{'loads':>10}{'~memory MB':>11}")
+    runs = (
+        ("per process", "local", args.entries, args.workers * args.entries * entry_bytes),
+        ("per process, entries / workers", "local", args.entries // args.workers, args.entries * entry_bytes),
+        ("shared", "shared", args.entries, shared_cache(path, args.entries)._size),
+    )
+    for name, kind, entries, memory in runs:
+        loads = workers(kind, path, entries, streams)
+        print(f"{name:<30}{1 - loads / total:>10.1%}{loads:>10,}{memory / 2 ** 20:>11.1f}")
+        if kind == "shared":
+            shared_cache(path, entries).clear()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Scripted load test against local stand-ins for Cloudinary and SMTP.
+
+Every virtual user runs the whole user journey:
+    signup -> confirm (link from the email) -> login -> upload -> transform -> comment -> read
+against the application served in-process over ASGI. Storage is the local
+filesystem backend (STORAGE_BACKEND=local) and email goes through the real
+outbox worker and pooled dispatcher to `tests/smtp_sink.py`, so nothing
+leaves the machine. The database is a fresh SQLite file unless
+--database-url points elsewhere (e.g. a disposable PostgreSQL database).
+
+Results are written as JSON: per endpoint the request and error counts,
+throughput and latency percentiles, plus the git commit, so runs of two
+commits can be compared:
+    python -m benchmarks.load_test --users 50 --concurrency 10 --output before.json
+
+The environment is configured before the application is imported, because
+the settings are read at import time.
+"""
+import argparse
+import asyncio
+import email
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from tests.smtp_sink import SMTPSink
+
+TOKEN_PATTERN = re.compile(rb"confirmed_email/([A-Za-z0-9_.\-]+)")
+TRANSFORMATION = "w_300,h_300,c_fill"
+
+
+def configure_environment(workdir: str, smtp_port: int, database_url: Optional[str]):
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URL": database_url or f"sqlite:///{os.path.join(workdir, 'load_test.db')}",
+        "STORAGE_BACKEND": "local",
+        "STORAGE_LOCAL_DIR": os.path.join(workdir, "media"),
+        "MAIL_SERVER": "127.0.0.1",
+        "MAIL_PORT": str(smtp_port),
+        "MAIL_SSL_TLS": "false",
+        "MAIL_STARTTLS": "false",
+        "MAIL_RATE_LIMIT": "0",
+        "EMAIL_OUTBOX_INTERVAL": "0.05",
+        "STORAGE_OUTBOX_INTERVAL": "0",
+        "RATE_LIMITS": "",
+    })
+    os.environ.setdefault("SECRET_KEY", "load-test-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("MAIL_USERNAME", "load-test")
+    os.environ.setdefault("MAIL_PASSWORD", "load-test")
+    os.environ.setdefault("MAIL_FROM", "noreply@example.com")
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Recorder:
+    """
+    Latencies and errors per endpoint.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def summary(self, wall_seconds: float) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for name, samples in self.latencies.items():
+            ordered = sorted(samples)
+            summary[name] = {
+                "count": len(samples),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(samples) / wall_seconds, 2),
+                "mean_ms": round(sum(samples) / len(samples) * 1000, 2),
+                "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+                "p90_ms": round(percentile(ordered, 0.90) * 1000, 2),
+                "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+                "max_ms": round(ordered[-1] * 1000, 2),
+            }
+        return summary
+
+
+class ScenarioError(Exception):
+    pass
+
+
+class VirtualUser:
+    def __init__(self, number: int, client, sink: SMTPSink, recorder: Recorder, reads: int, email_timeout: float):
+        self.email = f"load{number}-{os.getpid()}@example.com"
+        self.client = client
+        self.sink = sink
+        self.recorder = recorder
+        self.reads = reads
+        self.email_timeout = email_timeout
+        self.headers: Dict[str, str] = {}
+
+    async def call(self, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        ok = response.status_code < 400
+        self.recorder.record(name, time.perf_counter() - start, ok)
+        if not ok:
+            raise ScenarioError(f"{name}: {response.status_code} {response.text[:200]}")
+        return response.json() if response.content else None
+
+    async def confirmation_token(self) -> str:
+        start = time.perf_counter()
+        recipient = self.email.encode()
+        while time.perf_counter() - start < self.email_timeout:
+            for raw in self.sink.messages:
+                if recipient in raw:
+                    message = email.message_from_bytes(raw)
+                    for part in message.walk():
+                        match = TOKEN_PATTERN.search(part.get_payload(decode=True) or b"")
+                        if match:
+                            self.recorder.record("email_delivery", time.perf_counter() - start, True)
+                            return match.group(1).decode()
+            await asyncio.sleep(0.01)
+        self.recorder.record("email_delivery", time.perf_counter() - start, False)
+        raise ScenarioError("confirmation email not received")
+
+    async def run(self):
+        await self.call("signup", "POST", "/api/users/signup", json={"username": self.email, "password": "load-test"})
+        token = await self.confirmation_token()
+        await self.call("confirm_email", "GET", f"/api/users/confirmed_email/{token}")
+        tokens = await self.call("login", "POST", "/api/users/login",
+                                 data={"username": self.email, "password": "load-test"})
+        self.headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        photo = await self.call("upload", "POST", "/api/photos/upload",
+                                files={"file": ("photo.jpg", os.urandom(32 * 1024), "image/jpeg")},
+                                data={"description": "load test", "tags": ["load", "test", self.email]})
+        await self.call("transform", "POST", "/api/photos/transform",
+                        params={"photo_id": photo["id"], "transformation": TRANSFORMATION})
+        await self.call("comment", "POST", f"/api/comments/photos/{photo['id']}/comments/", json={"content": "Nice!"})
+        for _ in range(self.reads):
+            await self.call("read_photo", "GET", f"/api/photos/{photo['id']}")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    import httpx
+
+    with tempfile.TemporaryDirectory() as workdir:
+        async with SMTPSink(connect_delay=args.smtp_connect_delay) as sink:
+            configure_environment(workdir, sink.port, args.database_url)
+
+            from pymasters.database.db import engine
+            from pymasters.database.models import Base
+            from pymasters.main import app
+
+            Base.metadata.create_all(engine)
+            recorder = Recorder()
+            semaphore = asyncio.Semaphore(args.concurrency)
+            failures: List[str] = []
+
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+                    async def journey(number: int):
+                        async with semaphore:
+                            try:
+                                await VirtualUser(number, client, sink, recorder, args.reads, args.email_timeout).run()
+                            except ScenarioError as e:
+                                failures.append(str(e))
+
+                    start = time.perf_counter()
+                    await asyncio.gather(*(journey(number) for number in range(args.users)))
+                    wall_seconds = time.perf_counter() - start
+            engine.dispose()
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "reads_per_user": args.reads,
+        "completed_users": args.users - len(failures),
+        "failures": failures[:20],
+        "wall_seconds": round(wall_seconds, 3),
+        "emails_sent": len(sink.messages),
+        "smtp_connections": sink.connections,
+        "endpoints": recorder.summary(wall_seconds),
+    }
+
+
+def print_table(result: dict):
+    print(f"{result['completed_users']}/{result['users']} journeys in {result['wall_seconds']} s "
+          f"at concurrency {result['concurrency']}", file=sys.stderr)
+    print(f"{'endpoint':<16}{'count':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}",
+          file=sys.stderr)
+    for name, stats in result["endpoints"].items():
+        print(f"{name:<16}{stats['count']:>7}{stats['errors']:>8}{stats['throughput_rps']:>9}"
+              f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the scripted load test against local stand-ins.")
+    parser.add_argument("--users", type=int, default=20, help="Virtual users, each running the whole journey")
+    parser.add_argument("--concurrency", type=int, default=5, help="Journeys running at the same time")
+    parser.add_argument("--reads", type=int, default=5, help="Photo reads per user")
+    parser.add_argument("--database-url", help="Database to use instead of a fresh SQLite file")
+    parser.add_argument("--smtp-connect-delay", type=float, default=0.0,
+                        help="Seconds added to every SMTP connection, to simulate a remote provider")
+    parser.add_argument("--email-timeout", type=float, default=30.0, help="Seconds to wait for each email")
+    parser.add_argument("--output", help="Write the JSON result to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    print_table(result)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Runs the local SMTP sink of the tests (`tests/smtp_sink.py`) as a server.
+
+    python -m benchmarks.smtp_sink --port 1025
+"""
+import argparse
+import asyncio
+
+from tests.smtp_sink import SMTPSink
+
+
+async def _serve(host: str, port: int, connect_delay: float):
+    sink = await SMTPSink(host, port, connect_delay).start()
+    print(f"SMTP sink listening on {sink.host}:{sink.port}")
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local SMTP sink.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--connect-delay", type=float, default=0.0, help="Seconds added to every new connection")
+    args = parser.parse_args(argv)
+    asyncio.run(_serve(args.host, args.port, args.connect_delay))
+
+
+if __name__ == "__main__":
+    main()
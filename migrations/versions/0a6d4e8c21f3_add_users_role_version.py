@@ -0,0 +1,26 @@
+"""Add users.role_version for claims-based authorization
+
+Revision ID: 0a6d4e8c21f3
+Revises: f25c8d0b7e19
+Create Date: 2026-10-19 15:32:06.218459
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a6d4e8c21f3'
+down_revision: Union[str, None] = 'f25c8d0b7e19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('role_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'role_version')
@@ -0,0 +1,28 @@
+"""Add photos.public_id for direct uploads
+
+Revision ID: 3c9f5d2e8a71
+Revises: 0a6d4e8c21f3
+Create Date: 2026-10-19 18:04:52.731940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9f5d2e8a71'
+down_revision: Union[str, None] = '0a6d4e8c21f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('public_id', sa.String(length=255), nullable=True))
+    op.create_index(op.f('ix_photos_public_id'), 'photos', ['public_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_photos_public_id'), table_name='photos')
+    op.drop_column('photos', 'public_id')
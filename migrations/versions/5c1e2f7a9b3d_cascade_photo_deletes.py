@@ -0,0 +1,38 @@
+"""Cascade photo deletes to photo_tags, comments and transformations
+
+Revision ID: 5c1e2f7a9b3d
+Revises: ddbca4ec407d
+Create Date: 2026-10-19 10:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e2f7a9b3d'
+down_revision: Union[str, None] = 'ddbca4ec407d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (constraint, table, column, referred table)
+FOREIGN_KEYS = [
+    ('photo_tags_photo_id_fkey', 'photo_tags', 'photo_id', 'photos'),
+    ('photo_tags_tag_id_fkey', 'photo_tags', 'tag_id', 'tags'),
+    ('comments_photo_id_fkey', 'comments', 'photo_id', 'photos'),
+    ('transformations_photo_id_fkey', 'transformations', 'photo_id', 'photos'),
+]
+
+
+def upgrade() -> None:
+    for name, table, column, referred in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [column], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    for name, table, column, referred in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred, [column], ['id'])
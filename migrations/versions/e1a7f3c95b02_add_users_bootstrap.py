@@ -0,0 +1,28 @@
+"""Add users.bootstrap marker for the bootstrap admin
+
+Revision ID: e1a7f3c95b02
+Revises: b4e9c2d7a610
+Create Date: 2026-10-19 14:05:12.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a7f3c95b02'
+down_revision: Union[str, None] = 'b4e9c2d7a610'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('bootstrap', sa.Boolean(), nullable=True))
+    op.create_unique_constraint('users_bootstrap_key', 'users', ['bootstrap'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('users_bootstrap_key', 'users', type_='unique')
+    op.drop_column('users', 'bootstrap')
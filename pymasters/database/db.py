@@ -1,22 +1,53 @@
+from functools import lru_cache
+from typing import Optional
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
 
-# Import the database URL from settings
-from pymasters.settings import SQLALCHEMY_DATABASE_URL
+from pymasters.database.routing import ReplicaSet, RoutingSession
+# Import the database URLs from settings
+from pymasters.settings import SQLALCHEMY_DATABASE_URL, SQLALCHEMY_REPLICA_URLS
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """
+    Returns the engine, created (with its dialect and driver imported) on first use.
+    """
+    return create_engine(SQLALCHEMY_DATABASE_URL)
+
 
-# Load environment variables from .env file
-load_dotenv()
+@lru_cache(maxsize=None)
+def get_replica_set() -> Optional[ReplicaSet]:
+    """
+    Returns the read replicas configured in SQLALCHEMY_REPLICA_URLS, or None without replicas.
+    """
+    if not SQLALCHEMY_REPLICA_URLS:
+        return None
+    # A replica that went away is noticed on checkout instead of failing the request's first query
+    return ReplicaSet([create_engine(url, pool_pre_ping=True) for url in SQLALCHEMY_REPLICA_URLS])
+
+
+@lru_cache(maxsize=None)
+def get_session_factory() -> sessionmaker:
+    """
+    Returns the session factory bound to the engine, routing reads to the replicas if there are any.
+    """
+    replicas = get_replica_set()
+    if replicas is None:
+        return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+    return sessionmaker(class_=RoutingSession, replicas=replicas, autocommit=False, autoflush=False, bind=get_engine())
 
-# Retrieve the database URL from the environment variable
-SQLALCHEMY_DATABASE_URL = os.getenv('SQLALCHEMY_DATABASE_URL')
 
-# Create an engine object for interacting with the database
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+def __getattr__(name: str):
+    # `engine` and `SessionLocal` are created on first access, not at import
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Create a session factory for interacting with the database
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Function to get a database session
 def get_db():
@@ -28,7 +59,7 @@ def get_db():
     """
     try:
         # Create a new session
-        db = SessionLocal()
+        db = get_session_factory()()
         yield db
     finally:
         # Close the session after use
@@ -0,0 +1,21 @@
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+def insert_ignore(table, dialect_name: str):
+    """
+    Builds an INSERT that skips rows conflicting with a unique constraint.
+
+    Args:
+        table: The table (or mapped class) to insert into.
+        dialect_name (str): Name of the target dialect, e.g. `connection.dialect.name`.
+
+    Returns:
+        Insert: `INSERT ... ON CONFLICT DO NOTHING` on PostgreSQL and SQLite, a plain INSERT elsewhere.
+    """
+    if dialect_name == "postgresql":
+        return pg_insert(table).on_conflict_do_nothing()
+    if dialect_name == "sqlite":
+        return sqlite_insert(table).on_conflict_do_nothing()
+    return insert(table)
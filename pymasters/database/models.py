@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Table, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, Table, DateTime, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.sql.sqltypes import DateTime
@@ -17,17 +17,20 @@ class User(Base):
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)
     role = Column(String(50), default="user")  # Added role field
+    role_version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped on role change to invalidate tokens
+    bootstrap = Column(Boolean, nullable=True, unique=True)  # True only for the first (admin) user, NULL for everyone else
 
 class Photos(Base):
     __tablename__ = "photos"
     id = Column(Integer, primary_key=True)
     photo_urls = Column(String(255), nullable=True)
+    public_id = Column(String(255), nullable=True, unique=True, index=True)  # Storage asset of a direct upload, finalized once
     description = Column(String(255), nullable=True) # Added description field
     created_by_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_by = relationship("User")
     tags = relationship("Tags", secondary="photo_tags", back_populates="photos") # Added relation with tags
-    comments = relationship("Comment", back_populates="photo")
-    transformations = relationship("Transformation", back_populates="photo")  # Added transformations relationship
+    comments = relationship("Comment", back_populates="photo", cascade="all, delete-orphan", passive_deletes=True)
+    transformations = relationship("Transformation", back_populates="photo", cascade="all, delete-orphan", passive_deletes=True)  # Added transformations relationship
 
 class Tags(Base):
     __tablename__ = "tags"
@@ -38,8 +41,8 @@ class Tags(Base):
 photo_tags = Table(
     'photo_tags',
     Base.metadata,
-    Column('photo_id', ForeignKey('photos.id'), primary_key=True),
-    Column('tag_id', ForeignKey('tags.id'), primary_key=True)
+    Column('photo_id', ForeignKey('photos.id', ondelete="CASCADE"), primary_key=True),
+    Column('tag_id', ForeignKey('tags.id', ondelete="CASCADE"), primary_key=True)
 )
 
 class Comment(Base):
@@ -47,7 +50,7 @@ class Comment(Base):
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
-    photo_id = Column(Integer, ForeignKey('photos.id'))
+    photo_id = Column(Integer, ForeignKey('photos.id', ondelete="CASCADE"))
     created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=func.now())
 
@@ -57,9 +60,38 @@ class Comment(Base):
 class Transformation(Base):
     __tablename__ = "transformations"
     id = Column(Integer, primary_key=True)
-    photo_id = Column(Integer, ForeignKey("photos.id"), nullable=False)
+    photo_id = Column(Integer, ForeignKey("photos.id", ondelete="CASCADE"), nullable=False)
     transformation_url = Column(String(255), nullable=False)
     qr_code_url = Column(String(255), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
 
     photo = relationship("Photos", back_populates="transformations")
+
+class StorageDeletion(Base):
+    __tablename__ = "storage_deletions"
+    id = Column(Integer, primary_key=True)
+    public_id = Column(String(255), nullable=False, unique=True)  # Storage asset to delete, queued once
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False, default="confirm_email")  # Which email to render
+    recipient = Column(String(150), nullable=False)
+    host = Column(String(255), nullable=False)  # Base URL used in the links of the email
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    __table_args__ = (UniqueConstraint("kind", "token_id"),)
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(10), nullable=False)  # "jti" for a used refresh token, "family" for a whole login, "role" for an outdated role
+    token_id = Column(String(64), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # After this no token it applies to is valid
+    revoked_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
@@ -0,0 +1,305 @@
+"""
+Read replica routing.
+
+Routes opt in with `@replica_reads`:
+
+    @router.get("/{photo_id}")
+    @replica_reads
+    async def get_photo(...):
+
+For GET and HEAD requests to such a route, `RoutingSession` sends SELECTs
+(including the `get_current_user` lookup) to a replica chosen by `ReplicaSet`,
+round-robin or least busy. The replica is chosen on the first read and kept for
+the session, so a request sees one consistent replica. Everything else goes to
+the primary: flushes, INSERT/UPDATE/DELETE and text statements, reads of the
+same session after it wrote, reads after `read_from_primary`, other routes, and
+sessions opened outside a request (outbox workers, CLI tools).
+
+A replica is bypassed while it is more than REPLICA_MAX_LAG seconds behind the
+primary (checked at most every REPLICA_LAG_CHECK_INTERVAL seconds, PostgreSQL
+only by default) and for REPLICA_RETRY_SECONDS after an error. A read that fails
+on a replica is retried on the primary.
+
+Read-your-writes: `ReplicaRoutingMiddleware` sets a `primary_until` cookie on
+the response of any request that wrote, and requests carrying it read from the
+primary for REPLICA_PIN_SECONDS. The cookie works across worker processes and
+nodes; clients have to send cookies back (browsers and httpx do).
+"""
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+from starlette.requests import HTTPConnection
+
+from pymasters.settings import (
+    REPLICA_SELECTION, REPLICA_MAX_LAG, REPLICA_LAG_CHECK_INTERVAL, REPLICA_RETRY_SECONDS, REPLICA_PIN_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+SELECTIONS = ("round_robin", "least_busy")
+READ_METHODS = ("GET", "HEAD")
+PIN_COOKIE = "primary_until"
+
+# Errors after which a replica is taken out of rotation and the read is retried on the primary
+REPLICA_ERRORS = (OperationalError, InterfaceError)
+
+# Seconds the standby is behind: 0 when it has replayed everything it received, NULL on a primary
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def replica_reads(endpoint: Callable) -> Callable:
+    """
+    Marks a read-only route whose queries may be served by a replica.
+
+    Apply it below the router decorator.
+    """
+    endpoint.replica_reads = True
+    return endpoint
+
+
+def postgres_lag(conn: Connection) -> Optional[float]:
+    """
+    Returns how many seconds a PostgreSQL standby is behind its primary, or None on a primary.
+    """
+    lag = conn.execute(POSTGRES_LAG).scalar()
+    return float(lag) if lag is not None else None
+
+
+class Replica:
+    """
+    A replica engine with its health: when it may be used again after an error, and its last measured lag.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.down_until = 0.0
+        self.lag: Optional[float] = None
+        self.lag_checked: Optional[float] = None
+
+    @property
+    def busy(self) -> int:
+        """
+        Connections currently checked out of the replica's pool.
+        """
+        checkedout = getattr(self.engine.pool, "checkedout", None)
+        return checkedout() if checkedout else 0
+
+
+class ReplicaSet:
+    """
+    The replica engines, and the choice of the one serving a session's reads.
+
+    Args:
+        engines (Sequence[Engine]): The replica engines.
+        selection (str): "round_robin", or "least_busy" for the replica with the fewest checked-out connections.
+        max_lag (float): Replicas further behind the primary than this many seconds are skipped.
+        lag_check_interval (float): Seconds between lag checks of a replica.
+        retry_after (float): Seconds a replica is skipped after an error.
+        lag_probe (Optional[Callable[[Connection], Optional[float]]]): Returns a replica's lag in seconds (None
+            when unknown). Defaults to `postgres_lag` on PostgreSQL; replicas of other databases are not checked.
+
+    Raises:
+        ValueError: If `selection` is not one of SELECTIONS.
+    """
+
+    def __init__(self, engines: Sequence[Engine], selection: str = REPLICA_SELECTION,
+                 max_lag: float = REPLICA_MAX_LAG, lag_check_interval: float = REPLICA_LAG_CHECK_INTERVAL,
+                 retry_after: float = REPLICA_RETRY_SECONDS,
+                 lag_probe: Optional[Callable[[Connection], Optional[float]]] = None):
+        if selection not in SELECTIONS:
+            raise ValueError(f"Unknown replica selection {selection!r}, expected one of {', '.join(SELECTIONS)}")
+        self.replicas: List[Replica] = [Replica(engine) for engine in engines]
+        self.selection = selection
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.retry_after = retry_after
+        self.lag_probe = lag_probe
+        self._turn = itertools.count()
+
+    @property
+    def engines(self) -> List[Engine]:
+        return [replica.engine for replica in self.replicas]
+
+    def choose(self) -> Optional[Engine]:
+        """
+        Returns the replica to read from, or None when every replica is down or lagging.
+        """
+        now = time.monotonic()
+        available = [replica for replica in self.replicas if replica.down_until <= now and self._fresh(replica, now)]
+        if not available:
+            return None
+        # Rotating the candidates also spreads ties between equally busy replicas
+        turn = next(self._turn) % len(available)
+        available = available[turn:] + available[:turn]
+        if self.selection == "least_busy":
+            return min(available, key=lambda replica: replica.busy).engine
+        return available[0].engine
+
+    def _fresh(self, replica: Replica, now: float) -> bool:
+        probe = self.lag_probe or (postgres_lag if replica.engine.dialect.name == "postgresql" else None)
+        if probe is None:
+            return True
+        if replica.lag_checked is None or now - replica.lag_checked >= self.lag_check_interval:
+            replica.lag_checked = now
+            try:
+                with replica.engine.connect() as conn:
+                    replica.lag = probe(conn)
+            except REPLICA_ERRORS as err:
+                self.mark_down(replica.engine, err)
+                return False
+            if replica.lag is not None and replica.lag > self.max_lag:
+                logger.warning(f"Replica {replica.engine.url!r} is {replica.lag:.1f} s behind, reading from the primary")
+        return replica.lag is None or replica.lag <= self.max_lag
+
+    def mark_down(self, engine: Engine, error: Exception):
+        """
+        Takes a replica out of rotation for `retry_after` seconds.
+        """
+        for replica in self.replicas:
+            if replica.engine is engine:
+                replica.down_until = time.monotonic() + self.retry_after
+                logger.warning(f"Replica {engine.url!r} failed, skipping it for {self.retry_after:.0f} s: {error}")
+
+    def dispose(self, close: bool = True):
+        for engine in self.engines:
+            engine.dispose(close=close)
+
+
+@dataclass
+class RequestRouting:
+    """
+    Routing state of one HTTP request.
+    """
+    scope: dict
+    pinned: bool = False
+    wrote: bool = False
+
+    @property
+    def read_only(self) -> bool:
+        return (self.scope["method"] in READ_METHODS and not self.pinned
+                and getattr(self.scope.get("endpoint"), "replica_reads", False))
+
+
+# Set for the duration of each HTTP request by ReplicaRoutingMiddleware; sync handlers and
+# dependencies run with a copy of the context, which still refers to the same RequestRouting.
+request_routing: ContextVar[Optional[RequestRouting]] = ContextVar("request_routing", default=None)
+
+
+class RoutingSession(Session):
+    """
+    Session reading from a replica during requests to `@replica_reads` routes, and from the
+    primary (its `bind`) otherwise.
+
+    Args:
+        replicas (Optional[ReplicaSet]): The replicas; without them the session only uses the primary.
+    """
+
+    def __init__(self, *args, replicas: Optional[ReplicaSet] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+
+    def replica(self) -> Optional[Engine]:
+        """
+        Returns the replica serving this session's reads, choosing it on first use, or None for the primary.
+        """
+        if "replica" not in self.info:
+            routing = request_routing.get()
+            if self.replicas is None or routing is None or not routing.read_only or self.info.get("wrote"):
+                return None
+            self.info["replica"] = self.replicas.choose()
+        return self.info["replica"]
+
+    def read_from_primary(self):
+        """
+        Sends the session's later reads to the primary, e.g. for results that are cached.
+        """
+        self.info["replica"] = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if clause is not None and getattr(clause, "is_select", False) and not self._flushing:
+            replica = self.replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+def _record_write(session: RoutingSession):
+    # Later reads of the session, and of the client's next requests, go to the primary
+    session.info["wrote"] = True
+    session.info["replica"] = None
+    routing = request_routing.get()
+    if routing is not None:
+        routing.wrote = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session, flush_context):
+    _record_write(session)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _route_statement(state):
+    session = state.session
+    if not state.is_select:
+        _record_write(session)
+        return None
+    replica = session.replica()
+    if replica is None:
+        return None
+    try:
+        return state.invoke_statement()
+    except REPLICA_ERRORS as err:
+        session.replicas.mark_down(replica, err)
+        session.rollback()
+        session.info["replica"] = None
+        return state.invoke_statement()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Pure ASGI middleware tracking each request's routing, and pinning clients that wrote to the
+    primary for `pin_seconds` with the `primary_until` cookie.
+    """
+
+    def __init__(self, app, pin_seconds: float = REPLICA_PIN_SECONDS):
+        self.app = app
+        self.pin_seconds = pin_seconds
+
+    @staticmethod
+    def pinned(scope) -> bool:
+        value = HTTPConnection(scope).cookies.get(PIN_COOKIE)
+        try:
+            return value is not None and float(value) > time.time()
+        except ValueError:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        routing = RequestRouting(scope, pinned=self.pinned(scope))
+        token = request_routing.set(routing)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and routing.wrote and self.pin_seconds > 0:
+                until = int(time.time() + self.pin_seconds) + 1
+                cookie = f"{PIN_COOKIE}={until}; Max-Age={int(self.pin_seconds) + 1}; Path=/; HttpOnly; SameSite=Lax"
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_routing.reset(token)
@@ -0,0 +1,149 @@
+"""
+Streaming NDJSON export of a user's photo library.
+
+Each output line is one photo with its tags, transformations and comments.
+Photos are emitted in ascending id order, so an interrupted export can be
+resumed by passing the id of the last line received as `after_id`.
+
+Usage:
+    python -m pymasters.export --email user@example.com [--after-id 120] [--output photos.ndjson]
+"""
+import argparse
+import sys
+from typing import Iterator, Optional
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+
+from pymasters.database.db import get_session_factory
+from pymasters.database.models import Photos, User
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def photo_record(photo: Photos) -> dict:
+    """
+    Converts a photo and its related rows into a plain export record.
+
+    Args:
+        photo (Photos): The photo with tags, transformations and comments loaded.
+
+    Returns:
+        dict: The export record.
+    """
+    return {
+        "id": photo.id,
+        "photo_urls": photo.photo_urls,
+        "description": photo.description,
+        "created_by_id": photo.created_by_id,
+        "tags": [tag.tag for tag in photo.tags],
+        "transformations": [
+            {
+                "id": t.id,
+                "transformation_url": t.transformation_url,
+                "qr_code_url": t.qr_code_url,
+                "created_at": t.created_at,
+            }
+            for t in photo.transformations
+        ],
+        "comments": [
+            {
+                "id": c.id,
+                "user_id": c.user_id,
+                "content": c.content,
+                "created_at": c.created_at,
+                "updated_at": c.updated_at,
+            }
+            for c in photo.comments
+        ],
+    }
+
+
+def iter_photo_records(db: Session, user_id: int, after_id: Optional[int] = None,
+                       batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[dict]:
+    """
+    Yields export records for all photos of a user.
+
+    Rows are fetched through a server-side cursor (`yield_per`) and related
+    collections are loaded per batch with `selectinload`. Only the current batch
+    is referenced, and the session's identity map holds unmodified objects weakly,
+    so memory stays constant regardless of library size.
+
+    Args:
+        db (Session): The database session.
+        user_id (int): The owner of the photos.
+        after_id (Optional[int]): Only export photos with an id greater than this one.
+        batch_size (int): Number of photos fetched per batch.
+
+    Yields:
+        dict: One export record per photo.
+    """
+    stmt = (
+        select(Photos)
+        .where(Photos.created_by_id == user_id)
+        .options(
+            selectinload(Photos.tags),
+            selectinload(Photos.transformations),
+            selectinload(Photos.comments),
+        )
+        .order_by(Photos.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if after_id is not None:
+        stmt = stmt.where(Photos.id > after_id)
+
+    for partition in db.scalars(stmt).partitions():
+        for photo in partition:
+            yield photo_record(photo)
+
+
+def iter_ndjson(db: Session, user_id: int, after_id: Optional[int] = None,
+                batch_size: int = DEFAULT_BATCH_SIZE, close_session: bool = False) -> Iterator[bytes]:
+    """
+    Yields the export as NDJSON lines.
+
+    Args:
+        db (Session): The database session.
+        user_id (int): The owner of the photos.
+        after_id (Optional[int]): Resume after this photo id.
+        batch_size (int): Number of photos fetched per batch.
+        close_session (bool): Close the session once the stream is exhausted or aborted.
+
+    Yields:
+        bytes: One JSON document per line.
+    """
+    try:
+        for record in iter_photo_records(db, user_id, after_id=after_id, batch_size=batch_size):
+            yield orjson.dumps(record) + b"\n"
+    finally:
+        if close_session:
+            db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a user's photos as NDJSON.")
+    parser.add_argument("--email", required=True, help="Email of the user to export")
+    parser.add_argument("--after-id", type=int, default=None, help="Resume after this photo id")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Photos fetched per batch")
+    parser.add_argument("--output", default="-", help="Output file, appended to when resuming (default: stdout)")
+    args = parser.parse_args(argv)
+
+    db = get_session_factory()()
+    try:
+        user = db.query(User).filter(User.email == args.email).first()
+        if user is None:
+            parser.error(f"User {args.email} not found")
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "ab")
+        try:
+            for line in iter_ndjson(db, user.id, after_id=args.after_id, batch_size=args.batch_size):
+                out.write(line)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
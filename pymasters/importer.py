@@ -0,0 +1,313 @@
+"""
+Bulk import of photos, tags, transformations and comments.
+
+Reads NDJSON (the format written by `pymasters.export`) or CSV and loads it in
+batches with Core multi-row inserts, bypassing the ORM unit of work. Tags are
+resolved through an in-memory dictionary, so each distinct tag costs at most one
+insert for the whole run. On PostgreSQL, `--copy` loads the link and child
+tables with `COPY ... FROM STDIN`.
+
+CSV files need the columns `photo_urls`, `description`, `created_by_id` and
+`tags` (tag names separated by `;`).
+
+Usage:
+    python -m pymasters.importer photos.ndjson [--user-email owner@example.com] [--batch-size 1000] [--copy]
+    python -m pymasters.importer photos.csv --database-url sqlite:///./import.db --create-tables
+"""
+import argparse
+import csv
+import io
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import orjson
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.engine import Connection, Engine
+
+from pymasters.database.dialects import insert_ignore
+from pymasters.database.models import Base, Photos, Tags, Comment, Transformation, User, photo_tags
+
+DEFAULT_BATCH_SIZE = 1000
+CSV_TAG_SEPARATOR = ";"
+
+photos_table = Photos.__table__
+tags_table = Tags.__table__
+comments_table = Comment.__table__
+transformations_table = Transformation.__table__
+
+
+class ImportStats:
+    """
+    Row counters and timing for an import run.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.photos = 0
+        self.tags = 0
+        self.photo_tags = 0
+        self.transformations = 0
+        self.comments = 0
+
+    @property
+    def rows(self) -> int:
+        return self.photos + self.tags + self.photo_tags + self.transformations + self.comments
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (f"photos={self.photos} tags={self.tags} photo_tags={self.photo_tags} "
+                f"transformations={self.transformations} comments={self.comments} "
+                f"rows={self.rows} elapsed={self.elapsed:.2f}s rows/sec={self.rows_per_second:.0f}")
+
+
+def read_ndjson(path: str) -> Iterator[dict]:
+    """
+    Yields records from an NDJSON file, skipping blank lines.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
+
+
+def read_csv(path: str) -> Iterator[dict]:
+    """
+    Yields records from a CSV file with `photo_urls,description,created_by_id,tags` columns.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield {
+                "photo_urls": row.get("photo_urls") or None,
+                "description": row.get("description") or None,
+                "created_by_id": int(row["created_by_id"]) if row.get("created_by_id") else None,
+                "tags": [tag.strip() for tag in (row.get("tags") or "").split(CSV_TAG_SEPARATOR) if tag.strip()],
+            }
+
+
+def read_records(path: str, fmt: Optional[str] = None) -> Iterator[dict]:
+    """
+    Yields records from `path`, picking the reader from `fmt` or the file extension.
+    """
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "ndjson")
+    return read_csv(path) if fmt == "csv" else read_ndjson(path)
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """
+    Splits an iterable into lists of at most `size` items.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _timestamp(value) -> datetime:
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class TagResolver:
+    """
+    Maps tag names to ids, inserting unknown tags in bulk.
+
+    All existing tags are loaded once; afterwards every lookup is a dictionary
+    hit and only names never seen before reach the database.
+    """
+
+    def __init__(self, conn: Connection):
+        self.ids: Dict[str, int] = {tag: tag_id for tag_id, tag in conn.execute(select(tags_table.c.id, tags_table.c.tag))}
+
+    def resolve(self, conn: Connection, names: Iterable[str]) -> int:
+        """
+        Makes sure every name has an id.
+
+        Returns:
+            int: The number of tags inserted.
+        """
+        missing = sorted({name for name in names if name not in self.ids})
+        if not missing:
+            return 0
+
+        stmt = insert_ignore(tags_table, conn.dialect.name).returning(tags_table.c.id, tags_table.c.tag)
+        inserted = conn.execute(stmt, [{"tag": name} for name in missing]).all()
+        self.ids.update({tag: tag_id for tag_id, tag in inserted})
+
+        # Tags created concurrently by another writer were skipped by ON CONFLICT
+        still_missing = [name for name in missing if name not in self.ids]
+        if still_missing:
+            rows = conn.execute(select(tags_table.c.id, tags_table.c.tag).where(tags_table.c.tag.in_(still_missing)))
+            self.ids.update({tag: tag_id for tag_id, tag in rows})
+        return len(inserted)
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def copy_rows(conn: Connection, table, columns: List[str], rows: List[dict]) -> None:
+    """
+    Loads rows into `table` with PostgreSQL `COPY ... FROM STDIN` inside the connection's transaction.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row[column]) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+def import_batch(conn: Connection, records: List[dict], tags: TagResolver, stats: ImportStats,
+                 owner_id: Optional[int] = None, use_copy: bool = False) -> None:
+    """
+    Inserts one batch of records and their related rows.
+
+    Args:
+        conn (Connection): A connection with an open transaction.
+        records (List[dict]): Photo records in export format.
+        tags (TagResolver): The shared tag dictionary.
+        stats (ImportStats): Counters to update.
+        owner_id (Optional[int]): Owner for every photo, overriding `created_by_id` in the records.
+        use_copy (bool): Load link and child tables with COPY (PostgreSQL only).
+    """
+    photo_rows = [
+        {
+            "photo_urls": record.get("photo_urls"),
+            "description": record.get("description"),
+            "created_by_id": owner_id if owner_id is not None else record["created_by_id"],
+        }
+        for record in records
+    ]
+    photo_ids = conn.execute(
+        insert(photos_table).returning(photos_table.c.id, sort_by_parameter_order=True), photo_rows
+    ).scalars().all()
+    stats.photos += len(photo_ids)
+
+    stats.tags += tags.resolve(conn, (name for record in records for name in record.get("tags") or ()))
+
+    link_rows, transformation_rows, comment_rows = [], [], []
+    for photo_id, record in zip(photo_ids, records):
+        for name in dict.fromkeys(record.get("tags") or ()):
+            link_rows.append({"photo_id": photo_id, "tag_id": tags.ids[name]})
+        for t in record.get("transformations") or ():
+            transformation_rows.append({
+                "photo_id": photo_id,
+                "transformation_url": t["transformation_url"],
+                "qr_code_url": t["qr_code_url"],
+                "created_at": _timestamp(t.get("created_at")),
+            })
+        for c in record.get("comments") or ():
+            comment_rows.append({
+                "photo_id": photo_id,
+                "user_id": c.get("user_id"),
+                "content": c.get("content"),
+                "created_at": _timestamp(c.get("created_at")),
+                "updated_at": _timestamp(c.get("updated_at") or c.get("created_at")),
+            })
+
+    for table, rows in ((photo_tags, link_rows), (transformations_table, transformation_rows),
+                        (comments_table, comment_rows)):
+        if not rows:
+            continue
+        if use_copy:
+            copy_rows(conn, table, list(rows[0]), rows)
+        else:
+            conn.execute(insert(table), rows)
+
+    stats.photo_tags += len(link_rows)
+    stats.transformations += len(transformation_rows)
+    stats.comments += len(comment_rows)
+
+
+def import_records(engine: Engine, records: Iterable[dict], batch_size: int = DEFAULT_BATCH_SIZE,
+                   owner_id: Optional[int] = None, use_copy: bool = False,
+                   progress: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    """
+    Imports records in batches, committing after each batch.
+
+    Args:
+        engine (Engine): The target database engine.
+        records (Iterable[dict]): Photo records in export format.
+        batch_size (int): Photos per batch and transaction.
+        owner_id (Optional[int]): Owner for every photo, overriding `created_by_id` in the records.
+        use_copy (bool): Load link and child tables with COPY (PostgreSQL only).
+        progress (Optional[Callable]): Called with the running stats after each batch.
+
+    Returns:
+        ImportStats: Counters and timing for the run.
+
+    Raises:
+        ValueError: If `use_copy` is requested for a database other than PostgreSQL.
+    """
+    if use_copy and engine.dialect.name != "postgresql":
+        raise ValueError("COPY is only supported on PostgreSQL")
+
+    stats = ImportStats()
+    with engine.connect() as conn:
+        tags = TagResolver(conn)
+        conn.commit()
+        for batch in batched(records, batch_size):
+            with conn.begin():
+                import_batch(conn, batch, tags, stats, owner_id=owner_id, use_copy=use_copy)
+            if progress:
+                progress(stats)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import photos, tags and comments.")
+    parser.add_argument("path", help="NDJSON or CSV file to import")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default=None, help="Input format (default: by extension)")
+    parser.add_argument("--database-url", default=None, help="Target database (default: SQLALCHEMY_DATABASE_URL)")
+    parser.add_argument("--create-tables", action="store_true", help="Create missing tables first (for local SQLite runs)")
+    parser.add_argument("--user-email", default=None, help="Assign every photo to this user")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Photos per batch")
+    parser.add_argument("--copy", action="store_true", help="Use COPY for link and child tables (PostgreSQL)")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        from pymasters.database.db import engine
+
+    if args.create_tables:
+        Base.metadata.create_all(bind=engine)
+
+    owner_id = None
+    if args.user_email:
+        with engine.connect() as conn:
+            owner_id = conn.execute(select(User.__table__.c.id).where(User.__table__.c.email == args.user_email)).scalar()
+        if owner_id is None:
+            parser.error(f"User {args.user_email} not found")
+
+    def report(stats: ImportStats):
+        print(stats, file=sys.stderr)
+
+    stats = import_records(engine, read_records(args.path, args.format), batch_size=args.batch_size,
+                           owner_id=owner_id, use_copy=args.copy, progress=report)
+    print(f"Import finished: {stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,75 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI, Request, status, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
 
 from pymasters.routes.users import router as users_router
 from pymasters.routes.photos import router as photos_router 
 from pymasters.routes.comments import router as comments_router
+from pymasters.routes.profiler import router as profiler_router
+from pymasters.routes.media import router as media_router
+from pymasters.database.routing import ReplicaRoutingMiddleware
+from pymasters.metrics import MetricsMiddleware, registry, CONTENT_TYPE
+from pymasters.profiling import ProfilingMiddleware, profiler
+from pymasters.query_budget import QueryBudgetMiddleware
+from pymasters.responses import default_response_class
+from pymasters.services.email_outbox import run_worker
+from pymasters.services.invalidation import invalidator, get_bus
+from pymasters.services.mail_dispatcher import enable_dispatcher, stop_dispatcher
+from pymasters.services.storage_outbox import run_dispatcher
+from pymasters.settings import (
+    STORAGE_OUTBOX_INTERVAL, EMAIL_OUTBOX_INTERVAL, METRICS_ENABLED, SHUTDOWN_DRAIN_TIMEOUT, SQLALCHEMY_REPLICA_URLS,
+    STORAGE_BACKEND,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts the cache invalidation listener, the storage deletion outbox dispatcher and the
+    email outbox worker, and enables the mail dispatcher (started, with the email templates
+    compiled, when the first email is sent). Stops them on shutdown after they finish their
+    current batch.
+    """
+    stopping = asyncio.Event()
+    workers = [asyncio.create_task(invalidator.run(get_bus(), stop=stopping))]
+    if STORAGE_OUTBOX_INTERVAL > 0:
+        workers.append(asyncio.create_task(run_dispatcher(STORAGE_OUTBOX_INTERVAL, stop=stopping)))
+    enable_dispatcher()
+    if EMAIL_OUTBOX_INTERVAL > 0:
+        workers.append(asyncio.create_task(run_worker(EMAIL_OUTBOX_INTERVAL, stop=stopping)))
+    yield
+    await asyncio.to_thread(profiler.stop)
+    # Let the workers finish the batch in hand, then cancel those still running after the drain timeout
+    stopping.set()
+    if workers:
+        _, pending = await asyncio.wait(workers, timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        for worker in pending:
+            worker.cancel()
+            with suppress(asyncio.CancelledError):
+                await worker
+    await stop_dispatcher()
 
-app = FastAPI()
+
+app = FastAPI(default_response_class=default_response_class(), lifespan=lifespan)
+
+app.add_middleware(QueryBudgetMiddleware)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
+if SQLALCHEMY_REPLICA_URLS:
+    app.add_middleware(ReplicaRoutingMiddleware)
 
 # Include routers for different routes
 app.include_router(users_router, prefix='/api')
 app.include_router(photos_router, prefix='/api')  # Adds the router for photo-related routes
 app.include_router(comments_router, prefix='/api')  # Adds the router for comment-related routes
+app.include_router(profiler_router, prefix='/api')
+if STORAGE_BACKEND == "local":
+    app.include_router(media_router)  # Receives direct uploads to local storage
 
 @app.get("/")
 def read_root():
@@ -24,4 +81,14 @@ def read_root():
     """
     return {"message": "Hello World"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Request, database and storage metrics of this process in the Prometheus text format.
 
+    Returns:
+    - A plain text response for the Prometheus scraper.
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return Response(registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,282 @@
+"""
+Request, database and storage metrics in the Prometheus text format.
+
+`MetricsMiddleware` is a pure ASGI middleware (no `BaseHTTPMiddleware` task and
+stream per request) that records per-route latency histograms, status code
+counters and in-flight requests. SQLAlchemy engine events count the queries and
+their time into the current request's context, and `time_storage` times calls
+to the image storage. Everything is served at `GET /metrics`.
+
+Metrics are kept per process: with several workers, scrape each of them.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as CollectionsCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+Labels = Tuple[str, ...]
+
+# Savepoints (e.g. the tests' per-test transactions) are not counted as queries
+TRANSACTION_CONTROL = ("SAVEPOINT ", "RELEASE SAVEPOINT ", "ROLLBACK TO SAVEPOINT ")
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    A metric family: one value (or histogram) per combination of label values.
+    """
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, object] = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """
+    Cumulative histogram with fixed upper bounds (`le`), plus `_sum` and `_count`.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # per-bucket (non-cumulative) counts, the +Inf bucket last, then the sum
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def count(self, *labels: str) -> int:
+        state = self._values.get(labels)
+        return sum(state[:-1]) if state else 0
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, observed in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += observed
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    The metric families exposed at /metrics.
+    """
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "pymasters_http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")))
+http_latency = registry.register(Histogram(
+    "pymasters_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "pymasters_http_requests_in_flight", "HTTP requests being served.", ("method",)))
+db_queries = registry.register(Histogram(
+    "pymasters_db_queries_per_request", "Database queries per HTTP request.", ("route",), QUERY_COUNT_BUCKETS))
+db_time = registry.register(Histogram(
+    "pymasters_db_time_per_request_seconds", "Time spent in database queries per HTTP request.", ("route",)))
+db_queries_total = registry.register(Counter(
+    "pymasters_db_queries_total", "Database queries, in and outside requests."))
+storage_latency = registry.register(Histogram(
+    "pymasters_storage_call_duration_seconds", "Image storage calls by operation and outcome.",
+    ("operation", "outcome")))
+storage_outbox_pending = registry.register(Gauge(
+    "pymasters_storage_outbox_pending", "Storage assets waiting for deletion, as of this process's last drain."))
+token_decode_latency = registry.register(Histogram(
+    "pymasters_token_decode_seconds", "JWT verification time, including claims cache hits.",
+    buckets=(0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01)))
+
+
+class RequestStats:
+    """
+    Database work of the current request, filled in by the engine event listeners.
+
+    `statements` counts executions per SQL text when set to a Counter (see `query_budget`).
+    """
+    __slots__ = ("queries", "query_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements: Optional[CollectionsCounter] = None
+
+
+# Set for the duration of each HTTP request; sync handlers and dependencies run in a
+# thread pool with a copy of the context, which still refers to the same RequestStats.
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    if statement.startswith(TRANSACTION_CONTROL):
+        return
+    db_queries_total.inc()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+        if stats.statements is not None:
+            stats.statements[statement] += 1
+
+
+@contextmanager
+def time_storage(operation: str) -> Iterator[None]:
+    """
+    Records the duration and outcome ("ok" or "error") of an image storage call.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        storage_latency.observe(time.perf_counter() - start, operation, outcome)
+
+
+def route_template(scope: dict) -> str:
+    """
+    Returns the matched route's path template, so that path parameters do not create a
+    label value per ID.
+    """
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, status codes and database work per route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        stats = RequestStats()
+        token = request_stats.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_in_flight.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec(method)
+            request_stats.reset(token)
+            route = route_template(scope)
+            http_requests.inc(method, route, str(status_code))
+            http_latency.observe(elapsed, method, route)
+            db_queries.observe(stats.queries, route)
+            db_time.observe(stats.query_time, route)
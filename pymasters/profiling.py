@@ -0,0 +1,211 @@
+"""
+Opt-in sampling profiler for slow endpoints.
+
+An admin enables it for a path pattern and a fraction of the matching requests
+(see `routes/profiler.py`). While a sampled request is in flight a background
+thread takes a snapshot of the event loop thread's stack every `interval`
+seconds. Only stacks that pass through a sampled request are kept, so the
+result shows where those requests spend their time, even with other requests
+running concurrently on the same loop. Stacks are aggregated in memory and
+served in the collapsed format of flamegraph.pl / speedscope / inferno:
+    POST /api/photos/transform;transform_photo_endpoint (routes/photos.py:72);... 42
+
+When the profiler is disabled the middleware costs one attribute check per
+request and no sampling thread runs. Handlers declared with plain `def` run in
+the thread pool and are not sampled; `async def` handlers (including the
+blocking calls they make) are.
+
+The profiler lives in one process: with several workers (`pymasters.serve`)
+each admin request starts, stops or reads the profiler of whichever worker
+serves it, and every worker only samples its own requests.
+"""
+import fnmatch
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from pymasters.metrics import route_template
+
+# Distinct stacks kept; further new stacks are counted as dropped
+MAX_STACKS = 20000
+MAX_DEPTH = 128
+# Seconds `stop` waits for the sampling thread to finish its current sample
+STOP_TIMEOUT = 1.0
+
+_package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _short_path(filename: str) -> str:
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    if filename.startswith(_package_root + os.sep):
+        return filename[len(_package_root) + 1:]
+    return filename
+
+
+class SamplingProfiler:
+    """
+    Aggregates sampled stacks of the requests chosen for profiling.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.pattern = "*"
+        self.sample_rate = 1.0
+        self.interval = 0.005
+        self.started_at: Optional[float] = None
+        self.requests = 0
+        self.samples = 0
+        self.dropped = 0
+        self._stacks: Counter = Counter()
+        self._labels: Dict[object, str] = {}
+        # thread id -> number of sampled requests in flight on it
+        self._active: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, pattern: str = "*", sample_rate: float = 1.0, interval: float = 0.005):
+        """
+        Enables profiling of requests whose path matches `pattern` (fnmatch syntax), each
+        with probability `sample_rate`, sampling every `interval` seconds.
+        """
+        self.stop()
+        self.pattern, self.sample_rate, self.interval = pattern, sample_rate, interval
+        self.started_at = time.time()
+        # Each thread has its own event, so one that outlives `stop`'s timeout still ends
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def stop(self, timeout: float = STOP_TIMEOUT):
+        """
+        Disables profiling, waiting up to `timeout` seconds for the sampling thread to end;
+        collected stacks are kept until `reset`. Blocks, so async callers run it in a thread.
+        """
+        self.enabled = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.requests = self.samples = self.dropped = 0
+
+    def should_sample(self, path: str) -> bool:
+        return fnmatch.fnmatchcase(path, self.pattern) and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def enter(self, thread_id: int):
+        with self._lock:
+            self.requests += 1
+            self._active[thread_id] = self._active.get(thread_id, 0) + 1
+
+    def leave(self, thread_id: int):
+        with self._lock:
+            if self._active[thread_id] == 1:
+                del self._active[thread_id]
+            else:
+                self._active[thread_id] -= 1
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def sample(self):
+        """
+        Records the current stack of every thread running a sampled request.
+        """
+        with self._lock:
+            thread_ids = list(self._active)
+        if not thread_ids:
+            return
+        frames = sys._current_frames()
+        for thread_id in thread_ids:
+            stack = self._request_stack(frames.get(thread_id))
+            if stack is None:
+                continue
+            with self._lock:
+                self.samples += 1
+                if stack in self._stacks or len(self._stacks) < MAX_STACKS:
+                    self._stacks[stack] += 1
+                else:
+                    self.dropped += 1
+
+    def _request_stack(self, frame) -> Optional[Tuple[str, ...]]:
+        # Walks outwards to the ProfilingMiddleware frame of a sampled request; stacks
+        # of unsampled requests or of the idle loop never reach one and are ignored.
+        codes = []
+        while frame is not None:
+            if frame.f_code is _SAMPLED_CODE:
+                scope = frame.f_locals.get("scope") or {}
+                root = f"{scope.get('method', '')} {route_template(scope)}"
+                return (root,) + tuple(self._label(code) for code in reversed(codes[-MAX_DEPTH:]))
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        return None
+
+    def _run(self, stop: threading.Event):
+        while not stop.wait(self.interval):
+            self.sample()
+
+    def collapsed(self) -> str:
+        """
+        Returns the aggregated stacks in the collapsed format, one `frame;frame;... count`
+        line per distinct stack, heaviest first.
+        """
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks)
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pattern": self.pattern,
+            "sample_rate": self.sample_rate,
+            "interval_ms": self.interval * 1000,
+            "started_at": self.started_at,
+            "requests": self.requests,
+            "samples": self.samples,
+            "stacks": len(self._stacks),
+            "dropped": self.dropped,
+        }
+
+
+profiler = SamplingProfiler()
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware marking the requests chosen for sampling.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler = profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.enabled or scope["type"] != "http" or not self.profiler.should_sample(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        await self._sampled(scope, receive, send)
+
+    async def _sampled(self, scope, receive, send):
+        thread_id = threading.get_ident()
+        self.profiler.enter(thread_id)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.leave(thread_id)
+
+
+_SAMPLED_CODE = ProfilingMiddleware._sampled.__code__
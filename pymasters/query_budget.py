@@ -0,0 +1,161 @@
+"""
+Per-route query budgets and N+1 detection.
+
+A route declares how many SQL statements one request may run:
+
+    @router.get("/{photo_id}")
+    @query_budget(4)
+    async def get_photo(...):
+
+`QueryBudgetMiddleware` records every statement of a request through the
+SQLAlchemy engine events of `pymasters.metrics` and produces a `QueryReport`:
+the statement count and time, the route's budget, and the statements executed
+repeatedly with the same SQL text (the signature of an N+1 pattern: one query
+per row of a previous result).
+
+Tests collect the reports of TestClient requests with `record_queries()` and
+fail when a route exceeds its budget or repeats a statement. In staging,
+QUERY_BUDGET_MODE=warn logs the same findings for live traffic. Otherwise the
+middleware only passes requests through.
+"""
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional
+
+from pymasters.metrics import RequestStats, request_stats, route_template
+from pymasters.settings import QUERY_BUDGET_MODE, QUERY_REPEAT_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+
+def query_budget(max_queries: int) -> Callable:
+    """
+    Declares the maximum number of SQL statements a request to the decorated route may run.
+
+    Apply it below the router decorator.
+    """
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+
+@dataclass
+class QueryReport:
+    """
+    The SQL statements run by one request.
+    """
+    method: str
+    route: str
+    budget: Optional[int]
+    queries: int
+    query_time: float
+    statements: Counter = field(default_factory=Counter)
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.queries > self.budget
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> Dict[str, int]:
+        """
+        Returns the statements executed at least `threshold` times, with their counts.
+        """
+        return {statement: count for statement, count in self.statements.items() if count >= threshold}
+
+    def problems(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[str]:
+        """
+        Returns a description of each budget overrun and repeated statement.
+        """
+        problems = []
+        if self.over_budget:
+            problems.append(f"{self.method} {self.route} ran {self.queries} queries, budget {self.budget}")
+        for statement, count in self.repeated(threshold).items():
+            problems.append(f"{self.method} {self.route} ran the same statement {count} times "
+                            f"(possible N+1): {' '.join(statement.split())[:200]}")
+        return problems
+
+
+class QueryRecorder(list):
+    """
+    The QueryReports of the requests made while recording.
+    """
+
+    def for_route(self, route: str, method: Optional[str] = None) -> List[QueryReport]:
+        return [report for report in self if report.route == route and (method is None or report.method == method)]
+
+    def assert_within_budget(self, threshold: int = QUERY_REPEAT_THRESHOLD):
+        """
+        Fails when a request exceeded its route's budget or repeated a statement `threshold` times.
+
+        Raises:
+            AssertionError: Listing every problem found.
+        """
+        problems = [problem for report in self for problem in report.problems(threshold)]
+        assert not problems, "\n".join(problems)
+
+
+_recorders: List[QueryRecorder] = []
+_recorders_lock = threading.Lock()
+
+
+@contextmanager
+def record_queries() -> Iterator[QueryRecorder]:
+    """
+    Collects the QueryReports of all requests served while the block runs.
+    """
+    recorder = QueryRecorder()
+    with _recorders_lock:
+        _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        with _recorders_lock:
+            _recorders.remove(recorder)
+
+
+class QueryBudgetMiddleware:
+    """
+    Pure ASGI middleware recording the statements of each request while tests record
+    queries or QUERY_BUDGET_MODE is "warn".
+    """
+
+    def __init__(self, app, mode: str = QUERY_BUDGET_MODE, threshold: int = QUERY_REPEAT_THRESHOLD):
+        self.app = app
+        self.warn = mode == "warn"
+        self.threshold = threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.warn or _recorders):
+            await self.app(scope, receive, send)
+            return
+
+        stats = request_stats.get()
+        token = None
+        if stats is None:
+            stats = RequestStats()
+            token = request_stats.set(stats)
+        queries_before, time_before = stats.queries, stats.query_time
+        stats.statements = Counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if token is not None:
+                request_stats.reset(token)
+            report = QueryReport(
+                method=scope["method"],
+                route=route_template(scope),
+                budget=getattr(scope.get("endpoint"), "query_budget", None),
+                queries=stats.queries - queries_before,
+                query_time=stats.query_time - time_before,
+                statements=stats.statements,
+            )
+            stats.statements = None
+            with _recorders_lock:
+                for recorder in _recorders:
+                    recorder.append(report)
+            if self.warn:
+                for problem in report.problems(self.threshold):
+                    logger.warning(problem)
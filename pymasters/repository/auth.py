@@ -1,3 +1,5 @@
+import uuid
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
@@ -5,13 +7,18 @@ from fastapi import Depends, HTTPException
 from passlib.context import CryptContext
 
 from sqlalchemy.orm import Session
-from jose import JWTError, jwt
+from jose import JWTError
 from starlette import status
 
 from pymasters.database.models import User
 from pymasters.database.db import get_db
 
-from pymasters.settings import SECRET_KEY, ALGORITHM, oauth2_scheme
+from pymasters.services.revocations import revocations, ROLE
+from pymasters.services.token_codec import get_token_codec
+from pymasters.settings import oauth2_scheme
+
+ACCESS_TOKEN_LIFETIME = timedelta(minutes=15)
+REFRESH_TOKEN_LIFETIME = timedelta(days=7)
 
 
 class Hash:
@@ -47,6 +54,37 @@ class Hash:
         return self.pwd_context.hash(password)
 
 
+@dataclass(frozen=True)
+class Principal:
+    """
+    The authenticated caller, built from access token claims without loading the user row.
+    """
+    id: int
+    email: str
+    role: str
+    role_version: int = 0
+
+
+def user_claims(user: User) -> dict:
+    """
+    Returns the identity claims embedded in access and refresh tokens.
+
+    Args:
+        user (User): The user the tokens are issued to.
+
+    Returns:
+        dict: `sub` (email), `uid` (user ID), `role` and `rv` (role version).
+    """
+    return {"sub": user.email, "uid": user.id, "role": user.role or "user", "rv": user.role_version or 0}
+
+
+def role_token_id(user_id: int, role_version: int) -> str:
+    """
+    Returns the revocation ID of tokens carrying an outdated role version.
+    """
+    return f"{user_id}:{role_version}"
+
+
 def create_access_token(data: dict, expires_delta: Optional[float] = None) -> str:
     """
     Creates a JWT access token.
@@ -62,19 +100,23 @@ def create_access_token(data: dict, expires_delta: Optional[float] = None) -> st
     if expires_delta:
         expire = datetime.now(timezone.utc) + timedelta(seconds=expires_delta)
     else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
+        expire = datetime.now(timezone.utc) + ACCESS_TOKEN_LIFETIME
     to_encode.update({"iat": datetime.now(timezone.utc), "exp": expire, "scope": "access_token"})
-    encoded_access_token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_access_token = get_token_codec().encode(to_encode)
     return encoded_access_token
 
 
-def create_refresh_token(data: dict, expires_delta: Optional[float] = None) -> str:
+def create_refresh_token(data: dict, expires_delta: Optional[float] = None, family: Optional[str] = None) -> str:
     """
     Creates a JWT refresh token.
 
+    Each token gets a unique `jti`; `fam` identifies the token family (one login and all
+    tokens rotated from it).
+
     Args:
         data (dict): The data to include in the token.
         expires_delta (Optional[float]): The token's lifespan in seconds. Defaults to 7 days if not provided.
+        family (Optional[str]): The family of a rotated token. A new family is started if not provided.
 
     Returns:
         str: The encoded JWT refresh token.
@@ -83,35 +125,51 @@ def create_refresh_token(data: dict, expires_delta: Optional[float] = None) -> s
     if expires_delta:
         expire = datetime.now(timezone.utc) + timedelta(seconds=expires_delta)
     else:
-        expire = datetime.now(timezone.utc) + timedelta(days=7)
-    to_encode.update({"iat": datetime.now(timezone.utc), "exp": expire, "scope": "refresh_token"})
-    encoded_refresh_token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        expire = datetime.now(timezone.utc) + REFRESH_TOKEN_LIFETIME
+    to_encode.update({"iat": datetime.now(timezone.utc), "exp": expire, "scope": "refresh_token",
+                      "jti": uuid.uuid4().hex, "fam": family or uuid.uuid4().hex})
+    encoded_refresh_token = get_token_codec().encode(to_encode)
     return encoded_refresh_token
 
 
-def get_email_form_refresh_token(refresh_token: str) -> str:
+def decode_refresh_token(refresh_token: str) -> dict:
     """
-    Extracts the email from a JWT refresh token.
+    Verifies a JWT refresh token and returns its claims.
 
     Args:
         refresh_token (str): The JWT refresh token.
 
     Returns:
-        str: The email embedded in the token.
+        dict: The token claims.
 
     Raises:
         HTTPException: If the token is invalid or has an incorrect scope.
     """
     try:
-        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = get_token_codec().decode(refresh_token)
         if payload['scope'] == 'refresh_token':
-            email = payload['sub']
-            return email
+            return payload
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
 
+def get_email_form_refresh_token(refresh_token: str) -> str:
+    """
+    Extracts the email from a JWT refresh token.
+
+    Args:
+        refresh_token (str): The JWT refresh token.
+
+    Returns:
+        str: The email embedded in the token.
+
+    Raises:
+        HTTPException: If the token is invalid or has an incorrect scope.
+    """
+    return decode_refresh_token(refresh_token)['sub']
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
     """
     Retrieves the current user based on the provided JWT access token.
@@ -133,7 +191,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     )
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = get_token_codec().decode(token)
         if payload['scope'] == 'access_token':
             email = payload["sub"]
             exp = payload['exp']
@@ -189,3 +247,77 @@ async def get_moderator_user(current_user: User = Depends(get_current_user)) ->
     if current_user.role not in ["admin", "moderator"]:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation not permitted")
     return current_user
+
+
+async def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """
+    Authenticates the request from the access token claims alone.
+
+    Tokens whose role version was superseded by a role change are rejected, so the
+    client refreshes and gets a token with the new role. The database is only queried
+    to sync the revocation cache, at most every TOKEN_REVOCATION_SYNC_INTERVAL seconds.
+
+    Args:
+        token (str): The JWT access token.
+        db (Session): The database session.
+
+    Returns:
+        Principal: The caller's ID, email and role.
+
+    Raises:
+        HTTPException: If the token is invalid, expired, lacks identity claims or carries an outdated role.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    try:
+        payload = get_token_codec().decode(token)
+    except JWTError:
+        raise credentials_exception
+    if payload.get('scope') != 'access_token' or payload.get("uid") is None or payload.get("role") is None:
+        raise credentials_exception
+
+    role_version = payload.get("rv", 0)
+    revocations.maybe_sync(db)
+    if revocations.is_revoked(ROLE, role_token_id(payload["uid"], role_version)):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Role changed, refresh the token",
+            headers={"WWW-Authenticate": "Bearer"})
+    return Principal(id=payload["uid"], email=payload["sub"], role=payload["role"], role_version=role_version)
+
+
+def ensure_role(principal: Principal, *roles: str) -> Principal:
+    """
+    Ensures that the caller has one of the roles.
+
+    Args:
+        principal (Principal): The caller.
+        roles (str): The accepted roles.
+
+    Returns:
+        Principal: The caller.
+
+    Raises:
+        HTTPException: If the caller has none of the roles.
+    """
+    if principal.role not in roles:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation not permitted")
+    return principal
+
+
+async def require_admin(principal: Principal = Depends(get_current_principal)) -> Principal:
+    """
+    Ensures that the caller is an admin, from the token claims.
+    """
+    return ensure_role(principal, "admin")
+
+
+async def require_moderator(principal: Principal = Depends(get_current_principal)) -> Principal:
+    """
+    Ensures that the caller is a moderator or admin, from the token claims.
+    """
+    return ensure_role(principal, "admin", "moderator")
@@ -0,0 +1,122 @@
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+
+from pymasters.database.dialects import insert_ignore
+from pymasters.database.models import Photos, Tags, Comment, Transformation, photo_tags
+from pymasters.services.invalidation import invalidate
+from pymasters.services.storage_outbox import enqueue_storage_deletions
+
+# Keeps IN lists well below the bind parameter limits of SQLite and PostgreSQL
+ID_CHUNK_SIZE = 500
+
+
+class PhotoService:
+    """
+    A service class to handle set-based photo operations.
+    """
+
+    @staticmethod
+    def get_or_create_tags(db: Session, names: List[str]) -> List[Tags]:
+        """
+        Returns the tags with the given names, creating the missing ones.
+
+        Uses at most three statements whatever the number of tags: one SELECT, one
+        multi-row INSERT that skips tags created concurrently, and a SELECT of the result.
+
+        Args:
+            db (Session): The database session.
+            names (List[str]): Tag names; duplicates are ignored.
+
+        Returns:
+            List[Tags]: The tags, in the order of `names`.
+        """
+        names = list(dict.fromkeys(names))
+        if not names:
+            return []
+        tags = {tag.tag: tag for tag in db.scalars(select(Tags).where(Tags.tag.in_(names)))}
+        missing = [name for name in names if name not in tags]
+        if missing:
+            db.execute(insert_ignore(Tags.__table__, db.get_bind().dialect.name).values([{"tag": name} for name in missing]))
+            tags.update({tag.tag: tag for tag in db.scalars(select(Tags).where(Tags.tag.in_(missing)))})
+        return [tags[name] for name in names]
+
+    @staticmethod
+    def select_photos(photo_ids: Optional[List[int]] = None, user_id: Optional[int] = None,
+                      tag: Optional[str] = None, owner_id: Optional[int] = None):
+        """
+        Builds a query for the ids and URLs of photos matching all given filters.
+
+        Args:
+            photo_ids (Optional[List[int]]): Only these photo IDs.
+            user_id (Optional[int]): Only photos created by this user.
+            tag (Optional[str]): Only photos with this tag.
+            owner_id (Optional[int]): Restricts the result to photos owned by this user (authorization filter).
+
+        Returns:
+            Select: A query returning `(id, photo_urls)` rows.
+        """
+        stmt = select(Photos.id, Photos.photo_urls)
+        if photo_ids is not None:
+            stmt = stmt.where(Photos.id.in_(photo_ids))
+        if user_id is not None:
+            stmt = stmt.where(Photos.created_by_id == user_id)
+        if tag is not None:
+            tagged = select(photo_tags.c.photo_id).join(Tags, Tags.id == photo_tags.c.tag_id).where(Tags.tag == tag)
+            stmt = stmt.where(Photos.id.in_(tagged))
+        if owner_id is not None:
+            stmt = stmt.where(Photos.created_by_id == owner_id)
+        return stmt.order_by(Photos.id)
+
+    @staticmethod
+    def delete_photos(db: Session, photo_ids: Optional[List[int]] = None, user_id: Optional[int] = None,
+                      tag: Optional[str] = None, owner_id: Optional[int] = None) -> Tuple[Dict[str, int], List[str]]:
+        """
+        Deletes matching photos and their dependent rows in one transaction.
+
+        Dependent `photo_tags`, `comments` and `transformations` rows are removed
+        with set-based DELETE statements, so the cost does not grow with the number
+        of ORM objects and does not rely on the database cascading foreign keys.
+        The storage assets are written to the deletion outbox in the same transaction
+        and removed from storage later by the outbox dispatcher. The deleted photos
+        are evicted from every worker's cache on commit.
+
+        Args:
+            db (Session): The database session.
+            photo_ids (Optional[List[int]]): Only these photo IDs.
+            user_id (Optional[int]): Only photos created by this user.
+            tag (Optional[str]): Only photos with this tag.
+            owner_id (Optional[int]): Restricts the deletion to photos owned by this user.
+
+        Returns:
+            Tuple[Dict[str, int], List[str]]: Deleted row counts per table, and the storage URLs
+            (originals and QR codes) queued for deletion.
+        """
+        rows = db.execute(PhotoService.select_photos(photo_ids, user_id, tag, owner_id)).all()
+        ids = [row.id for row in rows]
+        asset_urls = [row.photo_urls for row in rows if row.photo_urls]
+        counts = {"photos": 0, "photo_tags": 0, "comments": 0, "transformations": 0}
+
+        try:
+            for start in range(0, len(ids), ID_CHUNK_SIZE):
+                chunk = ids[start:start + ID_CHUNK_SIZE]
+                asset_urls.extend(db.scalars(select(Transformation.qr_code_url).where(Transformation.photo_id.in_(chunk))))
+                counts["photo_tags"] += db.execute(delete(photo_tags).where(photo_tags.c.photo_id.in_(chunk))).rowcount
+                counts["comments"] += db.execute(
+                    delete(Comment).where(Comment.photo_id.in_(chunk)),
+                    execution_options={"synchronize_session": False}).rowcount
+                counts["transformations"] += db.execute(
+                    delete(Transformation).where(Transformation.photo_id.in_(chunk)),
+                    execution_options={"synchronize_session": False}).rowcount
+                counts["photos"] += db.execute(
+                    delete(Photos).where(Photos.id.in_(chunk)),
+                    execution_options={"synchronize_session": False}).rowcount
+            enqueue_storage_deletions(db, asset_urls)
+            invalidate(db, *(f"photo:{photo_id}" for photo_id in ids))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        return counts, asset_urls
@@ -1,12 +1,18 @@
-from typing import Optional
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+from sqlalchemy import insert, select, update, literal, case, true, null, Boolean
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from fastapi import UploadFile, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 
 from pymasters.database.models import User
-from pymasters.repository.auth import create_access_token, create_refresh_token, Hash, get_email_form_refresh_token
+from pymasters.repository.auth import (create_access_token, create_refresh_token, decode_refresh_token, Hash,
+                                      REFRESH_TOKEN_LIFETIME, user_claims, role_token_id)
 from pymasters.schemas import UserModel
+from pymasters.services.revocations import consume_refresh_token, revoke, revocations, ROLE
+from pymasters.services.invalidation import invalidate
 
 hash_handler = Hash()
 
@@ -59,28 +65,80 @@ class UserService:
             raise UsernameTaken
 
     @staticmethod
-    def creat_new_user(body: UserModel, db: Session) -> User:
+    def insert_user_statement(email: str, password_hash: str, bootstrap: bool = True):
         """
-        Creates a new user.
+        Builds the single-statement signup INSERT.
+
+        With `bootstrap`, the row becomes the bootstrap admin when the users table is empty:
+        `NOT EXISTS (SELECT 1 FROM users)` stops at the first row, so the check costs the same
+        for any table size. Concurrent first signups race on the unique `bootstrap` column,
+        so at most one of them becomes admin.
+
+        Args:
+            email (str): The email of the new user.
+            password_hash (str): The hashed password.
+            bootstrap (bool): Whether the user may become the bootstrap admin.
+
+        Returns:
+            Insert: `INSERT INTO users ... SELECT ... RETURNING users.*`.
+        """
+        if bootstrap:
+            no_users = ~select(User.id).exists()
+            role = case((no_users, "admin"), else_="user")
+            is_bootstrap = case((no_users, true()), else_=null())
+        else:
+            role = literal("user")
+            is_bootstrap = null()
+        columns = select(literal(email), literal(password_hash), role, literal(False, Boolean), is_bootstrap)
+        return (
+            insert(User)
+            .from_select([User.email, User.password, User.role, User.confirmed, User.bootstrap], columns)
+            .returning(User)
+        )
+
+    @staticmethod
+    def creat_new_user(body: UserModel, db: Session, commit: bool = True) -> User:
+        """
+        Creates a new user in one INSERT ... RETURNING round trip.
+
+        Email conflicts are detected by the unique constraint on `email` instead of a
+        preceding SELECT. The first user becomes the admin; if another first signup won
+        the bootstrap race, the insert is retried as a regular user.
 
         Args:
             body (UserModel): The user data.
             db (Session): The database session.
+            commit (bool): Commit the new user; pass False to commit it together with later
+                changes (e.g. a queued confirmation email).
 
         Returns:
             User: The created user.
+
+        Raises:
+            UsernameTaken: If the username is already taken.
         """
-        UserService.check_username_availablity(username=body.username, db=db)
-        role = "admin" if db.query(User).count() == 0 else "user"
-        new_user = User(email=body.username, password=hash_handler.get_password_hash(body.password), role=role)
-        new_user = UserService.save_user(new_user, db)
+        password_hash = hash_handler.get_password_hash(body.password)
+        for bootstrap in (True, False):
+            try:
+                new_user = db.scalars(UserService.insert_user_statement(body.username, password_hash, bootstrap)).one()
+                break
+            except IntegrityError:
+                db.rollback()
+        else:
+            raise UsernameTaken
+        if commit:
+            db.commit()
         return new_user
 
     @staticmethod
-    def login_user(body: OAuth2PasswordRequestForm, db: Session):
+    def login_user(body: OAuth2PasswordRequestForm, db: Session) -> Tuple[str, str]:
         """
         Logs in a user and generates access and refresh tokens.
 
+        Both tokens carry the user ID, role and role version, so requests can be authorized
+        from the claims. The refresh token starts a new token family; nothing is written to
+        the users table.
+
         Args:
             body (OAuth2PasswordRequestForm): The login form data.
             db (Session): The database session.
@@ -95,38 +153,79 @@ class UserService:
         if user is None or not hash_handler.verify_password(body.password, user.password):
             raise LoginFailed
 
-        data = {"sub": user.email}
+        data = user_claims(user)
         access_token = create_access_token(data=data)
         refresh_token = create_refresh_token(data=data)
-
-        user.refresh_token = refresh_token
-        UserService.save_user(user, db)
         return access_token, refresh_token
 
     @staticmethod
-    def refresh_token(refresh_token: str, db: Session) -> str:
+    def refresh_token(refresh_token: str, db: Session) -> Tuple[str, str]:
         """
-        Refreshes an access token using a refresh token.
+        Rotates a refresh token: issues a new access token and a new refresh token of the
+        same family, and marks the presented one as used.
+
+        The token is validated locally against the revocation cache; the only database
+        access is recording the used token. Reusing a token revokes its whole family.
+        The user row is only read when the user's role changed since the token was issued
+        (or the token predates role claims), to issue tokens with the current role.
 
         Args:
             refresh_token (str): The refresh token.
             db (Session): The database session.
 
         Returns:
-            str: The new access token.
+            Tuple[str, str]: The new access and refresh tokens.
 
         Raises:
-            InvalidRefreshtoken: If the refresh token is invalid.
+            HTTPException: If the token is invalid or has an incorrect scope.
+            InvalidRefreshtoken: If the token was already used, its family was revoked, or it
+                was issued before token families.
         """
-        email = get_email_form_refresh_token(refresh_token)
-        user = UserService.get_user(email, db)
-        if user.refresh_token != refresh_token:
-            user.refresh_token = None
-            UserService.save_user(user, db)
+        payload = decode_refresh_token(refresh_token)
+        jti, family = payload.get("jti"), payload.get("fam")
+        if not jti or not family:
+            raise InvalidRefreshtoken
+        expires_at = datetime.fromtimestamp(payload["exp"], tz=timezone.utc).replace(tzinfo=None)
+        if not consume_refresh_token(db, jti, family, expires_at, REFRESH_TOKEN_LIFETIME):
             raise InvalidRefreshtoken
 
-        access_token = create_access_token(data={"sub": email})
-        return access_token
+        if payload.get("uid") is None or revocations.is_revoked(ROLE, role_token_id(payload["uid"], payload.get("rv", 0))):
+            user = UserService.get_user(payload["sub"], db)
+            if user is None:
+                raise InvalidRefreshtoken
+            data = user_claims(user)
+        else:
+            data = {key: payload[key] for key in ("sub", "uid", "role", "rv")}
+        return create_access_token(data=data), create_refresh_token(data=data, family=family)
+
+    @staticmethod
+    def change_role(user_id: int, role: str, db: Session) -> Optional[User]:
+        """
+        Changes a user's role and invalidates the tokens carrying the previous one.
+
+        The role version is bumped in the same UPDATE, and the previous version is revoked,
+        so access tokens with the old role are rejected and refreshing issues the new role.
+
+        Args:
+            user_id (int): The ID of the user.
+            role (str): The new role.
+            db (Session): The database session.
+
+        Returns:
+            Optional[User]: The updated user, or None if there is no such user.
+        """
+        role_version = db.execute(
+            update(User).where(User.id == user_id)
+            .values(role=role, role_version=User.role_version + 1)
+            .returning(User.role_version)
+        ).scalar()
+        if role_version is None:
+            db.rollback()
+            return None
+        # Committed by revoke(); the other workers pick up the revocation right away
+        invalidate(db, "revocations:role")
+        revoke(db, ROLE, role_token_id(user_id, role_version - 1), datetime.utcnow() + REFRESH_TOKEN_LIFETIME)
+        return db.get(User, user_id, populate_existing=True)
 
     @staticmethod
     def save_user(user_to_save: User, db: Session) -> User:
@@ -0,0 +1,60 @@
+from functools import lru_cache
+from typing import Any, List, Type, Union
+
+import orjson
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+from pymasters.settings import FAST_JSON_RESPONSES
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    """
+    Returns a cached TypeAdapter for serializing lists of the given model.
+    """
+    return TypeAdapter(List[model])
+
+
+class ModelResponse(JSONResponse):
+    """
+    A JSON response that serializes Pydantic models directly with `model_dump_json`.
+
+    Returning it from a handler bypasses the `response_model` validation and the
+    `jsonable_encoder` pass FastAPI performs for plain return values, so a model
+    that is already of the declared response type is encoded exactly once.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode("utf-8")
+        if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+            return _list_adapter(type(content[0])).dump_json(content)
+        return orjson.dumps(content)
+
+
+def default_response_class() -> Type[JSONResponse]:
+    """
+    Returns the response class the application should use by default.
+
+    Returns:
+        Type[JSONResponse]: ORJSONResponse when FAST_JSON_RESPONSES is enabled, otherwise JSONResponse.
+    """
+    return ORJSONResponse if FAST_JSON_RESPONSES else JSONResponse
+
+
+def respond(content: Union[BaseModel, List[BaseModel]]) -> Any:
+    """
+    Wraps a handler result that already matches the route's response model.
+
+    Args:
+        content (BaseModel | List[BaseModel]): The response model instance(s).
+
+    Returns:
+        ModelResponse if fast responses are enabled, otherwise the content unchanged
+        so FastAPI validates and encodes it as usual.
+    """
+    if FAST_JSON_RESPONSES:
+        return ModelResponse(content)
+    return content
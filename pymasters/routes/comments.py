@@ -5,13 +5,14 @@ from pymasters.schemas import CommentCreate, Comment, CommentUpdate
 from pymasters.database.models import User, Photos
 from pymasters.database.models import Comment as table_Comment
 from pymasters.database.db import get_db
-from pymasters.repository.auth import get_current_user
+from pymasters.repository.auth import Principal, get_current_principal
+from pymasters.responses import respond
 
 router = APIRouter(prefix='/comments', tags=['comments'])
 
 
 @router.post("/photos/{photo_id}/comments/", response_model=Comment)
-def create_comment(photo_id: int, comment: CommentCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_comment(photo_id: int, comment: CommentCreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     """
     Creates a new comment for a specific photo.
 
@@ -19,7 +20,7 @@ def create_comment(photo_id: int, comment: CommentCreate, db: Session = Depends(
         photo_id (int): The ID of the photo to comment on.
         comment (CommentCreate): The comment data.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (Principal): The currently authenticated user.
 
     Returns:
         Comment: The created comment.
@@ -35,11 +36,11 @@ def create_comment(photo_id: int, comment: CommentCreate, db: Session = Depends(
     db.add(db_comment)
     db.commit()
     db.refresh(db_comment)
-    return db_comment
+    return respond(Comment.model_validate(db_comment))
 
 
 @router.put("/comments/{comment_id}/", response_model=Comment)
-def update_comment(comment_id: int, comment: CommentUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_comment(comment_id: int, comment: CommentUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     """
     Updates an existing comment.
 
@@ -47,7 +48,7 @@ def update_comment(comment_id: int, comment: CommentUpdate, db: Session = Depend
         comment_id (int): The ID of the comment to update.
         comment (CommentUpdate): The updated comment data.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (Principal): The currently authenticated user.
 
     Returns:
         Comment: The updated comment.
@@ -66,18 +67,18 @@ def update_comment(comment_id: int, comment: CommentUpdate, db: Session = Depend
     db.commit()
     db.refresh(db_comment)
     
-    return db_comment
+    return respond(Comment.model_validate(db_comment))
 
 
 @router.delete("/comments/{comment_id}/", status_code=status.HTTP_204_NO_CONTENT)
-def delete_comment(comment_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_comment(comment_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     """
     Deletes an existing comment.
 
     Args:
         comment_id (int): The ID of the comment to delete.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (Principal): The currently authenticated user.
 
     Raises:
         HTTPException: If the comment is not found or the user is not authorized to delete the comment.
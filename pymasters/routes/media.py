@@ -0,0 +1,39 @@
+from io import BytesIO
+from urllib.parse import urlparse
+
+from fastapi import APIRouter, HTTPException, Request, status
+from jose import JWTError
+
+from pymasters.services import local_storage
+from pymasters.services.direct_upload import read_ticket
+from pymasters.settings import STORAGE_LOCAL_URL
+
+# Mounted with STORAGE_BACKEND=local: the asset URLs are the targets of direct uploads
+router = APIRouter(prefix=urlparse(STORAGE_LOCAL_URL).path.rstrip('/'), tags=['media'])
+
+@router.put('/{public_id}', status_code=status.HTTP_201_CREATED)
+async def put_asset(public_id: str, ticket: str, request: Request):
+    """
+    Store a directly uploaded photo (the local stand-in for Cloudinary's upload API).
+
+    Args:
+        public_id (str): The public ID of the asset.
+        ticket (str): The upload ticket issued for the public ID.
+        request (Request): The request, whose body is the photo.
+
+    Returns:
+        dict: The public ID and URL of the stored photo.
+
+    Raises:
+        HTTPException: If the ticket is invalid, expired or issued for another public ID, or the
+            asset was already uploaded.
+    """
+    try:
+        if read_ticket(ticket) != public_id:
+            raise JWTError("Upload ticket issued for another asset")
+    except JWTError:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired upload ticket")
+    if local_storage.exists(public_id):
+        # A ticket stores one file; it must not replace a finalized photo
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Asset already uploaded")
+    return local_storage.upload(BytesIO(await request.body()), public_id=public_id)
@@ -1,26 +1,40 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from jose import JWTError
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import logging
 
-from pymasters.services.cloudinary_service import upload_photo_to_cloudinary, delete_photo_from_cloudinary, transform_photo
+from pymasters.services.cloudinary_service import upload_photo_to_cloudinary, transform_photo, direct_upload_url
+from pymasters.services.direct_upload import issue_ticket, read_ticket
+from pymasters.services.rate_limit import limit_by_user
+from pymasters.services.cache import photo_cache
+from pymasters.services.invalidation import invalidate
 
 from pymasters.database.db import get_db
+from pymasters.database.routing import RoutingSession, replica_reads
 from pymasters.database.models import User, Photos, Tags, Transformation
-from pymasters.repository.auth import get_current_user, get_admin_user
-from pymasters.schemas import PhotoBase, PhotoCreate, PhotoUpdate, PhotoDisplay, TransformationDisplay
+from pymasters.repository.auth import Principal, get_current_principal, ensure_role
+from pymasters.repository.photos_repo import PhotoService
+from pymasters.schemas import PhotoBase, PhotoCreate, PhotoUpdate, PhotoDisplay, TransformationDisplay, BulkDeleteRequest, BulkDeleteResult
+from pymasters.schemas import UploadTicket, UploadFinalize
+from pymasters.query_budget import query_budget
+from pymasters.responses import respond
+from pymasters.export import iter_ndjson
 
 router = APIRouter(prefix="/photos", tags=["photos"])
 
 logger = logging.getLogger(__name__)
 
-@router.post("/upload", response_model=PhotoDisplay)
+@router.post("/upload", response_model=PhotoDisplay, dependencies=[Depends(limit_by_user("upload"))])
+@query_budget(6)
 async def upload_photo(
     file: UploadFile = File(...),
     description: str = Form(...),
     tags: List[str] = Form(...),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Upload a photo with description and tags.
@@ -30,7 +44,7 @@ async def upload_photo(
         description (str): The description of the photo.
         tags (List[str]): The tags associated with the photo.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (Principal): The currently authenticated user.
 
     Returns:
         PhotoDisplay: The uploaded photo details.
@@ -40,43 +54,87 @@ async def upload_photo(
     # Upload the photo to Cloudinary
     photo_url = upload_photo_to_cloudinary(file.file)
     
-    # Create a new photo record in the database
+    return respond(create_photo(db, photo_url, description, tags, current_user.id))
+
+def create_photo(db: Session, photo_url: str, description: str, tags: List[str], user_id: int,
+                 public_id: Optional[str] = None) -> PhotoDisplay:
+    """
+    Creates the photo record of a stored photo with its tags.
+
+    Raises:
+        IntegrityError: If a photo with `public_id` already exists.
+    """
     new_photo = Photos(
         photo_urls=photo_url,
+        public_id=public_id,
         description=description,
-        created_by_id=current_user.id
+        created_by_id=user_id,
+        tags=PhotoService.get_or_create_tags(db, tags),
+        transformations=[]
     )
     
     db.add(new_photo)
+    db.flush()
+    photo_display = PhotoDisplay.from_photo(new_photo)
     db.commit()
-    db.refresh(new_photo)
-    
-    # Add tags
-    if tags:
-        for tag_name in tags:
-            tag = db.query(Tags).filter(Tags.tag == tag_name).first()
-            if not tag:
-                tag = Tags(tag=tag_name)
-                db.add(tag)
-            new_photo.tags.append(tag)
-        db.commit()
-        db.refresh(new_photo)
-    
-    tag_names = [tag.tag for tag in new_photo.tags]
+    return photo_display
 
-    return PhotoDisplay(
-        id=new_photo.id,
-        photo_urls=new_photo.photo_urls,
-        description=new_photo.description,
-        tags=tag_names
-    )
+@router.post("/upload/ticket", response_model=UploadTicket, dependencies=[Depends(limit_by_user("upload"))])
+async def issue_upload_ticket(current_user: Principal = Depends(get_current_principal)):
+    """
+    Issue a short-lived ticket to upload a photo directly to storage.
+
+    Args:
+        current_user (Principal): The currently authenticated user.
 
-@router.post("/transform", response_model=TransformationDisplay)
+    Returns:
+        UploadTicket: The ticket and the request that uploads the file to storage.
+    """
+    return issue_ticket(current_user.id)
+
+@router.post("/upload/finalize", response_model=PhotoDisplay)
+@query_budget(7)
+async def finalize_upload(
+    body: UploadFinalize,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Create the photo record of a photo uploaded directly to storage.
+
+    Args:
+        body (UploadFinalize): The upload ticket, the description and tags, and Cloudinary's upload response fields.
+        db (Session): The database session.
+        current_user (Principal): The currently authenticated user.
+
+    Returns:
+        PhotoDisplay: The uploaded photo details.
+
+    Raises:
+        HTTPException: If the ticket is invalid, the photo was not stored or it was already finalized.
+    """
+    try:
+        public_id = read_ticket(body.ticket, current_user.id)
+    except JWTError:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired upload ticket")
+
+    photo_url = direct_upload_url(public_id, body.version, body.signature, body.format)
+    if photo_url is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Photo was not uploaded")
+    # The unique public ID rejects a repeated or concurrent finalize of the same upload
+    try:
+        photo = create_photo(db, photo_url, body.description, body.tags, current_user.id, public_id)
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload already finalized")
+    return respond(photo)
+
+@router.post("/transform", response_model=TransformationDisplay, dependencies=[Depends(limit_by_user("transform"))])
 async def transform_photo_endpoint(
     photo_id: int,
     transformation: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Apply transformation to photo and generate QR code.
@@ -85,7 +143,7 @@ async def transform_photo_endpoint(
         photo_id (int): The ID of the photo to transform.
         transformation (str): The transformation to apply.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (Principal): The currently authenticated user.
 
     Returns:
         TransformationDisplay: The transformed photo details.
@@ -114,25 +172,90 @@ async def transform_photo_endpoint(
             qr_code_url=result["qr_code_url"]
         )
         db.add(new_transformation)
+        invalidate(db, f"photo:{photo.id}")
         db.commit()
         db.refresh(new_transformation)
     except Exception as e:
         logger.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Database error: {str(e)}")
 
-    return TransformationDisplay(
-        id=new_transformation.id,
-        photo_id=new_transformation.photo_id,
-        transformation_url=new_transformation.transformation_url,
-        qr_code_url=new_transformation.qr_code_url,
-        created_at=new_transformation.created_at
+    return respond(TransformationDisplay.model_validate(new_transformation))
+
+@router.get("/export")
+@replica_reads
+async def export_photos(
+    after_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Stream a user's photos with tags, transformations and comments as NDJSON.
+
+    Args:
+        after_id (Optional[int]): Resume the export after this photo ID.
+        user_id (Optional[int]): The user to export. Defaults to the current user; other users require admin.
+        db (Session): The database session.
+        current_user (Principal): The currently authenticated user.
+
+    Returns:
+        StreamingResponse: One JSON document per photo, ordered by photo ID.
+
+    Raises:
+        HTTPException: If the user is not authorized to export another user's photos.
+    """
+    if user_id is None:
+        user_id = current_user.id
+    elif user_id != current_user.id:
+        ensure_role(current_user, "admin")
+
+    return StreamingResponse(
+        iter_ndjson(db, user_id, after_id=after_id, close_session=True),
+        media_type="application/x-ndjson"
     )
 
+@router.post("/bulk_delete", response_model=BulkDeleteResult)
+async def bulk_delete_photos(
+    body: BulkDeleteRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Delete many photos by IDs, by owner and/or by tag.
+
+    Filters are combined. Regular users can only delete their own photos; admins can delete any.
+    Dependent tags links, comments and transformations are deleted in the same transaction,
+    which also queues the original and QR code assets in the storage deletion outbox.
+
+    Args:
+        body (BulkDeleteRequest): The photo IDs, user ID and/or tag to delete by.
+        db (Session): The database session.
+        current_user (Principal): The currently authenticated user.
+
+    Returns:
+        BulkDeleteResult: Deleted row counts and the number of storage assets queued for deletion.
+
+    Raises:
+        HTTPException: If no filter is given or the user is not authorized to delete another user's photos.
+    """
+    if body.photo_ids is None and body.user_id is None and body.tag is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Specify photo_ids, user_id or tag")
+
+    if body.user_id is not None and body.user_id != current_user.id:
+        ensure_role(current_user, "admin")
+    owner_id = None if current_user.role == "admin" else current_user.id
+
+    counts, asset_urls = PhotoService.delete_photos(
+        db, photo_ids=body.photo_ids, user_id=body.user_id, tag=body.tag, owner_id=owner_id
+    )
+
+    return BulkDeleteResult(**counts, assets_queued=len(asset_urls))
+
 @router.delete("/{photo_id}")
 async def delete_photo(
     photo_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Delete a photo.
@@ -140,7 +263,7 @@ async def delete_photo(
     Args:
         photo_id (int): The ID of the photo to delete.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (Principal): The currently authenticated user.
 
     Returns:
         dict: A message indicating successful deletion.
@@ -154,13 +277,9 @@ async def delete_photo(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found")
 
     if photo.created_by_id != current_user.id:
-        admin_user = await get_admin_user(current_user)
-        if not admin_user:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation not permitted")
+        ensure_role(current_user, "admin")
 
-    delete_photo_from_cloudinary(photo.photo_urls)
-    db.delete(photo)
-    db.commit()
+    PhotoService.delete_photos(db, photo_ids=[photo.id])
     
     return {"detail": "Photo deleted"}
 
@@ -169,7 +288,7 @@ async def update_photo(
     photo_id: int,
     description: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Update photo description.
@@ -178,7 +297,7 @@ async def update_photo(
         photo_id (int): The ID of the photo to update.
         description (str): The new description for the photo.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (Principal): The currently authenticated user.
 
     Returns:
         dict: A message indicating successful update.
@@ -192,28 +311,32 @@ async def update_photo(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found")
 
     if photo.created_by_id != current_user.id:
-        admin_user = await get_admin_user(current_user)
-        if not admin_user:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation not permitted")
+        ensure_role(current_user, "admin")
     
     photo.description = description
+    invalidate(db, f"photo:{photo.id}")
     db.commit()
     
     return {"detail": "Photo updated"}
 
 @router.get("/{photo_id}", response_model=PhotoDisplay)
+@query_budget(4)
+@replica_reads
 async def get_photo(
     photo_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get a photo by unique ID.
 
+    The payload is served from the photo cache; writes to the photo evict it in every worker.
+    On a miss it is loaded from the primary, even with replicas, and cached.
+
     Args:
         photo_id (int): The ID of the photo to retrieve.
         db (Session): The database session.
-        current_user (User): The currently authenticated user.
+        current_user (Principal): The currently authenticated user.
 
     Returns:
         PhotoDisplay: The retrieved photo details.
@@ -221,21 +344,23 @@ async def get_photo(
     Raises:
         HTTPException: If the photo is not found or the user is not authorized to view the photo.
     """
-    photo = db.query(Photos).filter(Photos.id == photo_id).first()
-
-    if not photo:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found")
-
-    if photo.created_by_id != current_user.id:
-        admin_user = await get_admin_user(current_user)
-        if not admin_user:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation not permitted")
-
-    tag_names = [tag.tag for tag in photo.tags]
-
-    return PhotoDisplay(
-        id=photo.id,
-        photo_urls=photo.photo_urls,
-        description=photo.description,
-        tags=tag_names
-    )
+    cached = photo_cache.get(str(photo_id))
+    if cached is None:
+        token = photo_cache.begin()
+        # A lagging replica may return the row as it was before an invalidation that already
+        # arrived, which the token cannot detect, so the cached payload is read from the primary
+        if isinstance(db, RoutingSession):
+            db.read_from_primary()
+        photo = db.query(Photos).filter(Photos.id == photo_id).first()
+
+        if not photo:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found")
+
+        cached = (photo.created_by_id, PhotoDisplay.from_photo(photo))
+        photo_cache.set(str(photo_id), cached, token)
+
+    owner_id, photo_display = cached
+    if owner_id != current_user.id:
+        ensure_role(current_user, "admin")
+
+    return respond(photo_display)
@@ -0,0 +1,76 @@
+import asyncio
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from pymasters.profiling import profiler
+from pymasters.repository.auth import Principal, require_admin
+from pymasters.schemas import ProfilerSettings
+
+router = APIRouter(prefix='/profiler', tags=['profiler'])
+
+@router.get('')
+async def profiler_status(current_user: Principal = Depends(require_admin)):
+    """
+    Sampling profiler status of the worker process serving the request.
+
+    Args:
+        current_user (Principal): The currently authenticated admin user.
+
+    Returns:
+        dict: Whether the profiler is enabled, its settings and the number of profiled requests and samples.
+    """
+    return profiler.status()
+
+@router.post('')
+async def start_profiler(body: ProfilerSettings, current_user: Principal = Depends(require_admin)):
+    """
+    Enable sampled profiling of the requests matching a path pattern.
+
+    Profiling is per worker process: only the worker serving this request samples, and
+    with several workers the other endpoints reach whichever worker serves them.
+
+    Args:
+        body (ProfilerSettings): Path pattern, fraction of matching requests to profile, sampling
+            interval, and whether to discard the stacks collected so far.
+        current_user (Principal): The currently authenticated admin user.
+
+    Returns:
+        dict: The profiler status.
+    """
+    if body.reset:
+        profiler.reset()
+    await asyncio.to_thread(profiler.start, body.route, body.sample_rate, body.interval_ms / 1000)
+    return profiler.status()
+
+@router.delete('')
+async def stop_profiler(current_user: Principal = Depends(require_admin)):
+    """
+    Disable the profiler of the worker process serving the request, keeping the collected stacks.
+
+    Args:
+        current_user (Principal): The currently authenticated admin user.
+
+    Returns:
+        dict: The profiler status.
+    """
+    await asyncio.to_thread(profiler.stop)
+    return profiler.status()
+
+@router.get('/stacks', response_class=PlainTextResponse)
+async def profiler_stacks(reset: bool = False, current_user: Principal = Depends(require_admin)):
+    """
+    Stacks collected by the worker process serving the request, in the collapsed format,
+    ready for flamegraph.pl or speedscope.
+
+    Args:
+        reset (bool): Discard the stacks after returning them.
+        current_user (Principal): The currently authenticated admin user.
+
+    Returns:
+        str: One `route;frame;frame;... count` line per distinct stack.
+    """
+    stacks = profiler.collapsed()
+    if reset:
+        profiler.reset()
+    return stacks
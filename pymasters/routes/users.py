@@ -1,6 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request, File, UploadFile
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request, File, UploadFile
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from fastapi_mail import FastMail, MessageSchema, MessageType
 
 from sqlalchemy.orm import Session
 
@@ -10,30 +9,32 @@ from typing import List
 
 from datetime import date
 
-from pymasters.schemas import UserModel, EmailSchema, RequestEmail, UserDisplayModel
+from pymasters.schemas import UserModel, EmailSchema, RequestEmail, UserDisplayModel, RoleUpdate
 from pymasters.database.db import get_db
 from pymasters.database.models import User
 
-from pymasters.repository.users_repo import UserService, UsernameTaken, LoginFailed
-from pymasters.repository.auth import get_current_user, get_admin_user, get_moderator_user
+from pymasters.repository.users_repo import UserService, UsernameTaken, LoginFailed, InvalidRefreshtoken
+from pymasters.repository.auth import Principal, require_admin, require_moderator
 
-from pymasters.services.email import send_email
+from pymasters.services.rate_limit import limit_by_ip
+from pymasters.services.email_outbox import enqueue_email, metrics as email_outbox_metrics
 
-from pymasters.settings import conf
 
 router = APIRouter(prefix='/users', tags=['users'])
 
 security = HTTPBearer()
 user_servis = UserService()
 
-@router.post("/signup")
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+@router.post("/signup", dependencies=[Depends(limit_by_ip("signup"))])
+async def signup(body: UserModel, request: Request, db: Session = Depends(get_db)):
     """
     Create a new user account.
 
+    The user and its confirmation email (queued in the email outbox and sent by the
+    outbox worker) are committed together.
+
     Args:
         body (UserModel): The user information for account creation.
-        background_tasks (BackgroundTasks): Background task manager for sending emails.
         request (Request): The current request context.
         db (Session): The database session.
 
@@ -44,13 +45,15 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
         HTTPException: If the username is already taken.
     """
     try:
-        new_user = user_servis.creat_new_user(body, db)
-        background_tasks.add_task(send_email, new_user.email, request.base_url)
+        new_user = user_servis.creat_new_user(body, db, commit=False)
     except UsernameTaken:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    return {"new_user": new_user.email, "detail": "User successfully created. Check your email for confirmation."}
+    email = new_user.email
+    enqueue_email(db, email, request.base_url)
+    db.commit()
+    return {"new_user": email, "detail": "User successfully created. Check your email for confirmation."}
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(limit_by_ip("login"))])
 async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """
     User login and token generation.
@@ -79,13 +82,14 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: Session = Depends(get_db)):
     """
     Request email confirmation.
 
+    The confirmation email is queued in the email outbox and sent by the outbox worker.
+
     Args:
         body (RequestEmail): The email address to confirm.
-        background_tasks (BackgroundTasks): Background task manager for sending emails.
         request (Request): The current request context.
         db (Session): The database session.
 
@@ -97,7 +101,8 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, request.base_url)
+        enqueue_email(db, user.email, request.base_url)
+        db.commit()
     return {"message": "Check your email for confirmation."}
 
 @router.get('/confirmed_email/{token}')
@@ -129,26 +134,35 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
     """
     Refresh the access token.
 
+    The refresh token is rotated: the presented token can be used only once, and the
+    response carries its replacement.
+
     Args:
         credentials (HTTPAuthorizationCredentials): The refresh token.
         db (Session): The database session.
 
     Returns:
         dict: The new access and refresh tokens.
+
+    Raises:
+        HTTPException: If the refresh token is invalid, already used or revoked.
     """
     token = credentials.credentials
-    access_token = user_servis.refresh_token(token, db)
-    return {"access_token": access_token, "refresh_token": token, "token_type": "bearer"}
+    try:
+        access_token, refresh_token = user_servis.refresh_token(token, db)
+    except InvalidRefreshtoken:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 # Additional routes for role checks
 
 @router.get('/admin')
-async def admin_access(current_user: User = Depends(get_admin_user)):
+async def admin_access(current_user: Principal = Depends(require_admin)):
     """
     Admin access route.
 
     Args:
-        current_user (User): The currently authenticated admin user.
+        current_user (Principal): The currently authenticated admin user.
 
     Returns:
         dict: A message indicating access for admin users.
@@ -156,14 +170,54 @@ async def admin_access(current_user: User = Depends(get_admin_user)):
     return {"message": "Welcome, admin!"}
 
 @router.get('/moderator')
-async def moderator_access(current_user: User = Depends(get_moderator_user)):
+async def moderator_access(current_user: Principal = Depends(require_moderator)):
     """
     Moderator access route.
 
     Args:
-        current_user (User): The currently authenticated moderator or admin user.
+        current_user (Principal): The currently authenticated moderator or admin user.
 
     Returns:
         dict: A message indicating access for moderators.
     """
     return {"message": "Welcome, moderator!"}
+
+@router.get('/email_outbox')
+async def email_outbox_stats(current_user: Principal = Depends(require_admin), db: Session = Depends(get_db)):
+    """
+    Email outbox metrics route.
+
+    Args:
+        current_user (Principal): The currently authenticated admin user.
+        db (Session): The database session.
+
+    Returns:
+        dict: Queue depth of the email outbox and send latency of the in-app worker.
+    """
+    return email_outbox_metrics.snapshot(db)
+
+@router.patch('/{user_id}/role')
+async def change_user_role(user_id: int, body: RoleUpdate, current_user: Principal = Depends(require_admin),
+                           db: Session = Depends(get_db)):
+    """
+    Change a user's role.
+
+    Tokens issued with the previous role stop being accepted; the user gets the new
+    role with the next token refresh.
+
+    Args:
+        user_id (int): The ID of the user.
+        body (RoleUpdate): The new role.
+        current_user (Principal): The currently authenticated admin user.
+        db (Session): The database session.
+
+    Returns:
+        dict: The user's ID, email, new role and role version.
+
+    Raises:
+        HTTPException: If the user is not found.
+    """
+    user = user_servis.change_role(user_id, body.role, db)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return {"id": user.id, "email": user.email, "role": user.role, "role_version": user.role_version}
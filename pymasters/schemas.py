@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from fastapi import UploadFile
 from pydantic import BaseModel, Field, EmailStr
 
@@ -43,6 +43,54 @@ class PhotoDisplay(BaseModel):
     class Config:
         from_attributes = True
 
+    @classmethod
+    def from_photo(cls, photo) -> "PhotoDisplay":
+        """
+        Builds the display model from a `Photos` ORM object, flattening tags to their names.
+        """
+        return cls(
+            id=photo.id,
+            photo_urls=photo.photo_urls,
+            description=photo.description,
+            tags=[tag.tag for tag in photo.tags],
+            transformations=[TransformationDisplay.model_validate(t) for t in photo.transformations]
+        )
+
+class UploadTicket(BaseModel):
+    ticket: str
+    public_id: str
+    expires_at: datetime
+    upload_url: str
+    method: Literal["POST", "PUT"]
+    fields: Dict[str, str] = {}  # form fields to send with the file (Cloudinary)
+
+class UploadFinalize(BaseModel):
+    ticket: str
+    description: str
+    tags: List[str] = []
+    # From Cloudinary's upload response; not used with local storage
+    version: Optional[int] = None
+    signature: Optional[str] = None
+    format: Optional[str] = Field(None, pattern=r"^[a-z0-9]{2,5}$")  # not signed by Cloudinary
+
+class BulkDeleteRequest(BaseModel):
+    photo_ids: Optional[List[int]] = None
+    user_id: Optional[int] = None
+    tag: Optional[str] = None
+
+class ProfilerSettings(BaseModel):
+    route: str = Field("*", description="Request paths to profile, fnmatch syntax, e.g. /api/photos/transform")
+    sample_rate: float = Field(1.0, gt=0, le=1)
+    interval_ms: float = Field(5, ge=1, le=1000)
+    reset: bool = True
+
+class BulkDeleteResult(BaseModel):
+    photos: int
+    photo_tags: int
+    comments: int
+    transformations: int
+    assets_queued: int
+
 class CommentBase(BaseModel):
     content: str
 
@@ -78,6 +126,9 @@ class EmailSchema(BaseModel):
 class RequestEmail(BaseModel):
     email: EmailStr
 
+class RoleUpdate(BaseModel):
+    role: Literal["user", "moderator", "admin"]
+
 class UserDisplayModel(BaseModel):
     email: str
     avatar_urls: str
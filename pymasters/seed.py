@@ -0,0 +1,304 @@
+"""
+Synthetic dataset generator for scale testing.
+
+Fills a database with users, photos, tags, photo tags, comments and
+transformations at sizes where query plans and pagination start to matter. The
+data is skewed the way real traffic is:
+- tag popularity and photo ownership follow a Zipf distribution, so a few tags
+  and users account for most of the rows;
+- comments per photo are heavy-tailed (Pareto): most photos have none or a few,
+  some have hundreds.
+
+Generation is deterministic: the same seed and sizes produce the same rows, with
+IDs continuing after the rows already in the database. Rows are written with Core
+multi-row inserts in batches; on PostgreSQL `--copy` uses `COPY ... FROM STDIN`,
+and the ID sequences are moved past the generated IDs afterwards.
+
+Every generated user has the password given by `--password`.
+
+Usage:
+    python -m pymasters.seed --users 100000 --photos 1000000 --tags 20000 --seed 42
+    python -m pymasters.seed --database-url sqlite:///./scale.db --create-tables --photos 200000
+"""
+import argparse
+import random
+import sys
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Callable, List, Optional
+
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from pymasters.database.models import Base, Comment, Photos, Transformation, User, photo_tags
+from pymasters.importer import ImportStats, TagResolver, copy_rows
+
+DEFAULT_BATCH_SIZE = 1000
+EPOCH = datetime(2024, 1, 1)
+SPAN_SECONDS = 365 * 24 * 3600
+URL_PREFIX = "https://res.cloudinary.com/pymasters-seed/image/upload"
+TRANSFORMATIONS = ("w_300,h_300,c_fill", "e_grayscale", "e_sepia", "r_max", "a_90", "w_800,c_scale")
+
+users_table = User.__table__
+photos_table = Photos.__table__
+comments_table = Comment.__table__
+transformations_table = Transformation.__table__
+
+
+@dataclass
+class SeedConfig:
+    """
+    Sizes and shape of the generated dataset.
+    """
+    users: int = 1000
+    photos: int = 10000
+    tags: int = 1000
+    seed: int = 0
+    tag_exponent: float = 1.1  # Zipf exponent of tag popularity
+    owner_exponent: float = 0.8  # Zipf exponent of photos per user
+    max_tags_per_photo: int = 6
+    comment_alpha: float = 1.2  # Pareto shape of comments per photo; lower means a heavier tail
+    max_comments_per_photo: int = 500
+    transformation_rate: float = 0.3  # Share of photos with at least one transformation
+
+
+class SeedStats(ImportStats):
+    """
+    Row counters and timing for a seeding run.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.users = 0
+
+    @property
+    def rows(self) -> int:
+        return self.users + super().rows
+
+    def __str__(self) -> str:
+        return f"users={self.users} {super().__str__()}"
+
+
+class ZipfSampler:
+    """
+    Draws ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** exponent.
+    """
+
+    def __init__(self, n: int, exponent: float, rng: random.Random):
+        self.rng = rng
+        self.cumulative = list(accumulate(1 / (rank + 1) ** exponent for rank in range(n)))
+
+    def sample(self) -> int:
+        return bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+    def sample_distinct(self, k: int) -> List[int]:
+        """
+        Draws up to `k` distinct ranks; popular ranks repeat, so fewer may be returned.
+        """
+        return list(dict.fromkeys(self.sample() for _ in range(k)))
+
+
+def heavy_tailed(rng: random.Random, alpha: float, cap: int) -> int:
+    """
+    Returns a Pareto-distributed count starting at 0, capped at `cap`.
+    """
+    return min(cap, int(rng.paretovariate(alpha)) - 1)
+
+
+def _timestamp(rng: random.Random, after: datetime = EPOCH) -> datetime:
+    remaining = SPAN_SECONDS - int((after - EPOCH).total_seconds())
+    return after + timedelta(seconds=rng.randrange(max(remaining, 1)))
+
+
+def _next_id(conn: Connection, table) -> int:
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _write(conn: Connection, table, rows: List[dict], use_copy: bool) -> None:
+    if not rows:
+        return
+    if use_copy:
+        copy_rows(conn, table, list(rows[0]), rows)
+    else:
+        conn.execute(insert(table), rows)
+
+
+def reset_sequences(conn: Connection) -> None:
+    """
+    Moves the PostgreSQL ID sequences past the IDs inserted explicitly by the seeder.
+    """
+    for table in (users_table, photos_table, comments_table, transformations_table):
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table.name}), false)"
+        ))
+
+
+def seed_database(engine: Engine, config: SeedConfig, batch_size: int = DEFAULT_BATCH_SIZE,
+                  use_copy: bool = False, password_hash: Optional[str] = None,
+                  progress: Optional[Callable[[SeedStats], None]] = None) -> SeedStats:
+    """
+    Generates the dataset described by `config`, committing after each batch.
+
+    Args:
+        engine (Engine): The target database engine.
+        config (SeedConfig): Sizes, skew and random seed.
+        batch_size (int): Users or photos per batch and transaction.
+        use_copy (bool): Load rows with COPY (PostgreSQL only).
+        password_hash (Optional[str]): Password hash for every user; defaults to the hash of "password".
+        progress (Optional[Callable]): Called with the running stats after each batch.
+
+    Returns:
+        SeedStats: Counters and timing for the run.
+
+    Raises:
+        ValueError: If `use_copy` is requested for a database other than PostgreSQL, or photos
+            are requested without users to own them.
+    """
+    if config.photos and config.users < 1:
+        raise ValueError("Photos need at least one user")
+    if use_copy and engine.dialect.name != "postgresql":
+        raise ValueError("COPY is only supported on PostgreSQL")
+    if password_hash is None:
+        from pymasters.repository.auth import Hash
+        password_hash = Hash().get_password_hash("password")
+
+    rng = random.Random(config.seed)
+    stats = SeedStats()
+    with engine.connect() as conn:
+        first_user, first_photo, first_comment, first_transformation = (
+            _next_id(conn, table) for table in (users_table, photos_table, comments_table, transformations_table))
+        conn.commit()
+
+        for start in range(0, config.users, batch_size):
+            user_rows = [
+                {
+                    "id": first_user + n,
+                    "email": f"user{first_user + n}@seed.example.com",
+                    "password": password_hash,
+                    "confirmed": True,
+                    "role": "user",
+                    "role_version": 0,
+                }
+                for n in range(start, min(start + batch_size, config.users))
+            ]
+            with conn.begin():
+                _write(conn, users_table, user_rows, use_copy)
+            stats.users += len(user_rows)
+            if progress:
+                progress(stats)
+
+        tag_names = [f"seed-tag-{rank}" for rank in range(config.tags)]
+        tags = TagResolver(conn)
+        conn.commit()
+        with conn.begin():
+            # One call, so tag IDs do not depend on the batch size
+            stats.tags += tags.resolve(conn, tag_names)
+        tag_ids = [tags.ids[name] for name in tag_names]
+
+        tag_sampler = ZipfSampler(config.tags, config.tag_exponent, rng)
+        owner_sampler = ZipfSampler(config.users, config.owner_exponent, rng)
+        # Zipf ranks are mapped to shuffled IDs, so the most active users are not simply the first ones
+        owner_ids = list(range(first_user, first_user + config.users))
+        rng.shuffle(owner_ids)
+
+        comment_id, transformation_id = first_comment, first_transformation
+        for start in range(0, config.photos, batch_size):
+            photo_rows, link_rows, comment_rows, transformation_rows = [], [], [], []
+            for photo_id in range(first_photo + start, first_photo + min(start + batch_size, config.photos)):
+                created_at = _timestamp(rng)
+                photo_rows.append({
+                    "id": photo_id,
+                    "photo_urls": f"{URL_PREFIX}/seed/photo_{photo_id}",
+                    "description": f"Seed photo {photo_id}",
+                    "created_by_id": owner_ids[owner_sampler.sample()],
+                })
+                if config.tags:
+                    for rank in tag_sampler.sample_distinct(rng.randint(0, config.max_tags_per_photo)):
+                        link_rows.append({"photo_id": photo_id, "tag_id": tag_ids[rank]})
+                for _ in range(heavy_tailed(rng, config.comment_alpha, config.max_comments_per_photo)):
+                    commented_at = _timestamp(rng, created_at)
+                    comment_rows.append({
+                        "id": comment_id,
+                        "content": f"Seed comment {comment_id}",
+                        "user_id": owner_ids[rng.randrange(config.users)],
+                        "photo_id": photo_id,
+                        "created_at": commented_at,
+                        "updated_at": commented_at,
+                    })
+                    comment_id += 1
+                if rng.random() < config.transformation_rate:
+                    for transformation in rng.sample(TRANSFORMATIONS, rng.randint(1, 3)):
+                        transformation_rows.append({
+                            "id": transformation_id,
+                            "photo_id": photo_id,
+                            "transformation_url": f"{URL_PREFIX}/{transformation}/seed/photo_{photo_id}",
+                            "qr_code_url": f"{URL_PREFIX}/seed/qr_{transformation_id}",
+                            "created_at": _timestamp(rng, created_at),
+                        })
+                        transformation_id += 1
+
+            with conn.begin():
+                for table, rows in ((photos_table, photo_rows), (photo_tags, link_rows),
+                                    (comments_table, comment_rows), (transformations_table, transformation_rows)):
+                    _write(conn, table, rows, use_copy)
+            stats.photos += len(photo_rows)
+            stats.photo_tags += len(link_rows)
+            stats.comments += len(comment_rows)
+            stats.transformations += len(transformation_rows)
+            if progress:
+                progress(stats)
+
+        if engine.dialect.name == "postgresql":
+            with conn.begin():
+                reset_sequences(conn)
+    return stats
+
+
+def main(argv=None):
+    defaults = SeedConfig()
+    parser = argparse.ArgumentParser(description="Generate a synthetic dataset for scale testing.")
+    parser.add_argument("--database-url", default=None, help="Target database (default: SQLALCHEMY_DATABASE_URL)")
+    parser.add_argument("--create-tables", action="store_true", help="Create missing tables first (for local SQLite runs)")
+    parser.add_argument("--users", type=int, default=defaults.users, help="Users to create")
+    parser.add_argument("--photos", type=int, default=defaults.photos, help="Photos to create")
+    parser.add_argument("--tags", type=int, default=defaults.tags, help="Distinct tags to use")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Random seed; the same seed gives the same data")
+    parser.add_argument("--tag-exponent", type=float, default=defaults.tag_exponent, help="Zipf exponent of tag popularity")
+    parser.add_argument("--owner-exponent", type=float, default=defaults.owner_exponent,
+                        help="Zipf exponent of photos per user")
+    parser.add_argument("--comment-alpha", type=float, default=defaults.comment_alpha,
+                        help="Pareto shape of comments per photo (lower: heavier tail)")
+    parser.add_argument("--max-comments", type=int, default=defaults.max_comments_per_photo,
+                        help="Cap on comments per photo")
+    parser.add_argument("--password", default="password", help="Password of every generated user")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Users or photos per batch")
+    parser.add_argument("--copy", action="store_true", help="Load rows with COPY (PostgreSQL)")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        from pymasters.database.db import engine
+
+    if args.create_tables:
+        Base.metadata.create_all(bind=engine)
+
+    from pymasters.repository.auth import Hash
+
+    config = SeedConfig(users=args.users, photos=args.photos, tags=args.tags, seed=args.seed,
+                        tag_exponent=args.tag_exponent, owner_exponent=args.owner_exponent,
+                        comment_alpha=args.comment_alpha, max_comments_per_photo=args.max_comments)
+
+    def report(stats: SeedStats):
+        print(stats, file=sys.stderr)
+
+    stats = seed_database(engine, config, batch_size=args.batch_size, use_copy=args.copy,
+                          password_hash=Hash().get_password_hash(args.password), progress=report)
+    print(f"Seeding finished: {stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
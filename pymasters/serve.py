@@ -0,0 +1,155 @@
+"""
+Production server: gunicorn managing uvicorn workers.
+
+- One worker process per CPU core available to the process (WEB_CONCURRENCY
+  overrides it), each running its own uvloop event loop with the httptools
+  HTTP parser.
+- The application is imported once in the master before the workers are
+  forked (`preload_app`), so modules, compiled templates and other read-only
+  state are shared copy-on-write. The subsystems the application only loads on
+  first use (the mail stack, the Cloudinary SDK, QR codes, compiled templates)
+  are loaded here as well, so each worker does not load its own copy.
+  `gc.freeze()` moves those objects out of the
+  collector's reach, because a collection pass would otherwise write to (and so
+  copy) every page holding them in every worker.
+- A worker is replaced after WORKER_MAX_REQUESTS requests, with a random jitter
+  of up to WORKER_MAX_REQUESTS_JITTER so the workers do not all restart at once.
+  This caps slow memory growth.
+- On SIGTERM (or when a worker is recycled) the worker stops accepting
+  connections and lets in-flight requests finish. Then the lifespan shutdown
+  lets the outbox workers finish their current batch (SHUTDOWN_DRAIN_TIMEOUT).
+  The master allows GRACEFUL_TIMEOUT seconds for both before killing the worker.
+
+Usage:
+    python -m pymasters.serve [--bind 0.0.0.0:8000] [--workers 4] [--max-requests 10000]
+
+For development, `uvicorn pymasters.main:app --reload` remains the quicker loop.
+"""
+import argparse
+import gc
+import os
+from typing import Any, Dict
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+from pymasters.settings import (
+    WEB_CONCURRENCY, WORKER_MAX_REQUESTS, WORKER_MAX_REQUESTS_JITTER, GRACEFUL_TIMEOUT, SHUTDOWN_DRAIN_TIMEOUT,
+)
+
+
+class UvicornWorker(BaseUvicornWorker):
+    """
+    Uvicorn worker on uvloop and httptools, with the lifespan required on.
+    """
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # In-flight requests get what the graceful timeout leaves after the background drain,
+        # so both finish before the master kills the worker
+        self.config.timeout_graceful_shutdown = max(int(self.cfg.graceful_timeout - SHUTDOWN_DRAIN_TIMEOUT), 1)
+
+
+def default_workers() -> int:
+    """
+    Returns WEB_CONCURRENCY, or the number of CPU cores this process may run on.
+    """
+    if WEB_CONCURRENCY > 0:
+        return WEB_CONCURRENCY
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def post_fork(server, worker):
+    # Pooled connections opened in the master must not be shared by the workers
+    from pymasters.database.db import engine, get_replica_set
+    engine.dispose(close=False)
+    replicas = get_replica_set()
+    if replicas is not None:
+        replicas.dispose(close=False)
+
+
+def preload():
+    """
+    Loads the lazily imported subsystems, so the forked workers share them.
+
+    Also clears the photo cache when it is shared: its file outlives the server, and
+    invalidations sent while the server was down were missed.
+    """
+    import aiosmtplib  # noqa: F401
+    import fastapi_mail  # noqa: F401
+    import qrcode  # noqa: F401
+    from pymasters.services.cache import photo_cache
+    from pymasters.services.cloudinary_service import _cloudinary
+    from pymasters.services.templates import get_template_service
+    from pymasters.settings import get_mail_config
+
+    get_mail_config()
+    get_template_service()
+    _cloudinary()
+    photo_cache.clear()
+
+
+class Server(BaseApplication):
+    """
+    Gunicorn application serving `pymasters.main:app` with the given settings.
+    """
+
+    def __init__(self, options: Dict[str, Any]):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from pymasters.main import app
+
+        preload()
+        gc.freeze()
+        return app
+
+
+def build_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Returns the gunicorn settings for the parsed command line.
+    """
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "pymasters.serve.UvicornWorker",
+        "preload_app": True,
+        "post_fork": post_fork,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests_jitter,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.timeout,
+        "keepalive": args.keepalive,
+        "accesslog": "-" if args.access_log else None,
+        "errorlog": "-",
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the application with gunicorn and uvicorn workers.")
+    parser.add_argument("--bind", default=f"0.0.0.0:{os.getenv('PORT', '8000')}", help="Address to listen on (default: port $PORT or 8000)")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Worker processes (default: CPU cores)")
+    parser.add_argument("--max-requests", type=int, default=WORKER_MAX_REQUESTS,
+                        help="Requests after which a worker is replaced (0 disables)")
+    parser.add_argument("--max-requests-jitter", type=int, default=WORKER_MAX_REQUESTS_JITTER,
+                        help="Random extra requests per worker, so workers do not restart together")
+    parser.add_argument("--graceful-timeout", type=int, default=GRACEFUL_TIMEOUT,
+                        help="Seconds a stopping worker gets to finish requests and background work")
+    parser.add_argument("--timeout", type=int, default=30, help="Seconds a silent worker is given before it is restarted")
+    parser.add_argument("--keepalive", type=int, default=5, help="Seconds to keep idle client connections open")
+    parser.add_argument("--access-log", action="store_true", help="Log every request to stdout")
+    args = parser.parse_args(argv)
+
+    Server(build_options(args)).run()
+
+
+if __name__ == "__main__":
+    main()
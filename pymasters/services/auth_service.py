@@ -4,16 +4,17 @@ from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 from starlette import status
 
+from pymasters.services.token_codec import get_token_codec
 from pymasters.settings import SECRET_KEY, ALGORITHM
 
-def create_email_token(data: dict, SECRET_KEY=SECRET_KEY, ALGORITHM=ALGORITHM):
+def create_email_token(data: dict, SECRET_KEY=None, ALGORITHM=None):
     """
     Create a JWT token for email verification.
 
     Args:
         data (dict): Data to encode in the JWT.
-        SECRET_KEY (str): Secret key for encoding the JWT.
-        ALGORITHM (str): Algorithm for encoding the JWT.
+        SECRET_KEY (str): Secret key for encoding the JWT. Defaults to the application's token codec.
+        ALGORITHM (str): Algorithm for encoding the JWT. Defaults to the application's token codec.
 
     Returns:
         str: The encoded JWT token.
@@ -21,17 +22,19 @@ def create_email_token(data: dict, SECRET_KEY=SECRET_KEY, ALGORITHM=ALGORITHM):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=7)
     to_encode.update({"iat": datetime.utcnow(), "exp": expire})
+    if SECRET_KEY is None and ALGORITHM is None:
+        return get_token_codec().encode(to_encode)
     token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return token
 
-async def get_email_from_token(token: str, SECRET_KEY=SECRET_KEY, ALGORITHM=ALGORITHM):
+async def get_email_from_token(token: str, SECRET_KEY=None, ALGORITHM=None):
     """
     Decode the JWT token and extract the email address.
 
     Args:
         token (str): The JWT token to decode.
-        SECRET_KEY (str): Secret key for decoding the JWT.
-        ALGORITHM (str): Algorithm for decoding the JWT.
+        SECRET_KEY (str): Secret key for decoding the JWT. Defaults to the application's token codec.
+        ALGORITHM (str): Algorithm for decoding the JWT. Defaults to the application's token codec.
 
     Returns:
         str: The extracted email address.
@@ -40,7 +43,10 @@ async def get_email_from_token(token: str, SECRET_KEY=SECRET_KEY, ALGORITHM=ALGO
         HTTPException: If the token is invalid or expired.
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        if SECRET_KEY is None and ALGORITHM is None:
+            payload = get_token_codec().decode(token)
+        else:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("sub")
         if email is None:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
@@ -0,0 +1,122 @@
+"""
+Per-process caches of hot objects, kept fresh by the invalidation bus.
+
+Each cache belongs to a namespace of invalidation keys: `photo_cache` holds
+the payload of `GET /api/photos/{photo_id}` under the photo ID, and a write
+that publishes `photo:<id>` (see `services.invalidation`) evicts it in every
+worker. Entries also expire after a TTL, which bounds staleness if an event is
+ever lost.
+
+A read that started before an invalidation must not put its (possibly old)
+result back afterwards, so callers take a token with `begin()` before loading
+and pass it to `set()`, which then ignores the value.
+
+With SHARED_CACHE_MB set, `create_cache` returns a `SharedCache` instead: one
+copy per host in shared memory (see `services.shared_cache`) with the same
+interface, so a payload loaded by one worker is a hit in all of them.
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+from pymasters.services.invalidation import invalidator
+from pymasters.settings import (
+    PHOTO_CACHE_SIZE, PHOTO_CACHE_TTL, SHARED_CACHE_MB, SHARED_CACHE_DIR, SHARED_CACHE_SLOT_BYTES,
+)
+
+
+class LocalCache:
+    """
+    Thread-safe LRU cache in process memory whose entries expire after `ttl` seconds.
+
+    Args:
+        max_size (int): Maximum number of entries; 0 disables the cache.
+        ttl (float): Seconds an entry is served.
+        clock (Callable[[], float]): Monotonic clock in seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def begin(self) -> int:
+        """
+        Returns a token for a `set()` after loading the value.
+        """
+        return self._generation
+
+    def set(self, key: Hashable, value: Any, token: Optional[int] = None):
+        """
+        Caches a value, unless the cache was invalidated since `token` was taken.
+        """
+        if not self.max_size:
+            return
+        with self._lock:
+            if token is not None and token != self._generation:
+                return
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys: Optional[Iterable[Hashable]] = None):
+        """
+        Evicts `keys`, or every entry when `keys` is None.
+        """
+        with self._lock:
+            self._generation += 1
+            if keys is None:
+                self._entries.clear()
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        self.invalidate()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def create_cache(namespace: str, max_size: int, ttl: float, shared_mb: float = SHARED_CACHE_MB):
+    """
+    Returns the cache of a namespace: shared by the host's workers if `shared_mb` > 0, else per process.
+
+    Args:
+        namespace (str): Names the shared file in SHARED_CACHE_DIR, `pymasters-<namespace>-<sets>x<slot size>.cache`.
+        max_size (int): Entries of a per-process cache; 0 disables the cache in either case.
+        ttl (float): Seconds an entry is served.
+        shared_mb (float): Memory budget of a shared cache in MB.
+    """
+    if shared_mb > 0 and max_size:
+        from pymasters.services.shared_cache import SharedCache, table_sets
+        size_bytes = int(shared_mb * 1024 * 1024)
+        # Workers configured with another layout (e.g. during a rolling deploy) use another file
+        name = f"pymasters-{namespace}-{table_sets(size_bytes, SHARED_CACHE_SLOT_BYTES)}x{SHARED_CACHE_SLOT_BYTES}.cache"
+        path = os.path.join(SHARED_CACHE_DIR or tempfile.gettempdir(), name)
+        return SharedCache(path, size_bytes, ttl, SHARED_CACHE_SLOT_BYTES)
+    return LocalCache(max_size, ttl)
+
+
+# Payloads of GET /api/photos/{photo_id}: (owner ID, PhotoDisplay) by the photo ID as a string
+photo_cache = create_cache("photo", PHOTO_CACHE_SIZE, PHOTO_CACHE_TTL)
+invalidator.register("photo", photo_cache.invalidate)
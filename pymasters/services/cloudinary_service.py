@@ -1,18 +1,56 @@
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 import os
-import qrcode
+import re
+import logging
+import time
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 
-from typing import List, Dict
+from typing import List, Dict, Iterable, Optional, Callable
 
-# Configure Cloudinary with environment variables
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_NAME', 'default_name'),
-    api_key=os.getenv('CLOUDINARY_API_KEY', 'default_key'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET_KEY', 'default_secret')
-)
+from pymasters.metrics import time_storage
+from pymasters.services import local_storage
+from pymasters.settings import STORAGE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+# Cloudinary's Admin API accepts at most 100 public IDs per delete_resources call
+DELETE_BATCH_SIZE = 100
+
+# The version segment that asset URLs have between /upload/ and the public ID
+_VERSION_SEGMENT = re.compile(r'^v\d+/')
+
+@lru_cache(maxsize=None)
+def _cloudinary():
+    """
+    Imports and configures the Cloudinary SDK on first use, so that importing the
+    application (or a CLI tool) does not pay for it.
+
+    Returns:
+    - module: The configured `cloudinary` package, with `uploader` and `api` loaded.
+    """
+    import cloudinary
+    import cloudinary.uploader
+    import cloudinary.api
+    import cloudinary.utils
+
+    # Configure Cloudinary with environment variables
+    cloudinary.config(
+        cloud_name=os.getenv('CLOUDINARY_NAME', 'default_name'),
+        api_key=os.getenv('CLOUDINARY_API_KEY', 'default_key'),
+        api_secret=os.getenv('CLOUDINARY_API_SECRET_KEY', 'default_secret')
+    )
+    return cloudinary
+
+def _upload(file, public_id=None) -> Dict:
+    if STORAGE_BACKEND == "local":
+        return local_storage.upload(file, public_id=public_id)
+    return _cloudinary().uploader.upload(file, public_id=public_id)
+
+def _destroy(public_id: str) -> Dict:
+    if STORAGE_BACKEND == "local":
+        return local_storage.destroy(public_id)
+    return _cloudinary().uploader.destroy(public_id)
 
 def upload_photo_to_cloudinary(file, public_id=None) -> str:
     """
@@ -26,12 +64,66 @@ def upload_photo_to_cloudinary(file, public_id=None) -> str:
     - str: The URL of the uploaded photo on Cloudinary.
     """
     try:
-        result = cloudinary.uploader.upload(file, public_id=public_id)
+        with time_storage("upload"):
+            result = _upload(file, public_id=public_id)
         return result.get('url')
     except Exception as e:
         print(f"Error uploading photo: {e}")
         raise
 
+def direct_upload_request(public_id: str, ticket: str) -> Dict:
+    """
+    Describes the request a client sends to store a photo directly, without the API in between.
+
+    With Cloudinary it is a multipart POST of the file to the upload API, with the public ID
+    and a timestamp signed by the API secret (Cloudinary rejects them an hour after signing).
+    `overwrite` is signed as false, since the signature outlives the ticket and would
+    otherwise let the client replace the asset after the photo is finalized.
+    With local storage it is a PUT of the file body to the asset URL, authorized by the ticket.
+
+    Parameters:
+    - public_id (str): The public ID the photo must be stored under.
+    - ticket (str): The upload ticket, which the local storage checks.
+
+    Returns:
+    - Dict: "upload_url", "method" and the form "fields" to send along with the file.
+    """
+    if STORAGE_BACKEND == "local":
+        return {"upload_url": f"{local_storage.url(public_id)}?ticket={ticket}", "method": "PUT", "fields": {}}
+    cloudinary = _cloudinary()
+    params = cloudinary.utils.sign_request(
+        {"public_id": public_id, "timestamp": int(time.time()), "overwrite": False, "invalidate": True}, {})
+    return {
+        "upload_url": cloudinary.utils.cloudinary_api_url("upload", resource_type="image"),
+        "method": "POST",
+        "fields": {name: str(value) for name, value in params.items()},
+    }
+
+def direct_upload_url(public_id: str, version: Optional[int] = None, signature: Optional[str] = None,
+                      format: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the URL of a directly uploaded photo, once it is verified to be stored.
+
+    Cloudinary signs its upload response (public ID and version) with the API secret, so
+    the response the client forwards is verified without calling the Admin API.
+
+    Parameters:
+    - public_id (str): The public ID of the upload ticket.
+    - version (int, optional): The `version` of Cloudinary's upload response.
+    - signature (str, optional): The `signature` of Cloudinary's upload response.
+    - format (str, optional): The `format` of Cloudinary's upload response, the URL's extension.
+
+    Returns:
+    - Optional[str]: The photo URL, or None if the photo was not stored under the public ID.
+    """
+    if STORAGE_BACKEND == "local":
+        return local_storage.url(public_id) if local_storage.exists(public_id) else None
+    cloudinary = _cloudinary()
+    if version is None or not signature or not cloudinary.utils.verify_api_response_signature(
+            public_id, version, signature):
+        return None
+    return cloudinary.utils.cloudinary_url(public_id, version=version, format=format)[0]
+
 def delete_photo_from_cloudinary(photo_url: str):
     """
     Deletes a photo from Cloudinary using the photo URL.
@@ -43,12 +135,89 @@ def delete_photo_from_cloudinary(photo_url: str):
     - None: The function does not return a value, but raises an error if something goes wrong.
     """
     try:
-        public_id = photo_url.split('/')[-1].split('.')[0]
-        cloudinary.uploader.destroy(public_id)
+        public_id = public_id_from_url(photo_url)
+        with time_storage("destroy"):
+            _destroy(public_id)
     except Exception as e:
         print(f"Error deleting photo: {e}")
         raise
 
+def public_id_from_url(url: str) -> str:
+    """
+    Extracts the Cloudinary public ID from an asset URL.
+
+    The public ID is the path after `/upload/` and the optional `v<version>/` segment,
+    without the file extension. It may contain slashes and dots: QR codes are uploaded
+    with the transformation URL they encode as public ID (`<url>_qr_code`).
+
+    Parameters:
+    - url (str): URL of the asset.
+
+    Returns:
+    - str: The public ID.
+    """
+    path = url.split('/upload/', 1)[1] if '/upload/' in url else url.rsplit('/', 1)[-1]
+    path = _VERSION_SEGMENT.sub('', path, count=1)
+    folder, _, name = path.rpartition('/')
+    name = name.rsplit('.', 1)[0]
+    return f"{folder}/{name}" if folder else name
+
+def delete_resources_from_cloudinary(
+    public_ids: Iterable[str],
+    batch_size: int = DELETE_BATCH_SIZE,
+    max_workers: int = 4,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, List[str]]:
+    """
+    Deletes many assets from Cloudinary in parallel batches.
+
+    Derived versions (transformations) of each asset are invalidated together with it.
+    Deleting is idempotent: assets that no longer exist count as deleted.
+
+    Parameters:
+    - public_ids (Iterable[str]): Public IDs of the assets to delete.
+    - batch_size (int): Public IDs per delete_resources call (Cloudinary allows up to 100).
+    - max_workers (int): Number of batches deleted concurrently.
+    - progress (Callable[[int, int], None], optional): Called with (done, total) after each batch.
+
+    Returns:
+    - Dict: Public IDs under "deleted" and "failed", and an error message per failed ID under "errors".
+    """
+    public_ids = list(dict.fromkeys(public_ids))
+    batches = [public_ids[i:i + batch_size] for i in range(0, len(public_ids), batch_size)]
+    result = {"deleted": [], "failed": [], "errors": {}}
+    if not batches:
+        return result
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_delete_resources, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                statuses = (future.result() or {}).get("deleted", {})
+                for public_id in batch:
+                    status = statuses.get(public_id, "deleted")
+                    if status in ("deleted", "not_found"):
+                        result["deleted"].append(public_id)
+                    else:
+                        result["failed"].append(public_id)
+                        result["errors"][public_id] = str(status)
+            except Exception as e:
+                logger.error(f"Error deleting assets {batch}: {e}")
+                result["failed"].extend(batch)
+                result["errors"].update({public_id: str(e) for public_id in batch})
+            done += len(batch)
+            if progress:
+                progress(done, len(public_ids))
+    return result
+
+def _delete_resources(public_ids: List[str]) -> Dict:
+    with time_storage("delete_resources"):
+        if STORAGE_BACKEND == "local":
+            return local_storage.delete_resources(public_ids, invalidate=True)
+        return _cloudinary().api.delete_resources(public_ids, invalidate=True)
+
 def create_transformation_urls(photo_url: str, transformations: List[Dict]) -> List[Dict]:
     """
     Generates transformation URLs for Cloudinary and QR codes for each transformation.
@@ -89,6 +258,9 @@ def generate_qr_code(url: str) -> str:
     Returns:
     - str: URL of the uploaded QR code on Cloudinary.
     """
+    # qrcode and Pillow are only needed here
+    import qrcode
+
     try:
         qr = qrcode.QRCode(
             version=1,
@@ -105,7 +277,8 @@ def generate_qr_code(url: str) -> str:
         img.save(buffered)
         buffered.seek(0)
         
-        qr_code_result = cloudinary.uploader.upload(buffered, public_id=f"{url}_qr_code")
+        with time_storage("upload_qr_code"):
+            qr_code_result = _upload(buffered, public_id=f"{url}_qr_code")
         return qr_code_result['url']
     except Exception as e:
         print(f"Error generating QR code: {e}")
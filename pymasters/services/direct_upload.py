@@ -0,0 +1,64 @@
+"""
+Direct-to-storage photo uploads.
+
+`POST /api/photos/upload` receives every photo byte and passes it on to
+storage. With a direct upload the API only handles metadata:
+
+1. `POST /api/photos/upload/ticket` issues an upload ticket: a JWT with scope
+   "upload", valid for UPLOAD_TICKET_TTL seconds, that binds a fresh public ID
+   to the caller, together with the request to send to storage (see
+   `cloudinary_service.direct_upload_request`).
+2. The client uploads the file straight to Cloudinary, or with STORAGE_BACKEND=local
+   PUTs it to the signed asset URL.
+3. `POST /api/photos/upload/finalize` with the ticket (and for Cloudinary the
+   `version`, `signature` and `format` of its upload response) verifies that
+   the asset is stored and creates the photo row with its tags.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from jose import JWTError
+
+from pymasters.services.cloudinary_service import direct_upload_request
+from pymasters.services.token_codec import get_token_codec
+from pymasters.settings import UPLOAD_TICKET_TTL
+
+SCOPE = "upload"
+
+
+def issue_ticket(user_id: int, ttl: int = UPLOAD_TICKET_TTL) -> Dict:
+    """
+    Issues a ticket for one photo upload by the user.
+
+    Args:
+        user_id (int): The uploading user.
+        ttl (int): Seconds the ticket is valid.
+
+    Returns:
+        Dict: The "ticket", its "public_id" and "expires_at", and the storage request:
+        "upload_url", "method" and "fields".
+    """
+    public_id = f"u{user_id}_{uuid.uuid4().hex}"
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    ticket = get_token_codec().encode({"scope": SCOPE, "uid": user_id, "pid": public_id, "exp": expires_at})
+    return {"ticket": ticket, "public_id": public_id, "expires_at": expires_at,
+            **direct_upload_request(public_id, ticket)}
+
+
+def read_ticket(ticket: str, user_id: Optional[int] = None) -> str:
+    """
+    Verifies a ticket, and that it was issued to `user_id` if given.
+
+    Returns:
+        str: The public ID the photo is uploaded under.
+
+    Raises:
+        JWTError: If the ticket is invalid, expired or issued to another user.
+    """
+    claims = get_token_codec().decode(ticket)
+    if claims.get("scope") != SCOPE or not claims.get("pid"):
+        raise JWTError("Not an upload ticket")
+    if user_id is not None and claims.get("uid") != user_id:
+        raise JWTError("Upload ticket issued to another user")
+    return claims["pid"]
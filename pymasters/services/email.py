@@ -1,17 +1,48 @@
-from pathlib import Path
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
 
-from fastapi_mail import FastMail, MessageSchema, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 
-from pymasters.repository.users_repo import UserService
 from pymasters.services.auth_service import create_email_token
-from pymasters.settings import conf
+from pymasters.services import mail_dispatcher
+from pymasters.settings import get_mail_config
+
+if TYPE_CHECKING:
+    from fastapi_mail import MessageSchema
+
+CONFIRMATION_TEMPLATE = "email_tamplate.html"
+
+
+def confirmation_message(email: EmailStr, host: str) -> MessageSchema:
+    """
+    Builds the email confirmation message with a fresh verification token.
+
+    Parameters:
+    - email (EmailStr): The recipient's email address.
+    - host (str): The base URL of the application, used in the email template.
+
+    Returns:
+    - MessageSchema: The message, rendered with CONFIRMATION_TEMPLATE.
+    """
+    from fastapi_mail import MessageSchema, MessageType
+
+    token_verification = create_email_token({"sub": email})
+    return MessageSchema(
+        subject="Confirm your email ",
+        recipients=[email],
+        template_body={"host": host, "token": token_verification},
+        subtype=MessageType.html
+    )
+
 
 async def send_email(email: EmailStr, host: str):
     """
     Sends a confirmation email to the specified email address with a verification token.
 
+    The email goes through the pooled mail dispatcher when it is running, and over
+    a dedicated FastMail connection otherwise.
+
     Parameters:
     - email (EmailStr): The recipient's email address.
     - host (str): The base URL of the application, used in the email template.
@@ -22,17 +53,19 @@ async def send_email(email: EmailStr, host: str):
     Raises:
     - ConnectionErrors: If there is a problem connecting to the email server or sending the email.
     """
+    from fastapi_mail import FastMail
+    from fastapi_mail.errors import ConnectionErrors
+    from pymasters.services.templates import render_message
+
     try:
-        token_verification = create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_tamplate.html")
+        message = confirmation_message(email, host)
+
+        dispatcher = await mail_dispatcher.app_dispatcher()
+        if dispatcher:
+            await dispatcher.send(message, template_name=CONFIRMATION_TEMPLATE)
+        else:
+            fm = FastMail(get_mail_config())
+            await fm.send_message(render_message(message, CONFIRMATION_TEMPLATE))
     except ConnectionErrors as err:
         print(err)
 
@@ -0,0 +1,331 @@
+"""
+Durable outbox for transactional emails.
+
+Routes no longer send email in FastAPI BackgroundTasks, which run in the web
+worker after the response and are lost when it restarts. They write a row to
+the `email_outbox` table instead. A worker leases due rows with
+`SELECT ... FOR UPDATE SKIP LOCKED` (so several workers can run side by side),
+sends them as one batch through the pooled mail dispatcher and deletes the sent
+rows; failed rows are retried with exponential backoff.
+
+The worker runs inside the application (see EMAIL_OUTBOX_INTERVAL) or as a
+separate process:
+    python -m pymasters.services.email_outbox [--once] [--stats]
+
+Queue depth and send latency are available from `metrics.snapshot(db)`, the
+admin route `GET /api/users/email_outbox` and `--stats`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, update, func, case
+from sqlalchemy.orm import Session
+
+from pymasters.database.models import EmailOutbox
+from pymasters.services import mail_dispatcher
+from pymasters.services.email import confirmation_message, CONFIRMATION_TEMPLATE
+from pymasters.services.mail_dispatcher import MailDispatcher
+from pymasters.settings import get_mail_config, EMAIL_OUTBOX_INTERVAL, EMAIL_OUTBOX_BATCH_SIZE, EMAIL_OUTBOX_MAX_ATTEMPTS
+
+if TYPE_CHECKING:
+    from fastapi_mail import MessageSchema
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed row stays invisible to other workers before it is retried
+LEASE_SECONDS = 120
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 3600
+
+# Email kinds the worker can render: kind -> (message builder, template name)
+EMAIL_KINDS: Dict[str, Tuple[Callable[[str, str], "MessageSchema"], str]] = {
+    "confirm_email": (confirmation_message, CONFIRMATION_TEMPLATE),
+}
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    """
+    Returns the delay before the next attempt after `attempts` failures.
+    """
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def _percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
+
+
+class OutboxMetrics:
+    """
+    Send counters and latency samples of the worker running in this process.
+
+    `send_latency` is the time from handing a message to the SMTP dispatcher until the
+    server accepted it; `delivery_latency` is the time from enqueueing until then.
+    Both keep the last `window` samples.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.sent = 0
+        self.failed = 0
+        self.send_latency = deque(maxlen=window)
+        self.delivery_latency = deque(maxlen=window)
+
+    def observe_sent(self, send_seconds: float, delivery_seconds: float):
+        self.sent += 1
+        self.send_latency.append(send_seconds)
+        self.delivery_latency.append(delivery_seconds)
+
+    def observe_failed(self):
+        self.failed += 1
+
+    def snapshot(self, db: Session, max_attempts: int = EMAIL_OUTBOX_MAX_ATTEMPTS) -> Dict:
+        """
+        Returns queue depth from the database together with this process's send metrics.
+
+        Args:
+            db (Session): The database session.
+            max_attempts (int): Rows that failed this many times are counted as dead.
+
+        Returns:
+            Dict: Queue depth ("pending", "due", "dead", "oldest_age_seconds"), counters and
+            p50/p95 latencies in seconds.
+        """
+        now = datetime.utcnow()
+        live = EmailOutbox.attempts < max_attempts
+        pending, due, dead, oldest = db.execute(
+            select(
+                func.count().filter(live),
+                func.count().filter(live, EmailOutbox.next_attempt_at <= now),
+                func.count().filter(~live),
+                func.min(case((live, EmailOutbox.created_at))),
+            ).select_from(EmailOutbox)
+        ).one()
+        send_latency, delivery_latency = list(self.send_latency), list(self.delivery_latency)
+        return {
+            "pending": pending,
+            "due": due,
+            "dead": dead,
+            "oldest_age_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "send_latency_p50": _percentile(send_latency, 0.5),
+            "send_latency_p95": _percentile(send_latency, 0.95),
+            "delivery_latency_p50": _percentile(delivery_latency, 0.5),
+            "delivery_latency_p95": _percentile(delivery_latency, 0.95),
+        }
+
+
+metrics = OutboxMetrics()
+
+
+def enqueue_email(db: Session, recipient: str, host: str, kind: str = "confirm_email") -> EmailOutbox:
+    """
+    Queues an email in the caller's transaction; the caller commits.
+
+    Args:
+        db (Session): The database session.
+        recipient (str): The recipient's email address.
+        host (str): The base URL of the application, used in the email links.
+        kind (str): Which email to send, a key of EMAIL_KINDS.
+
+    Returns:
+        EmailOutbox: The queued row.
+    """
+    if kind not in EMAIL_KINDS:
+        raise ValueError(f"Unknown email kind: {kind}")
+    row = EmailOutbox(kind=kind, recipient=recipient, host=str(host))
+    db.add(row)
+    return row
+
+
+def claim_batch(db: Session, batch_size: int, max_attempts: int) -> List[Tuple[int, str, str, str, int, datetime]]:
+    """
+    Leases a batch of due outbox rows.
+
+    Returns:
+        List[Tuple[int, str, str, str, int, datetime]]: `(id, kind, recipient, host, attempts, created_at)`
+        of the claimed rows.
+    """
+    now = datetime.utcnow()
+    rows = db.scalars(
+        select(EmailOutbox)
+        .where(EmailOutbox.next_attempt_at <= now, EmailOutbox.attempts < max_attempts)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    claimed = [(row.id, row.kind, row.recipient, row.host, row.attempts, row.created_at) for row in rows]
+    for row in rows:
+        row.next_attempt_at = now + timedelta(seconds=LEASE_SECONDS)
+    db.commit()
+    return claimed
+
+
+async def _send(message: "MessageSchema", template_name: str, dispatcher: Optional[MailDispatcher]) -> float:
+    start = time.perf_counter()
+    if dispatcher:
+        await dispatcher.send(message, template_name)
+    else:
+        from fastapi_mail import FastMail
+        from pymasters.services.templates import render_message
+
+        await FastMail(get_mail_config()).send_message(render_message(message, template_name))
+    return time.perf_counter() - start
+
+
+def record_results(db: Session, claimed: List[Tuple[int, str, str, str, int, datetime]],
+                   results: List[object]) -> int:
+    """
+    Deletes the sent rows of a batch and schedules the failed ones for a retry.
+
+    Returns:
+        int: The number of sent emails.
+    """
+    now = datetime.utcnow()
+    sent_ids = []
+    for (row_id, _, recipient, _, attempts, created_at), result in zip(claimed, results):
+        if isinstance(result, Exception):
+            metrics.observe_failed()
+            logger.warning(f"Email to {recipient} failed (attempt {attempts + 1}): {result}")
+            db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == row_id)
+                .values(attempts=attempts + 1, next_attempt_at=now + backoff_delay(attempts + 1),
+                        last_error=str(result)[:255])
+            )
+        else:
+            metrics.observe_sent(result, (now - created_at).total_seconds())
+            sent_ids.append(row_id)
+    if sent_ids:
+        db.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(sent_ids)))
+    db.commit()
+    return len(sent_ids)
+
+
+async def drain_once(db: Session, dispatcher: Optional[MailDispatcher] = None,
+                     batch_size: int = EMAIL_OUTBOX_BATCH_SIZE,
+                     max_attempts: int = EMAIL_OUTBOX_MAX_ATTEMPTS) -> Dict[str, int]:
+    """
+    Claims one batch, sends it and records the outcome.
+
+    Claiming and recording run in a worker thread, so the event loop, which also serves
+    requests when the worker runs inside the application, only waits for the SMTP sends.
+
+    Args:
+        db (Session): The database session, used by one thread at a time.
+        dispatcher (Optional[MailDispatcher]): Pooled dispatcher to send through; defaults to the
+            application's dispatcher when it is running, and to one FastMail connection per email otherwise.
+        batch_size (int): Maximum number of emails sent.
+        max_attempts (int): Attempts after which a row is no longer retried.
+
+    Returns:
+        Dict[str, int]: Numbers of "claimed", "sent" and "failed" emails.
+    """
+    claimed = await asyncio.to_thread(claim_batch, db, batch_size, max_attempts)
+    if not claimed:
+        return {"claimed": 0, "sent": 0, "failed": 0}
+
+    if dispatcher is None:
+        dispatcher = await mail_dispatcher.app_dispatcher()
+    sends = []
+    for _, kind, recipient, host, _, _ in claimed:
+        build, template_name = EMAIL_KINDS[kind]
+        sends.append(_send(build(recipient, host), template_name, dispatcher))
+    results = await asyncio.gather(*sends, return_exceptions=True)
+
+    sent = await asyncio.to_thread(record_results, db, claimed, results)
+    failed = len(claimed) - sent
+    logger.info(f"Email outbox: sent {sent}, failed {failed} of {len(claimed)} claimed")
+    return {"claimed": len(claimed), "sent": sent, "failed": failed}
+
+
+async def drain(db: Session, dispatcher: Optional[MailDispatcher] = None,
+                batch_size: int = EMAIL_OUTBOX_BATCH_SIZE,
+                max_attempts: int = EMAIL_OUTBOX_MAX_ATTEMPTS) -> Dict[str, int]:
+    """
+    Drains all due rows batch by batch.
+
+    Returns:
+        Dict[str, int]: Totals of "claimed", "sent" and "failed" emails.
+    """
+    totals = {"claimed": 0, "sent": 0, "failed": 0}
+    while True:
+        stats = await drain_once(db, dispatcher, batch_size, max_attempts)
+        for key in totals:
+            totals[key] += stats[key]
+        if stats["claimed"] < batch_size:
+            return totals
+
+
+async def run_worker(interval: float = EMAIL_OUTBOX_INTERVAL, dispatcher: Optional[MailDispatcher] = None,
+                     batch_size: int = EMAIL_OUTBOX_BATCH_SIZE, max_attempts: int = EMAIL_OUTBOX_MAX_ATTEMPTS,
+                     stop: Optional[asyncio.Event] = None):
+    """
+    Drains the outbox every `interval` seconds until cancelled, or until `stop` is set
+    (finishing the drain in progress).
+
+    Each drain has its own session, whose database calls run in a worker thread.
+    """
+    from pymasters.database.db import SessionLocal
+
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            await drain(db, dispatcher, batch_size, max_attempts)
+        except Exception as e:
+            logger.error(f"Email outbox worker error: {e}")
+        finally:
+            await asyncio.to_thread(db.close)
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), interval)
+
+
+async def _run(args):
+    from pymasters.database.db import SessionLocal
+
+    dispatcher = MailDispatcher()
+    await dispatcher.start()
+    try:
+        if args.once:
+            db = SessionLocal()
+            try:
+                print(await drain(db, dispatcher, args.batch_size, args.max_attempts))
+            finally:
+                db.close()
+        else:
+            await run_worker(args.interval, dispatcher, args.batch_size, args.max_attempts)
+    finally:
+        await dispatcher.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send queued emails from the email outbox.")
+    parser.add_argument("--once", action="store_true", help="Send due emails once and exit")
+    parser.add_argument("--stats", action="store_true", help="Print queue depth as JSON and exit")
+    parser.add_argument("--interval", type=float, default=EMAIL_OUTBOX_INTERVAL or 2, help="Seconds between drains")
+    parser.add_argument("--batch-size", type=int, default=EMAIL_OUTBOX_BATCH_SIZE, help="Emails per batch")
+    parser.add_argument("--max-attempts", type=int, default=EMAIL_OUTBOX_MAX_ATTEMPTS, help="Attempts per email")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.stats:
+        from pymasters.database.db import SessionLocal
+
+        with SessionLocal() as db:
+            print(json.dumps(metrics.snapshot(db, args.max_attempts)))
+        return
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Cross-worker cache invalidation.
+
+Writers mark the keys a transaction changes:
+
+    invalidate(db, f"photo:{photo.id}")
+    db.commit()
+
+A key is `<namespace>:<id>`. When the transaction commits, the keys are
+evicted from this process's caches right away and published to the other
+workers; nothing is published if it rolls back.
+
+The bus (INVALIDATION_BUS):
+- "postgres": the keys are sent with `pg_notify` inside the committing
+  transaction, so PostgreSQL delivers them exactly when the data becomes
+  visible. Every worker LISTENs on INVALIDATION_CHANNEL over a dedicated
+  psycopg2 connection (reconnecting with a full cache clear if it drops, since
+  events may have been missed).
+- "memory": delivery to the subscribers of this process, for tests and
+  single-process runs.
+- "auto" (default): "postgres" when the database is PostgreSQL, "memory" otherwise.
+
+Bursts are absorbed on both sides: the keys of one transaction are
+deduplicated and sent in as few notifications as fit the payload limit, and a
+worker collects what it receives for INVALIDATION_BATCH_INTERVAL seconds and
+applies it as one batch. A batch of more than INVALIDATION_MAX_BATCH keys for
+a namespace clears that namespace's caches instead of evicting key by key.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from contextlib import suppress
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from pymasters.settings import (
+    INVALIDATION_BUS, INVALIDATION_CHANNEL, INVALIDATION_BATCH_INTERVAL, INVALIDATION_MAX_BATCH,
+    SQLALCHEMY_DATABASE_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Session.info key of the keys a transaction invalidates
+PENDING = "invalidate"
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD = 7900
+
+# Seconds between reconnection attempts of a listener that lost its connection
+RECONNECT_DELAY = 5
+
+Receiver = Callable[[Optional[Iterable[str]]], None]
+
+
+def invalidate(db: Session, *keys: str):
+    """
+    Marks keys to be invalidated in every worker when the session's transaction commits.
+    """
+    if not db.in_transaction():
+        # So that a rollback before any statement also discards the keys
+        db.begin()
+    db.info.setdefault(PENDING, set()).update(keys)
+
+
+def process_origin() -> str:
+    """
+    Returns an ID of this process, used to skip the notifications it sent itself.
+
+    It is derived per PID, so workers forked from a preloaded master each get their own.
+    """
+    return _origin(os.getpid())
+
+
+@lru_cache(maxsize=None)
+def _origin(pid: int) -> str:
+    return f"{pid}-{uuid.uuid4().hex}"
+
+
+class Invalidator:
+    """
+    This process's subscriber: evicts received keys from the caches registered per namespace.
+
+    Args:
+        max_batch (int): Keys per namespace above which a batch clears the namespace instead.
+    """
+
+    def __init__(self, max_batch: int = INVALIDATION_MAX_BATCH):
+        self.max_batch = max_batch
+        self.applied = 0
+        self._handlers: Dict[str, List[Callable[[Optional[Set[str]]], None]]] = defaultdict(list)
+        self._pending: Set[str] = set()
+        self._clear_all = False
+        self._lock = threading.Lock()
+
+    def register(self, namespace: str, handler: Callable[[Optional[Set[str]]], None]):
+        """
+        Calls `handler` with the invalidated IDs of `namespace`, or None when all of them are invalid.
+        """
+        self._handlers[namespace].append(handler)
+
+    def apply(self, keys: Optional[Iterable[str]]):
+        """
+        Evicts keys now; None clears every registered cache.
+        """
+        if keys is None:
+            for handlers in self._handlers.values():
+                for handler in handlers:
+                    handler(None)
+            return
+        by_namespace: Dict[str, Set[str]] = defaultdict(set)
+        for key in keys:
+            namespace, _, key_id = key.partition(":")
+            by_namespace[namespace].add(key_id)
+        for namespace, ids in by_namespace.items():
+            for handler in self._handlers.get(namespace, ()):
+                handler(None if len(ids) > self.max_batch else ids)
+        self.applied += 1
+
+    def receive(self, keys: Optional[Iterable[str]]):
+        """
+        Queues keys received from the bus for the next `flush`; None queues a full clear.
+        """
+        with self._lock:
+            if keys is None:
+                self._clear_all = True
+            elif not self._clear_all:
+                self._pending.update(keys)
+
+    def flush(self) -> int:
+        """
+        Applies the queued keys as one batch.
+
+        Returns:
+            int: The number of distinct keys applied (0 for a full clear).
+        """
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            clear_all, self._clear_all = self._clear_all, False
+        if clear_all:
+            self.apply(None)
+            return 0
+        if pending:
+            self.apply(pending)
+        return len(pending)
+
+    async def run(self, bus, interval: float = INVALIDATION_BATCH_INTERVAL, stop: Optional[asyncio.Event] = None):
+        """
+        Listens on the bus and applies what arrives every `interval` seconds until `stop` is set.
+        """
+        stop = stop or asyncio.Event()
+        listener = asyncio.create_task(bus.listen(self.receive, stop))
+        try:
+            while not stop.is_set():
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stop.wait(), interval)
+                self.flush()
+        finally:
+            listener.cancel()
+            with suppress(asyncio.CancelledError):
+                await listener
+
+
+class MemoryBus:
+    """
+    Delivers published keys to the subscribers in this process.
+    """
+    transactional = False
+
+    def __init__(self):
+        self._receivers: List[Receiver] = []
+
+    def publish(self, keys: Iterable[str], connection: Optional[Connection] = None, sender: Optional[Receiver] = None):
+        keys = list(keys)
+        for receiver in list(self._receivers):
+            if receiver != sender:
+                receiver(keys)
+
+    async def listen(self, receive: Receiver, stop: asyncio.Event):
+        self._receivers.append(receive)
+        try:
+            await stop.wait()
+        finally:
+            self._receivers.remove(receive)
+
+
+def encode_payloads(origin: str, keys: Iterable[str], max_payload: int = MAX_PAYLOAD) -> List[str]:
+    """
+    Packs keys into as few JSON notification payloads of at most `max_payload` bytes as possible.
+    """
+    def encode(batch: List[str]) -> str:
+        return json.dumps({"o": origin, "k": batch}, separators=(",", ":"))
+
+    payloads, batch, size = [], [], 0
+    overhead = len(encode([]).encode())
+    for key in sorted(keys):
+        key_size = len(json.dumps(key).encode()) + 1  # with its comma
+        if batch and overhead + size + key_size > max_payload:
+            payloads.append(encode(batch))
+            batch, size = [], 0
+        batch.append(key)
+        size += key_size
+    if batch:
+        payloads.append(encode(batch))
+    return payloads
+
+
+class PostgresBus:
+    """
+    Publishes keys with NOTIFY in the writing transaction and receives them with LISTEN.
+
+    Args:
+        engine (Engine): A PostgreSQL engine using psycopg2.
+        channel (str): The notification channel.
+    """
+    transactional = True
+
+    def __init__(self, engine: Engine, channel: str = INVALIDATION_CHANNEL):
+        self.engine = engine
+        self.channel = channel
+
+    def publish(self, keys: Iterable[str], connection: Optional[Connection] = None, sender: Optional[Receiver] = None):
+        for payload in encode_payloads(process_origin(), keys):
+            connection.execute(text("SELECT pg_notify(:channel, :payload)"),
+                               {"channel": self.channel, "payload": payload})
+
+    async def listen(self, receive: Receiver, stop: asyncio.Event):
+        """
+        Passes received keys to `receive` until `stop` is set, reconnecting after errors.
+        """
+        while not stop.is_set():
+            try:
+                await self._listen(receive, stop)
+            except Exception as err:
+                logger.warning(f"Invalidation listener failed, reconnecting in {RECONNECT_DELAY} s: {err}")
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stop.wait(), RECONNECT_DELAY)
+            # Events sent while the connection was down are lost
+            receive(None)
+
+    async def _listen(self, receive: Receiver, stop: asyncio.Event):
+        raw = self.engine.raw_connection()
+        # The connection stays in LISTEN mode, so it must not go back to the pool
+        raw.detach()
+        connection = raw.driver_connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(connection.fileno(), readable.set)
+        origin = process_origin()
+        try:
+            while not stop.is_set():
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(readable.wait(), 1)
+                readable.clear()
+                connection.poll()
+                while connection.notifies:
+                    message = json.loads(connection.notifies.pop(0).payload)
+                    if message["o"] != origin:
+                        receive(message["k"])
+        finally:
+            loop.remove_reader(connection.fileno())
+            raw.close()
+
+
+def create_bus(kind: str = INVALIDATION_BUS, database_url: Optional[str] = SQLALCHEMY_DATABASE_URL):
+    """
+    Returns the bus for INVALIDATION_BUS: "postgres", "memory" or "auto".
+    """
+    if kind == "auto":
+        kind = "postgres" if (database_url or "").startswith("postgresql") else "memory"
+    if kind == "memory":
+        return MemoryBus()
+    if kind == "postgres":
+        from pymasters.database.db import get_engine
+        return PostgresBus(get_engine())
+    raise ValueError(f"Unsupported invalidation bus: {kind}")
+
+
+@lru_cache(maxsize=None)
+def get_bus():
+    """
+    Returns the application's bus.
+    """
+    return create_bus()
+
+
+invalidator = Invalidator()
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_in_transaction(session: Session):
+    keys = session.info.get(PENDING)
+    if keys and get_bus().transactional:
+        get_bus().publish(keys, session.connection())
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    keys = session.info.pop(PENDING, None)
+    if keys:
+        invalidator.apply(keys)
+        if not get_bus().transactional:
+            get_bus().publish(keys, sender=invalidator.receive)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_on_rollback(session: Session, previous_transaction):
+    # A rolled back savepoint leaves the keys of the enclosing transaction pending
+    if not previous_transaction.nested:
+        session.info.pop(PENDING, None)
@@ -0,0 +1,68 @@
+"""
+Local filesystem stand-in for Cloudinary.
+
+With STORAGE_BACKEND=local, `cloudinary_service` stores uploads as files in
+STORAGE_LOCAL_DIR instead of calling Cloudinary. The functions mirror the
+Cloudinary calls the application makes (`uploader.upload`, `uploader.destroy`,
+`api.delete_resources`) and return responses of the same shape, and the URLs
+follow Cloudinary's `.../upload/<public id>` layout, so transformation
+URLs and public ID parsing work unchanged. Intended for development and load
+tests; files are not served by the application, but direct uploads (see
+`services.direct_upload`) are received at STORAGE_LOCAL_URL by `routes.media`.
+"""
+import os
+import re
+import uuid
+from typing import Dict, List, Optional
+
+from pymasters.settings import STORAGE_LOCAL_DIR, STORAGE_LOCAL_URL
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def _path(public_id: str) -> str:
+    return os.path.join(STORAGE_LOCAL_DIR, public_id)
+
+
+def safe_public_id(public_id: Optional[str]) -> str:
+    """
+    Returns a public ID usable as a file name (Cloudinary accepts e.g. URLs as IDs).
+    """
+    return _UNSAFE.sub("_", public_id) if public_id else uuid.uuid4().hex
+
+
+def url(public_id: str) -> str:
+    return f"{STORAGE_LOCAL_URL.rstrip('/')}/{public_id}"
+
+
+def upload(file, public_id: Optional[str] = None) -> Dict[str, str]:
+    """
+    Stores a file-like object (or the file at a path) and returns `{"public_id", "url"}`.
+    """
+    public_id = safe_public_id(public_id)
+    os.makedirs(STORAGE_LOCAL_DIR, exist_ok=True)
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            data = f.read()
+    else:
+        data = file.read()
+    with open(_path(public_id), "wb") as f:
+        f.write(data)
+    return {"public_id": public_id, "url": url(public_id)}
+
+
+def exists(public_id: str) -> bool:
+    return os.path.isfile(_path(safe_public_id(public_id)))
+
+
+def destroy(public_id: str) -> Dict[str, str]:
+    try:
+        os.remove(_path(safe_public_id(public_id)))
+        return {"result": "ok"}
+    except FileNotFoundError:
+        return {"result": "not found"}
+
+
+def delete_resources(public_ids: List[str], invalidate: bool = False) -> Dict[str, Dict[str, str]]:
+    return {"deleted": {public_id: "deleted" if destroy(public_id)["result"] == "ok" else "not_found"
+                        for public_id in public_ids}}
@@ -0,0 +1,335 @@
+"""
+Pooled, batched SMTP delivery.
+
+`FastMail.send_message` opens (and TLS-negotiates) a new SMTP connection for
+every email. The dispatcher instead keeps a small pool of authenticated
+connections alive and feeds them from an in-process queue: each worker takes
+up to MAIL_BATCH_SIZE queued messages at once and sends them over one pooled
+connection. Sends are throttled by a token bucket shared by everything that
+talks to the same SMTP server, so bursts of signups stay under the provider's
+rate limit.
+
+The application enables the dispatcher on startup (see MAIL_POOL_SIZE) and it
+is started with the first email sent; when it is not running,
+`services.email.send_email` falls back to FastMail. aiosmtplib and fastapi-mail
+are imported on first use, so they do not slow down the application's start.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from email.message import Message
+
+from pymasters.settings import get_mail_config, MAIL_POOL_SIZE, MAIL_BATCH_SIZE, MAIL_RATE_LIMIT
+
+if TYPE_CHECKING:
+    from aiosmtplib import SMTP
+    from fastapi_mail import ConnectionConfig, MessageSchema
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Asynchronous token bucket allowing `rate` sends per second with bursts of up to `burst`.
+
+    A rate of 0 disables throttling.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+_rate_limiters: Dict[Tuple[str, int], RateLimiter] = {}
+
+
+def rate_limiter_for(config: ConnectionConfig, rate: float = MAIL_RATE_LIMIT) -> RateLimiter:
+    """
+    Returns the rate limiter shared by all dispatchers sending through the same SMTP server.
+    """
+    key = (config.MAIL_SERVER, config.MAIL_PORT)
+    if key not in _rate_limiters:
+        _rate_limiters[key] = RateLimiter(rate)
+    return _rate_limiters[key]
+
+
+class SMTPConnectionPool:
+    """
+    Keeps up to `size` authenticated SMTP connections open for reuse.
+
+    Connections are opened lazily, handed out by `connection()` and returned to
+    the pool afterwards; a connection that failed is closed instead of reused.
+    """
+
+    def __init__(self, config: Optional[ConnectionConfig] = None, size: int = MAIL_POOL_SIZE):
+        self.config = config or get_mail_config()
+        self.size = max(1, size)
+        self.connects = 0
+        self._idle: List[SMTP] = []
+        self._slots = asyncio.Semaphore(self.size)
+
+    async def _connect(self) -> SMTP:
+        from aiosmtplib import SMTP
+
+        smtp = SMTP(
+            hostname=self.config.MAIL_SERVER,
+            port=self.config.MAIL_PORT,
+            timeout=self.config.TIMEOUT,
+            use_tls=self.config.MAIL_SSL_TLS,
+            start_tls=self.config.MAIL_STARTTLS,
+            validate_certs=self.config.VALIDATE_CERTS,
+        )
+        await smtp.connect()
+        if self.config.USE_CREDENTIALS:
+            # a plain str in fastapi-mail 1.4, a SecretStr in later releases
+            password = self.config.MAIL_PASSWORD
+            await smtp.login(self.config.MAIL_USERNAME, getattr(password, "get_secret_value", lambda: password)())
+        self.connects += 1
+        return smtp
+
+    async def _checkout(self) -> SMTP:
+        while self._idle:
+            smtp = self._idle.pop()
+            if smtp.is_connected:
+                return smtp
+        return await self._connect()
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._slots:
+            smtp = await self._checkout()
+            try:
+                yield smtp
+            except BaseException:
+                await self._discard(smtp)
+                raise
+            self._idle.append(smtp)
+
+    async def _discard(self, smtp: SMTP):
+        if smtp.is_connected:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for smtp in idle:
+            await self._discard(smtp)
+
+
+async def build_message(message: MessageSchema, template_name: Optional[str] = None,
+                        config: Optional[ConnectionConfig] = None) -> Message:
+    """
+    Renders a MessageSchema into a MIME message.
+
+    Args:
+        message (MessageSchema): The message to render.
+        template_name (Optional[str]): Precompiled template rendered with `template_body`.
+        config (Optional[ConnectionConfig]): The mail configuration; the application's by default.
+
+    Returns:
+        Message: The message ready to be sent.
+    """
+    from fastapi_mail.msg import MailMsg
+    from pymasters.services.templates import render_message
+
+    config = config or get_mail_config()
+    if template_name:
+        message = render_message(message, template_name)
+    sender = f"{config.MAIL_FROM_NAME} <{config.MAIL_FROM}>" if config.MAIL_FROM_NAME else config.MAIL_FROM
+    return await MailMsg(message)._message(sender)
+
+
+class MailDispatcher:
+    """
+    Sends queued emails in batches over a pool of persistent SMTP connections.
+
+    Args:
+        config (Optional[ConnectionConfig]): The mail configuration; the application's by default.
+        pool_size (int): Number of SMTP connections, and of workers sending over them.
+        batch_size (int): Maximum number of messages sent per connection checkout.
+        rate_limiter (Optional[RateLimiter]): Throttle for the SMTP server; shared per server by default.
+    """
+
+    def __init__(self, config: Optional[ConnectionConfig] = None, pool_size: int = MAIL_POOL_SIZE,
+                 batch_size: int = MAIL_BATCH_SIZE, rate_limiter: Optional[RateLimiter] = None):
+        self.config = config or get_mail_config()
+        self.pool = SMTPConnectionPool(self.config, pool_size)
+        self.batch_size = max(1, batch_size)
+        self.rate_limiter = rate_limiter or rate_limiter_for(self.config)
+        self.sent = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.pool.size)]
+
+    async def stop(self, timeout: Optional[float] = 30):
+        """
+        Waits up to `timeout` seconds for queued messages to be sent, then stops the workers
+        and closes the pooled connections.
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Mail dispatcher stopped with {self._queue.qsize()} unsent messages")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.pool.close()
+
+    async def submit(self, message: Union[MessageSchema, Message], template_name: Optional[str] = None) -> asyncio.Future:
+        """
+        Queues a message and returns a future resolved once it has been sent.
+        """
+        if not self.running:
+            raise RuntimeError("Mail dispatcher is not running")
+        if not isinstance(message, Message):
+            message = await build_message(message, template_name, self.config)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((message, future))
+        return future
+
+    async def send(self, message: Union[MessageSchema, Message], template_name: Optional[str] = None):
+        """
+        Queues a message and waits until it has been sent.
+
+        Raises:
+            Exception: The SMTP error the message failed with.
+        """
+        await (await self.submit(message, template_name))
+
+    async def _next_batch(self) -> List[Tuple[Message, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _send_batch(self, batch: List[Tuple[Message, asyncio.Future]]):
+        from aiosmtplib import SMTPRecipientsRefused, SMTPResponseException, SMTPServerDisconnected
+        from fastapi_mail.fastmail import email_dispatched
+
+        pending = list(batch)
+        for attempt in range(2):
+            try:
+                async with self.pool.connection() as smtp:
+                    while pending:
+                        message, future = pending[0]
+                        await self.rate_limiter.acquire()
+                        try:
+                            if not self.config.SUPPRESS_SEND:
+                                await smtp.send_message(message)
+                        except (SMTPResponseException, SMTPRecipientsRefused) as err:
+                            # Rejected by the server (e.g. a refused recipient): the connection stays usable
+                            pending.pop(0)
+                            self._fail(message, future, err)
+                            continue
+                        email_dispatched.send(message)
+                        self.sent += 1
+                        pending.pop(0)
+                        if not future.done():
+                            future.set_result(None)
+                return
+            except SMTPServerDisconnected as err:
+                # The server dropped an idle pooled connection: retry the rest once on a fresh one
+                if attempt:
+                    error = err
+            except Exception as err:
+                error = err
+                break
+        for message, future in pending:
+            self._fail(message, future, error)
+
+    def _fail(self, message: Message, future: asyncio.Future, error: Exception):
+        self.failed += 1
+        logger.error(f"Failed to send email to {message['To']}: {error}")
+        if not future.done():
+            future.set_exception(error)
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._send_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+dispatcher: Optional[MailDispatcher] = None
+_autostart = False
+
+
+async def start_dispatcher() -> Optional[MailDispatcher]:
+    """
+    Starts the application-wide dispatcher unless pooling is disabled (MAIL_POOL_SIZE 0).
+    """
+    global dispatcher
+    if MAIL_POOL_SIZE <= 0:
+        return None
+    dispatcher = MailDispatcher()
+    await dispatcher.start()
+    return dispatcher
+
+
+def enable_dispatcher():
+    """
+    Lets `app_dispatcher` start the application-wide dispatcher when the first email is sent.
+    """
+    global _autostart
+    _autostart = True
+
+
+async def app_dispatcher() -> Optional[MailDispatcher]:
+    """
+    Returns the running application-wide dispatcher, starting it if it has been enabled.
+
+    Returns:
+        Optional[MailDispatcher]: The dispatcher, or None if it is neither running nor enabled.
+    """
+    if dispatcher and dispatcher.running:
+        return dispatcher
+    if _autostart:
+        return await start_dispatcher()
+    return None
+
+
+async def stop_dispatcher():
+    global dispatcher, _autostart
+    _autostart = False
+    if dispatcher:
+        await dispatcher.stop()
+        dispatcher = None
@@ -0,0 +1,236 @@
+"""
+Request rate limiting with token buckets.
+
+Each limited endpoint has a bucket per client (the user ID for authenticated
+endpoints, the client IP otherwise) holding up to `burst` tokens that refill at
+`rate` tokens per second. A request takes one token; when the bucket is empty
+the route answers 429 with a `Retry-After` header.
+
+Limits are configured with RATE_LIMITS, e.g.
+    login=10/minute,signup=5/minute,upload=30/minute,transform=60/minute
+using the rate strings of the `limits` package (a limit of N per period is a
+bucket of N tokens refilled over the period).
+
+Buckets live in process memory by default. With several application nodes set
+RATE_LIMIT_STORAGE to a Redis URL: a bucket is then a Redis hash updated by one
+Lua script, so each check is a single round trip and is atomic across nodes.
+"""
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import limits
+from fastapi import Depends, HTTPException, Request, status
+
+from pymasters.repository.auth import Principal, get_current_principal
+from pymasters.settings import RATE_LIMITS, RATE_LIMIT_STORAGE
+
+
+@dataclass(frozen=True)
+class Limit:
+    """
+    A token bucket: `rate` tokens per second, up to `burst` tokens.
+    """
+    rate: float
+    burst: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        """
+        Parses a rate string such as "10/minute" or "100 per 2 hours".
+        """
+        item = limits.parse(value)
+        return cls(rate=item.amount / item.get_expiry(), burst=float(item.amount))
+
+
+def parse_limits(value: str) -> Dict[str, Limit]:
+    """
+    Parses RATE_LIMITS: comma-separated `name=rate` pairs.
+
+    Raises:
+        ValueError: If a pair is malformed.
+    """
+    parsed = {}
+    for pair in filter(None, (pair.strip() for pair in value.split(","))):
+        name, sep, rate = pair.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid rate limit {pair!r}, expected name=rate")
+        parsed[name.strip()] = Limit.parse(rate.strip())
+    return parsed
+
+
+class MemoryBucketStore:
+    """
+    Token buckets in process memory, for a single node.
+
+    A bucket is only `[tokens, updated]`; buckets that have refilled completely are
+    equivalent to missing ones and are swept when the store grows past `max_keys`.
+
+    Args:
+        max_keys (int): Number of buckets kept before full buckets are swept.
+        clock (Callable[[], float]): Monotonic clock in seconds.
+    """
+
+    def __init__(self, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: Dict[str, List[float]] = {}
+        self._limits: Dict[str, Limit] = {}
+
+    async def acquire(self, key: str, limit: Limit, cost: float = 1) -> Tuple[bool, float]:
+        """
+        Takes `cost` tokens from the bucket if it has them.
+
+        Returns:
+            Tuple[bool, float]: Whether the request is allowed, and otherwise the seconds
+            until enough tokens are available.
+        """
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self.sweep(now)
+            bucket = self._buckets[key] = [limit.burst, now]
+            self._limits[key] = limit
+        tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= cost:
+            bucket[0] = tokens - cost
+            return True, 0.0
+        bucket[0] = tokens
+        return False, (cost - tokens) / limit.rate
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Drops buckets that have refilled completely.
+
+        Returns:
+            int: The number of buckets dropped.
+        """
+        now = self.clock() if now is None else now
+        full = [key for key, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self._limits[key].rate >= self._limits[key].burst]
+        for key in full:
+            del self._buckets[key]
+            del self._limits[key]
+        return len(full)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# KEYS[1]: bucket; ARGV: rate, burst, cost. Returns {allowed, retry_after}; uses the Redis
+# server clock so nodes with skewed clocks share buckets correctly.
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed, retry_after = 0, (cost - tokens) / rate
+if tokens >= cost then
+    tokens, allowed, retry_after = tokens - cost, 1, 0
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisBucketStore:
+    """
+    Token buckets in Redis, shared by all application nodes.
+
+    Args:
+        client: A `redis.asyncio.Redis` client.
+        prefix (str): Key prefix of the buckets.
+    """
+
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisBucketStore":
+        """
+        Connects to Redis; requires the `redis` package.
+        """
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_STORAGE points to Redis but the redis package is not installed") from e
+        return cls(Redis.from_url(url), **kwargs)
+
+    async def acquire(self, key: str, limit: Limit, cost: float = 1) -> Tuple[bool, float]:
+        allowed, retry_after = await self._script(keys=[self.prefix + key], args=[limit.rate, limit.burst, cost])
+        return bool(allowed), float(retry_after)
+
+
+def create_store(url: str = RATE_LIMIT_STORAGE):
+    """
+    Returns the bucket store for RATE_LIMIT_STORAGE: "memory" or a redis:// URL.
+    """
+    if url in ("", "memory", "memory://"):
+        return MemoryBucketStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBucketStore.from_url(url)
+    raise ValueError(f"Unsupported rate limit storage: {url}")
+
+
+class RateLimiter:
+    """
+    Checks requests against the configured limits.
+
+    Args:
+        configured (Dict[str, Limit]): Limits by name; names without a limit are not limited.
+        store: A MemoryBucketStore or RedisBucketStore.
+    """
+
+    def __init__(self, configured: Dict[str, Limit], store=None):
+        self.limits = configured
+        self.store = store if store is not None else MemoryBucketStore()
+        self.enabled = True
+
+    async def check(self, name: str, key: str):
+        """
+        Takes a token for `key` from the bucket of limit `name`.
+
+        Raises:
+            HTTPException: 429 with a Retry-After header if the bucket is empty.
+        """
+        limit = self.limits.get(name)
+        if limit is None or not self.enabled:
+            return
+        allowed, retry_after = await self.store.acquire(f"{name}:{key}", limit)
+        if not allowed:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many requests",
+                                headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+limiter = RateLimiter(parse_limits(RATE_LIMITS), create_store())
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def limit_by_ip(name: str):
+    """
+    Returns a route dependency applying limit `name` per client IP.
+    """
+    async def dependency(request: Request):
+        await limiter.check(name, "ip:" + client_ip(request))
+    return dependency
+
+
+def limit_by_user(name: str):
+    """
+    Returns a route dependency applying limit `name` per authenticated user.
+    """
+    async def dependency(current_user: Principal = Depends(get_current_principal)):
+        await limiter.check(name, f"user:{current_user.id}")
+    return dependency
@@ -0,0 +1,212 @@
+"""
+Refresh token revocation for stateless refresh token families.
+
+Every login starts a token family (`fam` claim); every refresh token has its
+own `jti`. Refreshing rotates the token: the used `jti` is recorded in the
+`revoked_tokens` table and a new token of the same family is issued. Presenting
+a used token again means it was copied, so the whole family is revoked and the
+legitimate holder has to log in again.
+
+Validation is local: each process keeps the revoked ids in memory and syncs
+them from the database at most every TOKEN_REVOCATION_SYNC_INTERVAL seconds.
+A role change also publishes `revocations:role` on the invalidation bus, which
+makes every worker sync on its next request instead of within the interval.
+The only database writes are revocations; the unique `(kind, token_id)`
+constraint makes consuming a token atomic across processes, so a token can be
+rotated only once even when two refreshes race.
+"""
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from pymasters.database.dialects import insert_ignore
+from pymasters.database.models import RevokedToken
+from pymasters.services.invalidation import invalidator
+from pymasters.settings import TOKEN_REVOCATION_SYNC_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+JTI = "jti"
+FAMILY = "family"
+# "<user id>:<role version>" of tokens issued before a role change
+ROLE = "role"
+
+# Rows committed slightly out of order are picked up by re-reading this window on every sync
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class RevocationCache:
+    """
+    In-memory set of revoked refresh token ids and families, synced from `revoked_tokens`.
+
+    Args:
+        sync_interval (float): Minimum seconds between database syncs in `maybe_sync`.
+    """
+
+    def __init__(self, sync_interval: float = TOKEN_REVOCATION_SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self._revoked: Dict[str, Dict[str, datetime]] = {JTI: {}, FAMILY: {}, ROLE: {}}
+        self._synced_until: Optional[datetime] = None
+        self._last_sync = float("-inf")
+        self._lock = threading.Lock()
+
+    def is_revoked(self, kind: str, token_id: str) -> bool:
+        expires_at = self._revoked[kind].get(token_id)
+        return expires_at is not None and expires_at > datetime.utcnow()
+
+    def add(self, kind: str, token_id: str, expires_at: datetime):
+        self._revoked[kind][token_id] = expires_at
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._revoked.values())
+
+    def clear(self):
+        """
+        Forgets all revocations; the next sync reloads them from the database.
+        """
+        with self._lock:
+            for ids in self._revoked.values():
+                ids.clear()
+            self._synced_until = None
+            self._last_sync = float("-inf")
+
+    def expire(self):
+        """
+        Makes the next `maybe_sync` query the database.
+        """
+        self._last_sync = float("-inf")
+
+    def sync(self, db: Session) -> int:
+        """
+        Loads revocations recorded since the last sync and drops expired ones.
+
+        Returns:
+            int: The number of rows read.
+        """
+        now = datetime.utcnow()
+        stmt = select(RevokedToken.kind, RevokedToken.token_id, RevokedToken.expires_at).where(
+            RevokedToken.expires_at > now)
+        if self._synced_until is not None:
+            stmt = stmt.where(RevokedToken.revoked_at >= self._synced_until - SYNC_OVERLAP)
+        rows = db.execute(stmt).all()
+        with self._lock:
+            for kind, token_id, expires_at in rows:
+                if kind in self._revoked:
+                    self._revoked[kind][token_id] = expires_at
+            for ids in self._revoked.values():
+                for token_id in [token_id for token_id, expires_at in ids.items() if expires_at <= now]:
+                    del ids[token_id]
+            self._synced_until = now
+            self._last_sync = time.monotonic()
+        return len(rows)
+
+    def maybe_sync(self, db: Session) -> bool:
+        """
+        Syncs when the last sync is older than `sync_interval`.
+
+        Returns:
+            bool: Whether the database was queried.
+        """
+        if time.monotonic() - self._last_sync < self.sync_interval:
+            return False
+        self.sync(db)
+        return True
+
+
+revocations = RevocationCache()
+invalidator.register("revocations", lambda ids: revocations.expire())
+
+
+def revoke(db: Session, kind: str, token_id: str, expires_at: datetime, cache: RevocationCache = revocations) -> bool:
+    """
+    Records a revocation and commits it.
+
+    Args:
+        db (Session): The database session.
+        kind (str): JTI, FAMILY or ROLE.
+        token_id (str): The `jti` or `fam` claim.
+        expires_at (datetime): When the revoked tokens expire anyway (naive UTC).
+        cache (RevocationCache): The cache updated immediately.
+
+    Returns:
+        bool: True if this call revoked it, False if it was already revoked.
+    """
+    stmt = insert_ignore(RevokedToken.__table__, db.get_bind().dialect.name).values(
+        kind=kind, token_id=token_id, expires_at=expires_at, revoked_at=datetime.utcnow())
+    try:
+        inserted = db.execute(stmt).rowcount == 1
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        inserted = False
+    cache.add(kind, token_id, expires_at)
+    return inserted
+
+
+def consume_refresh_token(db: Session, jti: str, family: str, expires_at: datetime,
+                          family_lifetime: timedelta, cache: RevocationCache = revocations) -> bool:
+    """
+    Marks a refresh token as used so it can be rotated exactly once.
+
+    A token that was already used, or belongs to a revoked family, is rejected; reuse
+    of a used token also revokes its family.
+
+    Args:
+        db (Session): The database session.
+        jti (str): The `jti` claim of the presented token.
+        family (str): The `fam` claim of the presented token.
+        expires_at (datetime): The token's expiry (naive UTC).
+        family_lifetime (timedelta): Refresh token lifetime; tokens of a revoked family are
+            rejected for this long.
+        cache (RevocationCache): The revocation cache.
+
+    Returns:
+        bool: True if the token was valid and is now consumed.
+    """
+    cache.maybe_sync(db)
+    if cache.is_revoked(FAMILY, family):
+        return False
+    if cache.is_revoked(JTI, jti) or not revoke(db, JTI, jti, expires_at, cache):
+        logger.warning(f"Refresh token reuse detected, revoking token family {family}")
+        revoke(db, FAMILY, family, datetime.utcnow() + family_lifetime, cache)
+        return False
+    return True
+
+
+def purge_expired(db: Session) -> int:
+    """
+    Deletes revocations of tokens that have expired anyway.
+
+    Returns:
+        int: The number of rows deleted.
+    """
+    deleted = db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow())).rowcount
+    db.commit()
+    return deleted
+
+
+def main(argv=None):
+    from pymasters.database.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the refresh token revocation table.")
+    parser.add_argument("--purge", action="store_true", help="Delete revocations of expired tokens")
+    args = parser.parse_args(argv)
+
+    with SessionLocal() as db:
+        if args.purge:
+            print(f"Purged {purge_expired(db)} expired revocations")
+        else:
+            cache = RevocationCache()
+            cache.sync(db)
+            print(f"{len(cache)} active revocations")
+
+
+if __name__ == "__main__":
+    main()
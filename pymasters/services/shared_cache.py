@@ -0,0 +1,296 @@
+"""
+Shared-memory cache for all worker processes on a host.
+
+Per-process caches hold a copy of every hot object in each worker, and each
+worker warms its own copy. `SharedCache` keeps one copy in a memory-mapped
+file (in /dev/shm by default) that every worker maps, so the memory budget is
+paid once per host and an object loaded by one worker is a hit for all others.
+
+Layout: a fixed-size hash table of `sets` x WAYS slots of `slot_size` bytes.
+A key hashes to one set; a new entry takes a free or expired slot of that set,
+otherwise the least recently used one (set-associative LRU). Entries larger
+than a slot are not cached. The file never grows, so the memory used is the
+configured budget.
+
+Reads take no lock. Every slot starts with a sequence number that writers make
+odd while they change the slot and even again when done (a seqlock); a reader
+copies the slot and retries if the number was odd or changed meanwhile.
+Writers lock the set's byte range of the file with `fcntl.lockf`, which
+serializes them across processes.
+
+`clear()` bumps a generation number in the file header, which makes every
+slot of an older generation free, so it costs the same for any size. Values
+are pickled: the file is created with mode 0600 and must only be shared by
+processes of the same application.
+
+A file is never resized while in use, since processes that have it mapped
+would crash (SIGBUS) on the pages cut off. A process that finds a different
+layout builds a new file and renames it over the path; processes still on the
+old file keep using it until they exit. `create_cache` also names files by
+their layout, so workers of both layouts run side by side in a rolling deploy.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+MAGIC = b"PMSC"
+VERSION = 1
+WAYS = 8
+
+# magic, version, ways, sets, slot size, generation, invalidations
+HEADER = struct.Struct("<4sIIIII Q")
+HEADER_SIZE = 64
+GENERATION_OFFSET = 20
+INVALIDATIONS_OFFSET = 24
+
+# sequence, generation, key hash, last used (s), value length, key length, expires at (s)
+SLOT = struct.Struct("<IIQdIHxxd")
+SEQ = struct.Struct("<I")
+STAMP = struct.Struct("<d")
+STAMP_OFFSET = 16
+
+# Attempts to read a slot that writers keep changing before treating it as a miss
+READ_RETRIES = 3
+
+
+def table_sets(size_bytes: int, slot_size: int) -> int:
+    """
+    Returns the number of sets of WAYS slots that fit a memory budget after the header.
+    """
+    return (size_bytes - HEADER_SIZE) // (WAYS * slot_size)
+
+
+def key_hash(key: bytes) -> int:
+    """
+    Returns a non-zero 64-bit hash that is the same in every process (unlike `hash()`).
+    """
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+class SharedCache:
+    """
+    Cache in a memory-mapped file shared by processes; same interface as `LocalCache`.
+
+    Args:
+        path (str): The backing file; created, or replaced by a new file if its layout differs.
+        size_bytes (int): Memory budget of the table.
+        ttl (float): Seconds an entry is served.
+        slot_size (int): Bytes per entry, including the key and a 40 byte header.
+        dumps (Callable[[Any], bytes]): Serializer of values.
+        loads (Callable[[bytes], Any]): Deserializer of values.
+        clock (Callable[[], float]): Wall clock in seconds, shared by all processes.
+
+    Raises:
+        ValueError: If the budget does not hold one set of slots.
+    """
+
+    def __init__(self, path: str, size_bytes: int, ttl: float, slot_size: int = 2048,
+                 dumps: Callable[[Any], bytes] = lambda value: pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 loads: Callable[[bytes], Any] = pickle.loads, clock: Callable[[], float] = time.time):
+        self.sets = table_sets(size_bytes, slot_size)
+        if self.sets < 1 or slot_size <= SLOT.size:
+            raise ValueError(f"A shared cache of {size_bytes} bytes does not hold {WAYS} slots of {slot_size} bytes")
+        self.path = path
+        self.ttl = ttl
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT.size
+        self.dumps = dumps
+        self.loads = loads
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.oversized = 0
+        self._set_bytes = WAYS * slot_size
+        self._size = HEADER_SIZE + self.sets * self._set_bytes
+        self._lock = threading.Lock()
+        self._attach()
+
+    def _attach(self):
+        header = HEADER.pack(MAGIC, VERSION, WAYS, self.sets, self.slot_size, 0, 0)
+        while True:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            with self._locked(0, 0):  # the whole file, while checking or writing the layout
+                stat = os.fstat(self._fd)
+                if self._is_current(stat):
+                    if stat.st_size == 0:  # just created: not mapped by anyone yet
+                        self._format(self._fd, header)
+                    if os.pread(self._fd, HEADER.size, 0)[:20] == header[:20]:
+                        self._map = mmap.mmap(self._fd, self._size, mmap.MAP_SHARED,
+                                              mmap.PROT_READ | mmap.PROT_WRITE)
+                        return
+                    self._replace(header)
+            # Replaced by this or another process meanwhile: open the file now at the path
+            os.close(self._fd)
+
+    def _is_current(self, stat: os.stat_result) -> bool:
+        try:
+            return os.stat(self.path).st_ino == stat.st_ino
+        except FileNotFoundError:
+            return False
+
+    def _format(self, fd: int, header: bytes):
+        os.ftruncate(fd, self._size)
+        os.pwrite(fd, header, 0)
+
+    def _replace(self, header: bytes):
+        # Holding the lock of the old file, which processes attaching meanwhile wait for
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+        try:
+            self._format(fd, header)
+            os.replace(temp, self.path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def _locked(self, start: int, length: int):
+        # fcntl locks are held per process, so threads of one process also take the thread lock
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _generation(self) -> int:
+        return SEQ.unpack_from(self._map, GENERATION_OFFSET)[0]
+
+    def _set_offset(self, hashed: int) -> int:
+        return HEADER_SIZE + (hashed % self.sets) * self._set_bytes
+
+    def _encode_key(self, key: Hashable) -> bytes:
+        if isinstance(key, bytes):
+            return key
+        return key.encode() if isinstance(key, str) else pickle.dumps(key)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        encoded = self._encode_key(key)
+        hashed = key_hash(encoded)
+        base = self._set_offset(hashed)
+        generation = self._generation()
+        now = self.clock()
+        mapped = self._map
+        for way in range(WAYS):
+            offset = base + way * self.slot_size
+            for _ in range(READ_RETRIES):
+                seq, slot_generation, slot_hash, _, value_len, key_len, expires = SLOT.unpack_from(mapped, offset)
+                if seq & 1:
+                    continue
+                if slot_hash != hashed or slot_generation != generation:
+                    break
+                data = mapped[offset + SLOT.size:offset + SLOT.size + key_len + value_len]
+                if SEQ.unpack_from(mapped, offset)[0] != seq:
+                    continue
+                if data[:key_len] != encoded or expires <= now:
+                    break
+                # Unlocked: a lost update only makes the entry look a little older
+                STAMP.pack_into(mapped, offset + STAMP_OFFSET, now)
+                self.hits += 1
+                return self.loads(data[key_len:])
+        self.misses += 1
+        return None
+
+    def begin(self) -> int:
+        """
+        Returns a token for a `set()` after loading the value.
+        """
+        return struct.unpack_from("<Q", self._map, INVALIDATIONS_OFFSET)[0]
+
+    def set(self, key: Hashable, value: Any, token: Optional[int] = None):
+        """
+        Caches a value, unless any process invalidated the cache since `token` was taken.
+        """
+        encoded = self._encode_key(key)
+        payload = self.dumps(value)
+        if len(encoded) + len(payload) > self.capacity:
+            self.oversized += 1
+            return
+        hashed = key_hash(encoded)
+        base = self._set_offset(hashed)
+        with self._locked(base, self._set_bytes):
+            if token is not None and token != self.begin():
+                return
+            now = self.clock()
+            offset = self._choose_slot(base, hashed, encoded, now)
+            self._write(offset, hashed, encoded, payload, now)
+
+    def _choose_slot(self, base: int, hashed: int, encoded: bytes, now: float) -> int:
+        generation = self._generation()
+        oldest, oldest_stamp = base, None
+        free = None
+        for way in range(WAYS):
+            offset = base + way * self.slot_size
+            _, slot_generation, slot_hash, stamp, _, key_len, expires = SLOT.unpack_from(self._map, offset)
+            if slot_generation != generation or slot_hash == 0 or expires <= now:
+                if free is None:
+                    free = offset
+                continue
+            if slot_hash == hashed and self._map[offset + SLOT.size:offset + SLOT.size + key_len] == encoded:
+                return offset
+            if oldest_stamp is None or stamp < oldest_stamp:
+                oldest, oldest_stamp = offset, stamp
+        return free if free is not None else oldest
+
+    def _write(self, offset: int, hashed: int, encoded: bytes, payload: bytes, now: float):
+        seq = SEQ.unpack_from(self._map, offset)[0]
+        seq += seq & 1  # even, also if a writer died halfway
+        SEQ.pack_into(self._map, offset, (seq + 1) & 0xFFFFFFFF)
+        if hashed:
+            start = offset + SLOT.size
+            self._map[start:start + len(encoded) + len(payload)] = encoded + payload
+        SLOT.pack_into(self._map, offset, (seq + 1) & 0xFFFFFFFF, self._generation(), hashed, now,
+                       len(payload), len(encoded), now + self.ttl if hashed else 0.0)
+        SEQ.pack_into(self._map, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def _bump_invalidations(self):
+        with self._locked(INVALIDATIONS_OFFSET, 8):
+            count = self.begin()
+            struct.pack_into("<Q", self._map, INVALIDATIONS_OFFSET, (count + 1) & 0xFFFFFFFFFFFFFFFF)
+
+    def invalidate(self, keys: Optional[Iterable[Hashable]] = None):
+        """
+        Evicts `keys`, or every entry when `keys` is None, for all processes.
+        """
+        self._bump_invalidations()
+        if keys is None:
+            with self._locked(GENERATION_OFFSET, 4):
+                SEQ.pack_into(self._map, GENERATION_OFFSET, (self._generation() + 1) & 0xFFFFFFFF)
+            return
+        generation = self._generation()
+        for key in keys:
+            encoded = self._encode_key(key)
+            hashed = key_hash(encoded)
+            base = self._set_offset(hashed)
+            with self._locked(base, self._set_bytes):
+                for way in range(WAYS):
+                    offset = base + way * self.slot_size
+                    _, slot_generation, slot_hash, _, _, key_len, _ = SLOT.unpack_from(self._map, offset)
+                    start = offset + SLOT.size
+                    if (slot_hash == hashed and slot_generation == generation
+                            and self._map[start:start + key_len] == encoded):
+                        self._write(offset, 0, b"", b"", 0.0)
+
+    def clear(self):
+        self.invalidate()
+
+    def __len__(self) -> int:
+        generation, now = self._generation(), self.clock()
+        count = 0
+        for offset in range(HEADER_SIZE, self._size, self.slot_size):
+            _, slot_generation, slot_hash, _, _, _, expires = SLOT.unpack_from(self._map, offset)
+            count += slot_generation == generation and slot_hash != 0 and expires > now
+        return count
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
@@ -0,0 +1,228 @@
+"""
+Transactional outbox for storage deletions.
+
+Deleting a photo writes the public IDs of its storage assets to the
+`storage_deletions` table in the same transaction as the row deletion, so the
+request only waits for the database commit. A dispatcher drains the table in
+batches: rows are leased with `SELECT ... FOR UPDATE SKIP LOCKED` (so several
+workers can run side by side), deleted from Cloudinary in parallel batches and
+removed from the outbox; failures are retried with exponential backoff.
+Storage deletes are idempotent, so a retried or duplicated delete is harmless.
+
+Progress is logged per storage call and per batch, with the number of assets
+still queued, which is also the `pymasters_storage_outbox_pending` metric and
+the output of `--stats`.
+
+The dispatcher runs inside the application (see STORAGE_OUTBOX_INTERVAL) or as
+a separate process:
+    python -m pymasters.services.storage_outbox [--once] [--stats]
+"""
+import argparse
+import asyncio
+import json
+import logging
+from contextlib import suppress
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.orm import Session
+
+from pymasters.database.dialects import insert_ignore
+from pymasters.database.models import StorageDeletion
+from pymasters.metrics import storage_outbox_pending
+from pymasters.services.cloudinary_service import public_id_from_url, delete_resources_from_cloudinary
+from pymasters.settings import STORAGE_OUTBOX_INTERVAL, STORAGE_OUTBOX_BATCH_SIZE, STORAGE_OUTBOX_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed row stays invisible to other dispatchers before it is retried
+LEASE_SECONDS = 300
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 3600
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    """
+    Returns the delay before the next attempt after `attempts` failures.
+    """
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS))
+
+
+def enqueue_storage_deletions(db: Session, urls: Iterable[str]) -> int:
+    """
+    Queues storage assets for deletion in the caller's transaction.
+
+    The caller commits; assets already queued are skipped.
+
+    Args:
+        db (Session): The database session.
+        urls (Iterable[str]): URLs of the assets to delete.
+
+    Returns:
+        int: The number of distinct assets queued.
+    """
+    public_ids = list(dict.fromkeys(public_id_from_url(url) for url in urls if url))
+    if public_ids:
+        stmt = insert_ignore(StorageDeletion.__table__, db.get_bind().dialect.name)
+        db.execute(stmt, [{"public_id": public_id} for public_id in public_ids])
+    return len(public_ids)
+
+
+def claim_batch(db: Session, batch_size: int, max_attempts: int) -> List[Tuple[int, str, int]]:
+    """
+    Leases a batch of due outbox rows.
+
+    Args:
+        db (Session): The database session.
+        batch_size (int): Maximum number of rows to claim.
+        max_attempts (int): Rows that failed this many times are left for inspection.
+
+    Returns:
+        List[Tuple[int, str, int]]: `(id, public_id, attempts)` of the claimed rows.
+    """
+    now = datetime.utcnow()
+    rows = db.scalars(
+        select(StorageDeletion)
+        .where(StorageDeletion.next_attempt_at <= now, StorageDeletion.attempts < max_attempts)
+        .order_by(StorageDeletion.next_attempt_at, StorageDeletion.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    claimed = [(row.id, row.public_id, row.attempts) for row in rows]
+    for row in rows:
+        row.next_attempt_at = now + timedelta(seconds=LEASE_SECONDS)
+    db.commit()
+    return claimed
+
+
+def drain_once(db: Session, batch_size: int = STORAGE_OUTBOX_BATCH_SIZE,
+               max_attempts: int = STORAGE_OUTBOX_MAX_ATTEMPTS) -> Dict[str, int]:
+    """
+    Claims one batch, deletes its assets from storage and records the outcome.
+
+    Args:
+        db (Session): The database session.
+        batch_size (int): Maximum number of assets handled.
+        max_attempts (int): Attempts after which a row is no longer retried.
+
+    Returns:
+        Dict[str, int]: Numbers of "claimed", "deleted" and "failed" assets, and of assets
+        "remaining" in the outbox afterwards.
+    """
+    claimed = claim_batch(db, batch_size, max_attempts)
+    if not claimed:
+        remaining = _record_pending(db)
+        return {"claimed": 0, "deleted": 0, "failed": 0, "remaining": remaining}
+
+    def progress(done: int, total: int):
+        logger.info(f"Storage outbox: {done}/{total} assets of the batch processed")
+
+    result = delete_resources_from_cloudinary([public_id for _, public_id, _ in claimed], progress=progress)
+    failed = set(result["failed"])
+    errors = result.get("errors", {})
+
+    done_ids = [row_id for row_id, public_id, _ in claimed if public_id not in failed]
+    if done_ids:
+        db.execute(delete(StorageDeletion).where(StorageDeletion.id.in_(done_ids)))
+
+    now = datetime.utcnow()
+    for row_id, public_id, attempts in claimed:
+        if public_id in failed:
+            db.execute(
+                update(StorageDeletion)
+                .where(StorageDeletion.id == row_id)
+                .values(attempts=attempts + 1, next_attempt_at=now + backoff_delay(attempts + 1),
+                        last_error=errors.get(public_id, "Storage delete failed")[:255])
+            )
+    db.commit()
+
+    remaining = _record_pending(db)
+    logger.info(f"Storage outbox: deleted {len(done_ids)}, failed {len(failed)} of {len(claimed)} claimed, "
+                f"{remaining} remaining")
+    return {"claimed": len(claimed), "deleted": len(done_ids), "failed": len(failed), "remaining": remaining}
+
+
+def drain(db: Session, batch_size: int = STORAGE_OUTBOX_BATCH_SIZE,
+          max_attempts: int = STORAGE_OUTBOX_MAX_ATTEMPTS) -> Dict[str, int]:
+    """
+    Drains all due rows batch by batch.
+
+    Returns:
+        Dict[str, int]: Totals of "claimed", "deleted" and "failed" assets, and the assets
+        "remaining" in the outbox (not yet due, exhausted or leased by another dispatcher).
+    """
+    totals = {"claimed": 0, "deleted": 0, "failed": 0}
+    while True:
+        stats = drain_once(db, batch_size, max_attempts)
+        for key in totals:
+            totals[key] += stats[key]
+        if stats["claimed"] < batch_size:
+            return {**totals, "remaining": stats["remaining"]}
+
+
+def pending_count(db: Session) -> int:
+    """
+    Returns the number of assets still waiting in the outbox.
+    """
+    return db.execute(select(func.count()).select_from(StorageDeletion)).scalar()
+
+
+def _record_pending(db: Session) -> int:
+    remaining = pending_count(db)
+    storage_outbox_pending.set(value=remaining)
+    return remaining
+
+
+def _drain_with_new_session(batch_size: int, max_attempts: int) -> Dict[str, int]:
+    from pymasters.database.db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return drain(db, batch_size, max_attempts)
+    finally:
+        db.close()
+
+
+async def run_dispatcher(interval: float = STORAGE_OUTBOX_INTERVAL, batch_size: int = STORAGE_OUTBOX_BATCH_SIZE,
+                         max_attempts: int = STORAGE_OUTBOX_MAX_ATTEMPTS, stop: Optional[asyncio.Event] = None):
+    """
+    Drains the outbox every `interval` seconds until cancelled, or until `stop` is set
+    (finishing the drain in progress).
+
+    Database and storage calls run in a worker thread so the event loop is never blocked.
+    """
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            await asyncio.to_thread(_drain_with_new_session, batch_size, max_attempts)
+        except Exception as e:
+            logger.error(f"Storage outbox dispatcher error: {e}")
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(stop.wait(), interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drain the storage deletion outbox.")
+    parser.add_argument("--once", action="store_true", help="Drain due rows once and exit")
+    parser.add_argument("--stats", action="store_true", help="Print queue depth as JSON and exit")
+    parser.add_argument("--interval", type=float, default=STORAGE_OUTBOX_INTERVAL or 5, help="Seconds between drains")
+    parser.add_argument("--batch-size", type=int, default=STORAGE_OUTBOX_BATCH_SIZE, help="Assets per batch")
+    parser.add_argument("--max-attempts", type=int, default=STORAGE_OUTBOX_MAX_ATTEMPTS, help="Attempts per asset")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.stats:
+        from pymasters.database.db import SessionLocal
+
+        with SessionLocal() as db:
+            print(json.dumps({"pending": pending_count(db)}))
+        return
+    if args.once:
+        print(_drain_with_new_session(args.batch_size, args.max_attempts))
+    else:
+        asyncio.run(run_dispatcher(args.interval, args.batch_size, args.max_attempts))
+
+
+if __name__ == "__main__":
+    main()
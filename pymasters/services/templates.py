@@ -0,0 +1,136 @@
+"""
+Precompiled email templates.
+
+fastapi-mail builds a new Jinja environment and loads the template from disk
+for every message it sends. The template service loads and compiles every
+template in the templates folder once (at application startup), keeps the
+compiled templates in memory and never checks the files for changes again, so
+rendering a message is a plain function call. Compiled bytecode is also stored
+in a bytecode cache, which makes the startup compilation cheap for every worker
+process after the first one.
+
+A template `name.html` may have a plain-text alternate `name.txt`; messages
+rendered with `render_message` then carry both parts.
+"""
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Optional, Tuple, Union
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, select_autoescape
+
+from pymasters.settings import TEMPLATE_FOLDER, EMAIL_TEMPLATE_CACHE_DIR
+
+if TYPE_CHECKING:
+    from fastapi_mail import MessageSchema
+
+
+class TemplateService:
+    """
+    Renders templates from `folder`, compiled once and cached in memory.
+
+    Args:
+        folder (Union[str, Path]): The templates folder.
+        cache_dir (Optional[str]): Directory of the Jinja bytecode cache; the system temp dir by default.
+    """
+
+    def __init__(self, folder: Union[str, Path], cache_dir: Optional[str] = None):
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.env = Environment(
+            loader=FileSystemLoader(str(folder)),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,
+            cache_size=-1,
+        )
+        self._templates: Dict[str, Template] = {}
+        # Names of the templates in the folder, listed once like the templates are compiled once
+        self._listed: Optional[FrozenSet[str]] = None
+
+    def load(self) -> "TemplateService":
+        """
+        Compiles every template in the folder.
+        """
+        for name in self.listed():
+            self._templates[name] = self.env.get_template(name)
+        return self
+
+    def listed(self) -> FrozenSet[str]:
+        """
+        Returns the names of the templates in the folder, listing it on first use only.
+        """
+        if self._listed is None:
+            self._listed = frozenset(self.env.list_templates())
+        return self._listed
+
+    @property
+    def names(self):
+        return sorted(self._templates)
+
+    def get(self, name: str) -> Template:
+        template = self._templates.get(name)
+        if template is None:
+            template = self._templates[name] = self.env.get_template(name)
+        return template
+
+    def render(self, name: str, context: Optional[Dict[str, Any]] = None) -> str:
+        return self.get(name).render(context or {})
+
+    def text_alternate(self, name: str) -> Optional[str]:
+        """
+        Returns the name of the plain-text alternate of an HTML template, if there is one.
+        """
+        stem, ext = os.path.splitext(name)
+        alternate = f"{stem}.txt"
+        if ext == ".txt" or (alternate not in self._templates and alternate not in self.listed()):
+            return None
+        return alternate
+
+    def render_pair(self, name: str, context: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[str]]:
+        """
+        Renders a template and its plain-text alternate.
+
+        Returns:
+            Tuple[str, Optional[str]]: The rendered template, and the rendered alternate or None.
+        """
+        alternate = self.text_alternate(name)
+        return self.render(name, context), self.render(alternate, context) if alternate else None
+
+
+@lru_cache(maxsize=None)
+def get_template_service() -> TemplateService:
+    """
+    Returns the application's template service, compiling all templates on first use.
+    """
+    return TemplateService(TEMPLATE_FOLDER, EMAIL_TEMPLATE_CACHE_DIR).load()
+
+
+def render_message(message: MessageSchema, template_name: str,
+                   templates: Optional[TemplateService] = None) -> MessageSchema:
+    """
+    Renders `template_body` of a message with a precompiled template.
+
+    Args:
+        message (MessageSchema): The message; `template_body` holds the template context.
+        template_name (str): The template to render.
+        templates (Optional[TemplateService]): The template service; the application's by default.
+
+    Returns:
+        MessageSchema: A copy of the message with the rendered body in `template_body` and the
+        plain-text alternate, if the template has one, in `alternative_body`. It can be sent
+        without a template name.
+    """
+    from fastapi_mail.schemas import MultipartSubtypeEnum
+
+    templates = templates or get_template_service()
+    context = message.template_body
+    if isinstance(context, list):
+        context = {"body": context}
+    body, text = templates.render_pair(template_name, context)
+    update = {"template_body": body}
+    if text is not None:
+        update.update(alternative_body=text, multipart_subtype=MultipartSubtypeEnum.alternative)
+    return message.model_copy(update=update)
@@ -0,0 +1,217 @@
+"""
+JWT encoding and verification with prepared keys.
+
+`jwt.encode/decode` from python-jose turn the raw key into a key object on every
+call. `TokenCodec` builds the signing and verification keys once and keeps a
+small cache of verified claims, so the same token presented several times in a
+burst (parallel requests of one page load) is verified once. With
+SHARED_CACHE_MB set the claims are cached in shared memory instead, so a token
+verified by one worker is not verified again by the others.
+
+Besides HMAC (HS256/384/512, signed and verified with SECRET_KEY), asymmetric
+algorithms are supported so other services can verify tokens with the public
+key only: RS256/384/512, ES256/384/512 and EdDSA (Ed25519). python-jose has no
+EdDSA support, so an Ed25519 key class backed by `cryptography` is registered
+with it here.
+
+Asymmetric keys are configured with JWT_PRIVATE_KEY / JWT_PUBLIC_KEY, each a PEM
+string or the path of a PEM file.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Optional, Union
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+from jose.exceptions import JWKError
+
+from pymasters.metrics import token_decode_latency
+from pymasters.settings import (SECRET_KEY, ALGORITHM, JWT_PRIVATE_KEY, JWT_PUBLIC_KEY,
+                                TOKEN_CLAIMS_CACHE_SIZE, TOKEN_CLAIMS_CACHE_TTL, SHARED_CACHE_MB)
+
+EDDSA = "EdDSA"
+
+
+class Ed25519Key(Key):
+    """
+    python-jose key for the EdDSA algorithm with Ed25519 keys.
+    """
+
+    def __init__(self, key: Union[str, bytes, Ed25519PrivateKey, Ed25519PublicKey], algorithm: str):
+        if algorithm != EDDSA:
+            raise JWKError(f"Ed25519 keys only support {EDDSA}, not {algorithm}")
+        if isinstance(key, str):
+            key = key.encode()
+        if isinstance(key, bytes):
+            if b"PRIVATE" in key:
+                key = serialization.load_pem_private_key(key, password=None)
+            else:
+                key = serialization.load_pem_public_key(key)
+        if not isinstance(key, (Ed25519PrivateKey, Ed25519PublicKey)):
+            raise JWKError("Not an Ed25519 key")
+        self._key = key
+
+    def sign(self, msg: bytes) -> bytes:
+        if not isinstance(self._key, Ed25519PrivateKey):
+            raise JWKError("A private key is required to sign")
+        return self._key.sign(msg)
+
+    def verify(self, msg: bytes, sig: bytes) -> bool:
+        public_key = self._key.public_key() if isinstance(self._key, Ed25519PrivateKey) else self._key
+        try:
+            public_key.verify(sig, msg)
+            return True
+        except InvalidSignature:
+            return False
+
+    def public_key(self) -> "Ed25519Key":
+        if isinstance(self._key, Ed25519PublicKey):
+            return self
+        return Ed25519Key(self._key.public_key(), EDDSA)
+
+    def to_pem(self) -> bytes:
+        if isinstance(self._key, Ed25519PrivateKey):
+            return self._key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption())
+        return self._key.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+
+jwk.register_key(EDDSA, Ed25519Key)
+
+
+def load_pem(value: Optional[str]) -> Optional[str]:
+    """
+    Returns PEM key material given either the PEM itself or the path of a PEM file.
+    """
+    if value and "-----BEGIN" not in value and os.path.isfile(value):
+        with open(value) as f:
+            return f.read()
+    return value
+
+
+class TokenCodec:
+    """
+    Encodes and verifies JWTs with keys prepared once.
+
+    Args:
+        algorithm (str): The JWS algorithm, e.g. HS256, RS256, ES256 or EdDSA.
+        secret_key (Optional[str]): The shared secret for HS* algorithms.
+        private_key (Optional[str]): PEM private key for asymmetric algorithms; without it the
+            codec can only verify.
+        public_key (Optional[str]): PEM public key; derived from the private key if not given.
+        cache_size (int): Maximum number of verified tokens cached; 0 disables the cache.
+        cache_ttl (float): Seconds a verified token is served from the cache.
+        shared_cache (Optional[Any]): A `SharedCache` replacing the per-process cache; its TTL applies.
+    """
+
+    def __init__(self, algorithm: str = ALGORITHM, secret_key: Optional[str] = SECRET_KEY,
+                 private_key: Optional[str] = None, public_key: Optional[str] = None,
+                 cache_size: int = TOKEN_CLAIMS_CACHE_SIZE, cache_ttl: float = TOKEN_CLAIMS_CACHE_TTL,
+                 shared_cache: Optional[Any] = None):
+        self.algorithm = algorithm
+        if algorithm.startswith("HS"):
+            if not secret_key:
+                raise ValueError(f"{algorithm} requires a secret key")
+            self._signing_key = self._verifying_key = jwk.construct(secret_key, algorithm)
+        else:
+            self._signing_key = jwk.construct(private_key, algorithm) if private_key else None
+            if public_key:
+                self._verifying_key = jwk.construct(public_key, algorithm)
+            elif self._signing_key is not None:
+                self._verifying_key = self._signing_key.public_key()
+            else:
+                raise ValueError(f"{algorithm} requires a private or public key")
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.shared_cache = shared_cache
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def can_sign(self) -> bool:
+        return self._signing_key is not None
+
+    def encode(self, claims: dict) -> str:
+        """
+        Signs the claims.
+
+        Raises:
+            JWTError: If the codec only has a public key.
+        """
+        if self._signing_key is None:
+            raise JWTError("No private key configured for signing")
+        return jwt.encode(claims, self._signing_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        """
+        Verifies a token and returns a copy of its claims.
+
+        Tokens verified within the last `cache_ttl` seconds are served from the cache, as
+        long as they have not expired.
+
+        Raises:
+            JWTError: If the token is invalid or expired.
+        """
+        start = time.perf_counter()
+        try:
+            return self._decode(token)
+        finally:
+            token_decode_latency.observe(time.perf_counter() - start)
+
+    def _decode(self, token: str) -> dict:
+        now = time.time()
+        if self.shared_cache is not None:
+            return self._decode_shared(token, now)
+        if self.cache_size:
+            with self._lock:
+                cached = self._cache.get(token)
+            if cached is not None:
+                claims, verified_at = cached
+                exp = claims.get("exp")
+                if now - verified_at < self.cache_ttl and (exp is None or exp > now):
+                    return dict(claims)
+
+        claims = jwt.decode(token, self._verifying_key, algorithms=[self.algorithm])
+        if self.cache_size:
+            with self._lock:
+                self._cache[token] = (claims, now)
+                self._cache.move_to_end(token)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return dict(claims)
+
+    def _decode_shared(self, token: str, now: float) -> dict:
+        # Keyed by digest: the slots stay small and the file holds no usable tokens
+        key = hashlib.sha256(token.encode()).digest()
+        claims = self.shared_cache.get(key)
+        if claims is not None and (claims.get("exp") is None or claims["exp"] > now):
+            return claims  # unpickled, so already a copy
+        claims = jwt.decode(token, self._verifying_key, algorithms=[self.algorithm])
+        self.shared_cache.set(key, claims)
+        return dict(claims)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+        if self.shared_cache is not None:
+            self.shared_cache.clear()
+
+
+@lru_cache(maxsize=None)
+def get_token_codec() -> TokenCodec:
+    """
+    Returns the application's codec, configured from the settings.
+    """
+    shared_cache = None
+    if SHARED_CACHE_MB > 0 and TOKEN_CLAIMS_CACHE_SIZE:
+        from pymasters.services.cache import create_cache
+        shared_cache = create_cache("claims", TOKEN_CLAIMS_CACHE_SIZE, TOKEN_CLAIMS_CACHE_TTL)
+    return TokenCodec(ALGORITHM, SECRET_KEY, load_pem(JWT_PRIVATE_KEY), load_pem(JWT_PUBLIC_KEY),
+                      shared_cache=shared_cache)
@@ -1,29 +1,143 @@
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 from fastapi.security import OAuth2PasswordBearer
-from fastapi_mail import ConnectionConfig
 from pathlib import Path
 
-# Load environment variables from .env file
+# Load environment variables from .env file; the only place that does, every module reads
+# its settings from here
 load_dotenv()
 
 # Retrieve environment variables
 SQLALCHEMY_DATABASE_URL = os.getenv('SQLALCHEMY_DATABASE_URL')
+# Read replicas for @replica_reads routes (comma separated URLs; none sends every query to the primary),
+# chosen "round_robin" or "least_busy". A replica more than REPLICA_MAX_LAG seconds behind (checked every
+# REPLICA_LAG_CHECK_INTERVAL seconds) or failing (skipped for REPLICA_RETRY_SECONDS) is bypassed, and a
+# client that wrote reads from the primary for REPLICA_PIN_SECONDS
+SQLALCHEMY_REPLICA_URLS = [url.strip() for url in os.getenv('SQLALCHEMY_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_SELECTION = os.getenv('REPLICA_SELECTION', 'round_robin').lower()
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '5'))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', '5'))
+REPLICA_RETRY_SECONDS = float(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+REPLICA_PIN_SECONDS = float(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
 SECRET_KEY = os.getenv('SECRET_KEY')
 ALGORITHM = os.getenv('ALGORITHM')
 
+# PEM keys (or paths of PEM files) for asymmetric JWT algorithms (RS*/ES*/EdDSA)
+JWT_PRIVATE_KEY = os.getenv('JWT_PRIVATE_KEY')
+JWT_PUBLIC_KEY = os.getenv('JWT_PUBLIC_KEY')
+# Verified token claims cache (size 0 disables it)
+TOKEN_CLAIMS_CACHE_SIZE = int(os.getenv('TOKEN_CLAIMS_CACHE_SIZE', '1024'))
+TOKEN_CLAIMS_CACHE_TTL = float(os.getenv('TOKEN_CLAIMS_CACHE_TTL', '10'))
+
+# Seconds between syncs of the in-memory refresh token revocation cache with the database
+TOKEN_REVOCATION_SYNC_INTERVAL = float(os.getenv('TOKEN_REVOCATION_SYNC_INTERVAL', '30'))
+
+# Serialize responses with orjson / model_dump_json instead of jsonable_encoder
+FAST_JSON_RESPONSES = os.getenv('FAST_JSON_RESPONSES', 'false').lower() in ('1', 'true', 'yes')
+
+# Storage deletion outbox dispatcher (interval 0 disables the in-app dispatcher)
+STORAGE_OUTBOX_INTERVAL = float(os.getenv('STORAGE_OUTBOX_INTERVAL', '5'))
+STORAGE_OUTBOX_BATCH_SIZE = int(os.getenv('STORAGE_OUTBOX_BATCH_SIZE', '500'))
+STORAGE_OUTBOX_MAX_ATTEMPTS = int(os.getenv('STORAGE_OUTBOX_MAX_ATTEMPTS', '10'))
+
+# Image storage: "cloudinary", or "local" files in STORAGE_LOCAL_DIR (development and load tests);
+# STORAGE_LOCAL_URL must end in /upload like Cloudinary URLs
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'cloudinary').lower()
+STORAGE_LOCAL_DIR = os.getenv('STORAGE_LOCAL_DIR', 'media')
+STORAGE_LOCAL_URL = os.getenv('STORAGE_LOCAL_URL', 'http://localhost:8000/media/upload')
+# Seconds a direct upload ticket (POST /api/photos/upload/ticket) is valid for the upload and its finalize call
+UPLOAD_TICKET_TTL = int(os.getenv('UPLOAD_TICKET_TTL', '600'))
+
+# SMTP server and pooled mail dispatcher (MAIL_POOL_SIZE 0 sends every email on its own connection)
+MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.meta.ua')
+MAIL_PORT = int(os.getenv('MAIL_PORT', '465'))
+MAIL_SSL_TLS = os.getenv('MAIL_SSL_TLS', 'true').lower() in ('1', 'true', 'yes')
+MAIL_STARTTLS = os.getenv('MAIL_STARTTLS', 'false').lower() in ('1', 'true', 'yes')
+MAIL_POOL_SIZE = int(os.getenv('MAIL_POOL_SIZE', '2'))
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', '50'))
+MAIL_RATE_LIMIT = float(os.getenv('MAIL_RATE_LIMIT', '10'))
+
+# Jinja bytecode cache for the precompiled email templates (system temp dir when unset)
+EMAIL_TEMPLATE_CACHE_DIR = os.getenv('EMAIL_TEMPLATE_CACHE_DIR') or None
+
+# Email outbox worker (interval 0 disables the in-app worker)
+EMAIL_OUTBOX_INTERVAL = float(os.getenv('EMAIL_OUTBOX_INTERVAL', '2'))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', '100'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '8'))
+
+# Request, database and storage metrics served at /metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Per-route query budgets: "warn" logs requests over budget or repeating a statement
+# QUERY_REPEAT_THRESHOLD times (N+1); "off" only checks them in tests
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'off').lower()
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', '3'))
+
+# Token-bucket rate limits per endpoint ("name=rate", rates as in the `limits` package) and
+# their storage ("memory" for one node, a redis:// URL shared by all nodes)
+RATE_LIMITS = os.getenv('RATE_LIMITS', 'login=10/minute,signup=5/minute,upload=30/minute,transform=60/minute')
+RATE_LIMIT_STORAGE = os.getenv('RATE_LIMIT_STORAGE', 'memory')
+
+# Cross-worker cache invalidation: "postgres" (LISTEN/NOTIFY on INVALIDATION_CHANNEL), "memory" (one process)
+# or "auto" (postgres on a PostgreSQL database). Received keys are applied in batches every
+# INVALIDATION_BATCH_INTERVAL seconds; more than INVALIDATION_MAX_BATCH keys of one kind clear that cache instead
+INVALIDATION_BUS = os.getenv('INVALIDATION_BUS', 'auto').lower()
+INVALIDATION_CHANNEL = os.getenv('INVALIDATION_CHANNEL', 'pymasters_invalidation')
+INVALIDATION_BATCH_INTERVAL = float(os.getenv('INVALIDATION_BATCH_INTERVAL', '0.05'))
+INVALIDATION_MAX_BATCH = int(os.getenv('INVALIDATION_MAX_BATCH', '1000'))
+
+# Per-process cache of GET /api/photos/{photo_id} payloads (size 0 disables it)
+PHOTO_CACHE_SIZE = int(os.getenv('PHOTO_CACHE_SIZE', '1024'))
+PHOTO_CACHE_TTL = float(os.getenv('PHOTO_CACHE_TTL', '60'))
+
+# Shared-memory caches: SHARED_CACHE_MB > 0 keeps the photo and verified token claims caches in
+# memory-mapped files of that many MB each (in SHARED_CACHE_DIR, /dev/shm when available), shared by
+# all workers on the host, instead of per process; entries above SHARED_CACHE_SLOT_BYTES are not cached
+SHARED_CACHE_MB = float(os.getenv('SHARED_CACHE_MB', '0'))
+SHARED_CACHE_DIR = os.getenv('SHARED_CACHE_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else None)
+SHARED_CACHE_SLOT_BYTES = int(os.getenv('SHARED_CACHE_SLOT_BYTES', '2048'))
+
+# Production server (python -m pymasters.serve): worker processes (0 sizes them to the CPU cores),
+# requests after which a worker is replaced (plus a random jitter so they do not restart together),
+# and seconds a stopping worker gets for in-flight requests plus SHUTDOWN_DRAIN_TIMEOUT for the
+# background workers to finish their batch
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '0'))
+WORKER_MAX_REQUESTS = int(os.getenv('WORKER_MAX_REQUESTS', '10000'))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv('WORKER_MAX_REQUESTS_JITTER', '1000'))
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', '30'))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '10'))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/login")
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv('MAIL_USERNAME'),
-    MAIL_PASSWORD=os.getenv('MAIL_PASSWORD'),
-    MAIL_FROM=os.getenv('MAIL_FROM'),
-    MAIL_PORT=465,
-    MAIL_SERVER="smtp.meta.ua",
-    MAIL_FROM_NAME="PyMasters",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+
+
+@lru_cache(maxsize=None)
+def get_mail_config():
+    """
+    Returns the fastapi-mail ConnectionConfig, importing fastapi-mail on first use.
+    """
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=os.getenv('MAIL_USERNAME'),
+        MAIL_PASSWORD=os.getenv('MAIL_PASSWORD'),
+        MAIL_FROM=os.getenv('MAIL_FROM'),
+        MAIL_PORT=MAIL_PORT,
+        MAIL_SERVER=MAIL_SERVER,
+        MAIL_FROM_NAME="PyMasters",
+        MAIL_STARTTLS=MAIL_STARTTLS,
+        MAIL_SSL_TLS=MAIL_SSL_TLS,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=TEMPLATE_FOLDER,
+    )
+
+
+def __getattr__(name: str):
+    # `conf` is built on first access (e.g. `from pymasters.settings import conf`), not at import
+    if name == "conf":
+        return get_mail_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,9 +1,16 @@
+import hashlib
 import os
+import sqlite3
 import sys
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import tempfile
 from pathlib import Path
+
 import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateIndex, CreateTable
 
 # Add the path to the project's root directory
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -11,35 +18,97 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from pymasters.database.models import Base, User
 from pymasters.database.db import get_db
 from pymasters.repository.auth import Hash
-
-# Create test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-
-# Create a sessionmaker for the test database
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Override the get_db dependency to use the test database session
+from pymasters.services.cache import photo_cache
+from pymasters.services.revocations import revocations
+
+# bcrypt is slow on purpose; the minimum cost keeps the suite fast (hashes still verify the same way)
+Hash.pwd_context.update(bcrypt__rounds=4)
+
+
+def schema_template() -> str:
+    """
+    Returns the path of an SQLite file holding the empty schema.
+
+    The file is named after a hash of the schema's DDL, so it is built once per
+    schema version and then shared by later runs and parallel worker processes.
+    """
+    dialect = sqlite.dialect()
+    ddl = [str(CreateTable(table).compile(dialect=dialect)) for table in Base.metadata.sorted_tables]
+    ddl += sorted(str(CreateIndex(index).compile(dialect=dialect))
+                  for table in Base.metadata.sorted_tables for index in table.indexes)
+    digest = hashlib.sha256("\n".join(ddl).encode()).hexdigest()[:16]
+    path = os.path.join(tempfile.gettempdir(), f"pymasters-test-schema-{digest}.db")
+    if not os.path.exists(path):
+        building = f"{path}.{os.getpid()}"
+        template_engine = create_engine(f"sqlite:///{building}")
+        Base.metadata.create_all(bind=template_engine)
+        template_engine.dispose()
+        os.replace(building, path)  # atomic, so concurrent workers never see a half-built file
+    return path
+
+
+def create_test_engine():
+    """
+    Creates an engine on a private in-memory database copied from the schema template.
+
+    All sessions share the one connection (the TestClient serves requests from
+    another thread). pysqlite's own transaction handling is switched off, because
+    it does not let SAVEPOINTs nest inside the test's transaction; SQLAlchemy
+    emits BEGIN itself instead.
+    """
+    template = sqlite3.connect(schema_template())
+    memory = sqlite3.connect(":memory:", check_same_thread=False)
+    template.backup(memory)
+    template.close()
+    test_engine = create_engine("sqlite://", creator=lambda: memory, poolclass=StaticPool)
+
+    @event.listens_for(test_engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(test_engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return test_engine
+
+
+engine = create_test_engine()
+
+# Connection of the running test; its transaction is rolled back on teardown
+connection = None
+
+# Sessions join the test's transaction: commit() releases a SAVEPOINT instead of committing
+def make_session() -> Session:
+    return Session(bind=connection, autoflush=False, join_transaction_mode="create_savepoint")
+
+# Override the get_db dependency to use the test's connection
 def override_get_db():
+    db = make_session()
     try:
-        db = TestingSessionLocal()
         yield db
     finally:
         db.close()
 
-# Fixture for setting up the test database
-@pytest.fixture(scope="session", autouse=True)
-def setup_test_db():
-    # Create tables before starting the tests
-    Base.metadata.create_all(bind=engine)
-    yield
-    # Drop tables after completing the tests
-    Base.metadata.drop_all(bind=engine)
+# Fixture wrapping every test in a transaction that is rolled back afterwards
+@pytest.fixture(scope="function", autouse=True)
+def db_connection():
+    global connection
+    connection = engine.connect()
+    transaction = connection.begin()
+    try:
+        yield connection
+    finally:
+        transaction.rollback()
+        connection.close()
+        connection = None
+        # Rolled back IDs are reused by the next test, so cached rows must go too
+        photo_cache.clear()
 
 # Fixture to provide a test session
 @pytest.fixture(scope="function")
-def test_db():
-    db = TestingSessionLocal()
+def test_db(db_connection):
+    db = make_session()
     try:
         yield db
     finally:
@@ -48,10 +117,6 @@ def test_db():
 # Fixture to create a test user
 @pytest.fixture(scope="function")
 def test_user(test_db):
-    # Clear the users table before creating a new user
-    test_db.query(User).delete()
-    test_db.commit()
-
     hashed_password = Hash().get_password_hash("testpassword")
     user = User(email="test@example.com", password=hashed_password)
     test_db.add(user)
@@ -59,6 +124,13 @@ def test_user(test_db):
     test_db.refresh(user)
     return user
 
+# Fixture discarding the cached revocations a test recorded (e.g. by changing a user's role);
+# the rows themselves are rolled back with the test's transaction
+@pytest.fixture(scope="function")
+def clean_revocations():
+    yield
+    revocations.clear()
+
 # Fixture for the FastAPI client
 @pytest.fixture(scope="module")
 def client():
@@ -69,31 +141,3 @@ def client():
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as c:
         yield c
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,98 @@
+"""
+Minimal local SMTP server that accepts and counts every message, and the
+`ConnectionConfig` of a dispatcher talking to it.
+
+Used as an SMTP stand-in by the mail tests and benchmarks. `connect_delay`
+simulates the cost of the TCP + TLS handshake with a real provider, which is
+what connection pooling saves.
+"""
+import asyncio
+from typing import Iterable, List, Optional
+
+from fastapi_mail import ConnectionConfig
+
+from pymasters.settings import conf
+
+
+def local_config(port: int) -> ConnectionConfig:
+    return ConnectionConfig(
+        MAIL_USERNAME="bench",
+        MAIL_PASSWORD="bench",
+        MAIL_FROM="noreply@example.com",
+        MAIL_FROM_NAME="PyMasters",
+        MAIL_SERVER="127.0.0.1",
+        MAIL_PORT=port,
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=False,
+        VALIDATE_CERTS=False,
+        TEMPLATE_FOLDER=conf.TEMPLATE_FOLDER,
+    )
+
+
+class SMTPSink:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, connect_delay: float = 0.0,
+                 refused: Iterable[str] = ()):
+        self.host = host
+        self.port = port
+        self.connect_delay = connect_delay
+        # Recipients answered with "550 User unknown"
+        self.refused = {address.lower() for address in refused}
+        self.connections = 0
+        self.messages: List[bytes] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> "SMTPSink":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        if self.connect_delay:
+            await asyncio.sleep(self.connect_delay)
+
+        async def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 sink ESMTP")
+        try:
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip().upper()
+                if command.startswith("EHLO"):
+                    await reply("250-sink\r\n250-8BITMIME\r\n250-AUTH PLAIN LOGIN\r\n250 SMTPUTF8")
+                elif command.startswith("HELO"):
+                    await reply("250 sink")
+                elif command.startswith("AUTH"):
+                    await reply("235 2.7.0 Authentication successful")
+                elif command == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = []
+                    while (chunk := await reader.readline()) not in (b".\r\n", b""):
+                        data.append(chunk)
+                    self.messages.append(b"".join(data))
+                    await reply("250 OK")
+                elif command.startswith("RCPT TO:") and command[8:].strip(" <>").lower() in self.refused:
+                    await reply("550 5.1.1 User unknown")
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    # MAIL FROM, RCPT TO, RSET, NOOP
+                    await reply("250 OK")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
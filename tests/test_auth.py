@@ -3,8 +3,10 @@ from fastapi import HTTPException, status
 import pytest
 from pymasters.repository.auth import (
     Hash, create_access_token, create_refresh_token,
-    get_email_form_refresh_token, get_current_user, get_admin_user
+    get_email_form_refresh_token, get_current_user, get_admin_user,
+    get_current_principal, require_admin, user_claims
 )
+from pymasters.repository.users_repo import UserService
 from pymasters.settings import SECRET_KEY, ALGORITHM
 from pymasters.database.models import User
 
@@ -83,18 +85,30 @@ async def test_get_admin_user(test_user, test_db):
     assert excinfo.value.status_code == status.HTTP_403_FORBIDDEN
     assert excinfo.value.detail == "Operation not permitted"
 
+@pytest.mark.asyncio
+async def test_get_current_principal(test_user, test_db):
+    token = create_access_token(user_claims(test_user))
+    principal = await get_current_principal(token, db=test_db)
+    assert (principal.id, principal.email, principal.role) == (test_user.id, test_user.email, "user")
 
+    with pytest.raises(HTTPException) as excinfo:
+        await require_admin(principal)
+    assert excinfo.value.status_code == status.HTTP_403_FORBIDDEN
 
+    # Tokens without identity claims are rejected
+    with pytest.raises(HTTPException) as excinfo:
+        await get_current_principal(create_access_token({"sub": test_user.email}), db=test_db)
+    assert excinfo.value.status_code == status.HTTP_401_UNAUTHORIZED
 
+@pytest.mark.asyncio
+async def test_get_current_principal_outdated_role(test_user, test_db, clean_revocations):
+    token = create_access_token(user_claims(test_user))
+    UserService.change_role(test_user.id, "admin", test_db)
 
+    with pytest.raises(HTTPException) as excinfo:
+        await get_current_principal(token, db=test_db)
+    assert excinfo.value.status_code == status.HTTP_401_UNAUTHORIZED
+    assert excinfo.value.detail == "Role changed, refresh the token"
 
-
-
-
-
-
-
-
-
-
-
+    principal = await require_admin(await get_current_principal(create_access_token(user_claims(test_user)), db=test_db))
+    assert principal.role == "admin"
@@ -0,0 +1,51 @@
+from pymasters.services.cache import LocalCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = LocalCache(max_size=10, ttl=5, clock=clock)
+    cache.set("1", "photo")
+    assert cache.get("1") == "photo"
+    clock.now = 5
+    assert cache.get("1") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LocalCache(max_size=2, ttl=60)
+    cache.set("1", "a")
+    cache.set("2", "b")
+    cache.get("1")
+    cache.set("3", "c")
+    assert cache.get("2") is None
+    assert cache.get("1") == "a" and cache.get("3") == "c"
+
+def test_invalidate_keys_or_everything():
+    cache = LocalCache(max_size=10, ttl=60)
+    for key in "123":
+        cache.set(key, key)
+    cache.invalidate({"1"})
+    assert cache.get("1") is None and len(cache) == 2
+    cache.invalidate()
+    assert len(cache) == 0
+
+def test_set_after_invalidation_is_ignored():
+    cache = LocalCache(max_size=10, ttl=60)
+    token = cache.begin()
+    cache.invalidate({"1"})  # the row changed while it was being loaded
+    cache.set("1", "old", token)
+    assert cache.get("1") is None
+
+    cache.set("1", "new", cache.begin())
+    assert cache.get("1") == "new"
+
+def test_size_zero_disables_cache():
+    cache = LocalCache(max_size=0, ttl=60)
+    cache.set("1", "a")
+    assert cache.get("1") is None
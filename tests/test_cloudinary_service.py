@@ -4,7 +4,7 @@ import cloudinary.uploader
 from pymasters.services.cloudinary_service import upload_photo_to_cloudinary, delete_photo_from_cloudinary, create_transformation_urls, generate_qr_code
 import pytest
 from unittest.mock import patch
-from pymasters.services.cloudinary_service import transform_photo
+from pymasters.services.cloudinary_service import transform_photo, delete_resources_from_cloudinary, public_id_from_url
 
 @pytest.fixture(scope="module", autouse=True)
 def mock_cloudinary():
@@ -47,6 +47,30 @@ def test_generate_qr_code(mock_cloudinary):
         result = generate_qr_code("http://example.com")
         assert result == "http://example.com/qr_code.png"
 
+def test_public_id_from_url():
+    assert public_id_from_url("http://res.cloudinary.com/demo/image/upload/v1718/sample.jpg") == "sample"
+    assert public_id_from_url("http://res.cloudinary.com/demo/image/upload/v1718/folder/a.b.jpg") == "folder/a.b"
+    assert public_id_from_url("http://localhost:8000/media/upload/photo_1") == "photo_1"
+    qr_code_url = ("http://res.cloudinary.com/demo/image/upload/v2/"
+                   "http:/res.cloudinary.com/demo/image/upload/w_300,h_300,c_fill/v1/abc.jpg_qr_code.png")
+    assert public_id_from_url(qr_code_url) == \
+        "http:/res.cloudinary.com/demo/image/upload/w_300,h_300,c_fill/v1/abc.jpg_qr_code"
+
+def test_qr_code_public_id_is_not_the_photo_id():
+    photo_url = "http://res.cloudinary.com/demo/image/upload/v1/abc.jpg"
+    transformation_url = "http://res.cloudinary.com/demo/image/upload/w_300,h_300,c_fill/v1/abc.jpg"
+
+    def upload(file, public_id=None):
+        # Cloudinary returns the asset URL built from the public ID it was given
+        return {"url": f"http://res.cloudinary.com/demo/image/upload/v2/{public_id}.png"}
+
+    with patch('cloudinary.uploader.upload', side_effect=upload), \
+         patch('qrcode.image.pil.PilImage.save', new_callable=lambda: lambda *args, **kwargs: None):
+        qr_code_url = generate_qr_code(transformation_url)
+
+    assert public_id_from_url(qr_code_url) == f"{transformation_url}_qr_code"
+    assert public_id_from_url(qr_code_url) != public_id_from_url(photo_url)
+
 def test_transform_photo():
     photo_url = "http://res.cloudinary.com/demo/image/upload/sample.jpg"
     transformation = "width_300,height_300,c_fill"
@@ -72,3 +96,21 @@ def test_transform_photo():
         assert result["error"] == "Transformation not found"
 
 
+def test_delete_resources_from_cloudinary():
+    public_ids = [f"photo_{i}" for i in range(5)]
+    public_ids.append(public_ids[0])  # duplicates are deleted once
+    progress = []
+
+    with patch('cloudinary.api.delete_resources') as mock_delete_resources:
+        mock_delete_resources.return_value = {"deleted": {}}
+        result = delete_resources_from_cloudinary(public_ids, batch_size=2, progress=lambda done, total: progress.append((done, total)))
+
+    assert mock_delete_resources.call_count == 3
+    assert sorted(result["deleted"]) == [f"photo_{i}" for i in range(5)]
+    assert result["failed"] == []
+    assert progress[-1] == (5, 5)
+
+def test_delete_resources_from_cloudinary_failure():
+    with patch('cloudinary.api.delete_resources', side_effect=Exception("API error")):
+        result = delete_resources_from_cloudinary(["photo_1"])
+    assert result == {"deleted": [], "failed": ["photo_1"], "errors": {"photo_1": "API error"}}
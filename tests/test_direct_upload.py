@@ -0,0 +1,101 @@
+import cloudinary
+import cloudinary.utils
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from pymasters.database.models import Photos, User
+from pymasters.repository.auth import create_access_token, user_claims
+from pymasters.routes.media import router as media_router
+from pymasters.services import cloudinary_service, local_storage
+from pymasters.services.direct_upload import issue_ticket
+
+
+@pytest.fixture
+def headers(test_user: User):
+    return {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+
+@pytest.fixture
+def storage_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_storage, "STORAGE_LOCAL_DIR", str(tmp_path))
+    monkeypatch.setattr(local_storage, "STORAGE_LOCAL_URL", "http://localhost/media/upload")
+    monkeypatch.setattr(cloudinary_service, "STORAGE_BACKEND", "local")
+    return tmp_path
+
+def cloudinary_response(public_id: str, version: int = 1718000000) -> dict:
+    # The signed fields of Cloudinary's upload response
+    signature = cloudinary.utils.api_sign_request({"public_id": public_id, "version": version},
+                                                  cloudinary_service._cloudinary().config().api_secret)
+    return {"version": version, "signature": signature, "format": "jpg"}
+
+def test_ticket_carries_signed_cloudinary_params(client, headers):
+    ticket = client.post("/api/photos/upload/ticket", headers=headers).json()
+
+    assert ticket["method"] == "POST"
+    assert ticket["upload_url"].endswith("/image/upload")
+    fields = ticket["fields"]
+    assert fields["public_id"] == ticket["public_id"]
+    secret = cloudinary_service._cloudinary().config().api_secret
+    signed = {name: fields[name] for name in ("public_id", "timestamp", "overwrite", "invalidate")}
+    assert fields["signature"] == cloudinary.utils.api_sign_request(signed, secret)
+    # Signed, so the client cannot re-upload over the finalized asset
+    assert (fields["overwrite"], fields["invalidate"]) == ("0", "1")
+
+def test_finalize_creates_photo_once(client, headers):
+    ticket = client.post("/api/photos/upload/ticket", headers=headers).json()
+    body = {"ticket": ticket["ticket"], "description": "direct", "tags": ["a", "b"],
+            **cloudinary_response(ticket["public_id"])}
+
+    response = client.post("/api/photos/upload/finalize", headers=headers, json=body)
+    assert response.status_code == 200
+    photo = response.json()
+    assert photo["photo_urls"].endswith(f"/v1718000000/{ticket['public_id']}.jpg")
+    assert sorted(photo["tags"]) == ["a", "b"]
+    assert client.get(f"/api/photos/{photo['id']}", headers=headers).json()["description"] == "direct"
+
+    for extension in ("jpg", "png", "webp"):
+        again = {**body, "format": extension}
+        assert client.post("/api/photos/upload/finalize", headers=headers, json=again).status_code == 409
+    assert client.post("/api/photos/upload/finalize", headers=headers,
+                       json={**body, "format": "jpg/../x"}).status_code == 422
+
+def test_finalize_is_unique_per_public_id(client, headers, test_user: User, test_db: Session):
+    ticket = client.post("/api/photos/upload/ticket", headers=headers).json()
+    # A concurrent finalize of the same upload that committed first, with another version
+    test_db.add(Photos(photo_urls="http://res.cloudinary.com/demo/image/upload/v1/other.jpg",
+                       public_id=ticket["public_id"], created_by_id=test_user.id))
+    test_db.commit()
+
+    body = {"ticket": ticket["ticket"], "description": "direct", **cloudinary_response(ticket["public_id"])}
+    assert client.post("/api/photos/upload/finalize", headers=headers, json=body).status_code == 409
+    assert test_db.query(Photos).filter(Photos.public_id == ticket["public_id"]).count() == 1
+
+def test_finalize_rejects_unverified_uploads(client, headers, test_user: User):
+    public_id = issue_ticket(test_user.id)["public_id"]
+    ticket = issue_ticket(test_user.id)
+    forged = {"ticket": ticket["ticket"], "description": "x", **cloudinary_response(public_id)}
+    assert client.post("/api/photos/upload/finalize", headers=headers, json=forged).status_code == 400
+
+    for other_ticket in (issue_ticket(test_user.id + 1)["ticket"], create_access_token(user_claims(test_user))):
+        body = {"ticket": other_ticket, "description": "x", **cloudinary_response(ticket["public_id"])}
+        assert client.post("/api/photos/upload/finalize", headers=headers, json=body).status_code == 403
+
+def test_local_storage_receives_signed_put(client, headers, storage_dir):
+    media = TestClient(FastAPI(routes=media_router.routes))
+    ticket = client.post("/api/photos/upload/ticket", headers=headers).json()
+    assert ticket["method"] == "PUT"
+    path = ticket["upload_url"].removeprefix("http://localhost")
+
+    finalize = {"ticket": ticket["ticket"], "description": "local"}
+    assert client.post("/api/photos/upload/finalize", headers=headers, json=finalize).status_code == 400
+    assert media.put(path.replace(ticket["public_id"], "other"), content=b"jpeg").status_code == 403
+
+    assert media.put(path, content=b"jpeg").status_code == 201
+    assert (storage_dir / ticket["public_id"]).read_bytes() == b"jpeg"
+    photo = client.post("/api/photos/upload/finalize", headers=headers, json=finalize).json()
+    assert photo["photo_urls"] == f"http://localhost/media/upload/{ticket['public_id']}"
+    assert client.post("/api/photos/upload/finalize", headers=headers, json=finalize).status_code == 409
+
+    assert media.put(path, content=b"other").status_code == 409
+    assert (storage_dir / ticket["public_id"]).read_bytes() == b"jpeg"
@@ -8,7 +8,7 @@ async def test_send_email_success(test_user):
     email = test_user.email
     host = "http://localhost"
     
-    with patch("pymasters.services.email.FastMail.send_message", new_callable=AsyncMock) as mock_send_message:
+    with patch("fastapi_mail.FastMail.send_message", new_callable=AsyncMock) as mock_send_message:
         mock_send_message.return_value = None  
         
         await send_email(email, host)
@@ -16,15 +16,15 @@ async def test_send_email_success(test_user):
         mock_send_message.assert_called_once()
         args, kwargs = mock_send_message.call_args
         assert args[0].recipients == [email]
-        assert args[0].template_body['host'] == host
-        assert 'token' in args[0].template_body
+        assert f'href="{host}api/users/confirmed_email/' in args[0].template_body
+        assert f'{host}api/users/confirmed_email/' in args[0].alternative_body
 
 @pytest.mark.asyncio
 async def test_send_email_connection_error(test_user):
     email = test_user.email
     host = "http://localhost"
     
-    with patch("pymasters.services.email.FastMail.send_message", new_callable=AsyncMock) as mock_send_message:
+    with patch("fastapi_mail.FastMail.send_message", new_callable=AsyncMock) as mock_send_message:
         mock_send_message.side_effect = Exception("Connection error")  
         
         with pytest.raises(Exception):
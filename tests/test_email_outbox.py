@@ -0,0 +1,112 @@
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import patch, AsyncMock
+
+import pytest
+from sqlalchemy.orm import Session
+
+from pymasters.database.models import EmailOutbox
+from pymasters.services import email_outbox
+from pymasters.services.email_outbox import enqueue_email, drain_once, drain, backoff_delay, OutboxMetrics
+from pymasters.services.mail_dispatcher import MailDispatcher, RateLimiter
+from smtp_sink import SMTPSink, local_config
+
+
+@pytest.fixture(scope="function")
+def outbox(test_db: Session):
+    test_db.query(EmailOutbox).delete()
+    test_db.commit()
+    yield test_db
+    test_db.query(EmailOutbox).delete()
+    test_db.commit()
+
+@pytest.fixture
+async def dispatcher():
+    async with SMTPSink() as sink:
+        dispatcher = MailDispatcher(local_config(sink.port), pool_size=1, rate_limiter=RateLimiter(0))
+        dispatcher.sink = sink
+        await dispatcher.start()
+        yield dispatcher
+        await dispatcher.stop()
+
+def queue(db: Session, *recipients: str):
+    for recipient in recipients:
+        enqueue_email(db, recipient, "http://localhost/")
+    db.commit()
+
+def test_enqueue_email_rejects_unknown_kind(outbox: Session):
+    with pytest.raises(ValueError):
+        enqueue_email(outbox, "user@example.com", "http://localhost/", kind="newsletter")
+
+async def test_drain_once_sends_and_deletes_rows(outbox: Session, dispatcher: MailDispatcher):
+    queue(outbox, "user1@example.com", "user2@example.com")
+    stats = await drain_once(outbox, dispatcher)
+
+    assert stats == {"claimed": 2, "sent": 2, "failed": 0}
+    assert outbox.query(EmailOutbox).count() == 0
+    assert len(dispatcher.sink.messages) == 2
+    assert dispatcher.sink.connections == 1
+
+async def test_drain_once_keeps_database_calls_off_the_event_loop(outbox: Session, dispatcher: MailDispatcher):
+    queue(outbox, "user1@example.com")
+    threads = []
+
+    def record(function):
+        def wrapper(*args):
+            threads.append(threading.current_thread())
+            return function(*args)
+        return wrapper
+
+    with patch.object(email_outbox, "claim_batch", record(email_outbox.claim_batch)), \
+         patch.object(email_outbox, "record_results", record(email_outbox.record_results)):
+        assert (await drain_once(outbox, dispatcher))["sent"] == 1
+
+    assert len(threads) == 2 and threading.main_thread() not in threads
+
+async def test_drain_once_retries_with_backoff(outbox: Session):
+    queue(outbox, "user1@example.com")
+    with patch("fastapi_mail.FastMail.send_message", new_callable=AsyncMock) as mock_send_message:
+        mock_send_message.side_effect = Exception("Connection refused")
+        stats = await drain_once(outbox)
+
+    assert stats["failed"] == 1
+    row = outbox.query(EmailOutbox).one()
+    assert row.attempts == 1
+    assert row.last_error == "Connection refused"
+    assert row.next_attempt_at > datetime.utcnow() + backoff_delay(1) - timedelta(seconds=5)
+
+    # Not due yet, so nothing is claimed
+    assert (await drain_once(outbox))["claimed"] == 0
+
+async def test_drain_skips_exhausted_rows(outbox: Session, dispatcher: MailDispatcher):
+    queue(outbox, "user1@example.com", "user2@example.com")
+    row = outbox.query(EmailOutbox).filter(EmailOutbox.recipient == "user1@example.com").one()
+    row.attempts = 3
+    outbox.commit()
+
+    totals = await drain(outbox, dispatcher, batch_size=1, max_attempts=3)
+
+    assert totals == {"claimed": 1, "sent": 1, "failed": 0}
+    assert [row.recipient for row in outbox.query(EmailOutbox)] == ["user1@example.com"]
+
+async def test_metrics_snapshot(outbox: Session, dispatcher: MailDispatcher):
+    metrics = OutboxMetrics()
+    queue(outbox, "user1@example.com", "user2@example.com")
+    row = outbox.query(EmailOutbox).filter(EmailOutbox.recipient == "user1@example.com").one()
+    row.attempts = 3
+    outbox.commit()
+
+    with patch("pymasters.services.email_outbox.metrics", metrics):
+        await drain_once(outbox, dispatcher, max_attempts=3)
+    snapshot = metrics.snapshot(outbox, max_attempts=3)
+
+    assert snapshot["pending"] == 0
+    assert snapshot["dead"] == 1
+    assert snapshot["sent"] == 1
+    assert snapshot["send_latency_p50"] is not None
+    assert snapshot["delivery_latency_p95"] >= 0
+
+def test_backoff_delay():
+    assert backoff_delay(1) == timedelta(seconds=10)
+    assert backoff_delay(3) == timedelta(seconds=40)
+    assert backoff_delay(30) == timedelta(seconds=3600)
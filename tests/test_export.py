@@ -0,0 +1,54 @@
+import json
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from pymasters.database.models import User, Photos, Tags, Comment, Transformation
+from pymasters.export import iter_photo_records, iter_ndjson
+
+
+@pytest.fixture(scope="function")
+def user_photos(test_db: Session, test_user: User):
+    # Export everything created after the photos left behind by other tests
+    start_id = test_db.query(func.max(Photos.id)).scalar() or 0
+
+    nature = test_db.query(Tags).filter(Tags.tag == "export-nature").first() or Tags(tag="export-nature")
+    photos = []
+    for i in range(5):
+        photo = Photos(photo_urls=f"http://example.com/upload/photo_{i}.jpg", description=f"Photo {i}",
+                       created_by_id=test_user.id)
+        photo.tags.append(nature)
+        test_db.add(photo)
+        photos.append(photo)
+    test_db.commit()
+
+    test_db.add(Transformation(photo_id=photos[0].id, transformation_url="http://example.com/t.jpg",
+                               qr_code_url="http://example.com/qr.png"))
+    test_db.add(Comment(content="Nice!", user_id=test_user.id, photo_id=photos[0].id))
+    test_db.commit()
+    return start_id, [photo.id for photo in photos]
+
+def test_iter_photo_records(test_db: Session, test_user: User, user_photos):
+    start_id, photo_ids = user_photos
+    records = list(iter_photo_records(test_db, test_user.id, after_id=start_id, batch_size=2))
+
+    assert [record["id"] for record in records] == photo_ids
+    assert records[0]["tags"] == ["export-nature"]
+    assert records[0]["transformations"][0]["qr_code_url"] == "http://example.com/qr.png"
+    assert records[0]["comments"][0]["content"] == "Nice!"
+    assert records[1]["transformations"] == []
+
+def test_iter_photo_records_resume(test_db: Session, test_user: User, user_photos):
+    _, photo_ids = user_photos
+    records = list(iter_photo_records(test_db, test_user.id, after_id=photo_ids[2], batch_size=2))
+    assert [record["id"] for record in records] == photo_ids[3:]
+
+def test_iter_ndjson(test_db: Session, test_user: User, user_photos):
+    start_id, photo_ids = user_photos
+    lines = list(iter_ndjson(test_db, test_user.id, after_id=start_id))
+
+    assert all(line.endswith(b"\n") for line in lines)
+    documents = [json.loads(line) for line in lines]
+    assert [document["id"] for document in documents] == photo_ids
+    assert documents[0]["description"] == "Photo 0"
@@ -0,0 +1,15 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# Loaded on first use, not when the application is imported
+DEFERRED = ("fastapi_mail", "httpx", "aiosmtplib", "jinja2", "cloudinary", "qrcode")
+
+
+def test_application_import_defers_heavy_modules():
+    code = ("import sys, pymasters.main; "
+            f"print(' '.join(name for name in {DEFERRED!r} if name in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=Path(__file__).resolve().parent.parent)
+
+    assert result.stdout.strip() == ""
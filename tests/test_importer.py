@@ -0,0 +1,83 @@
+import pytest
+import orjson
+from sqlalchemy import create_engine, select, func
+
+from pymasters.database.models import Base, User, Photos, Tags, Comment, Transformation, photo_tags
+from pymasters.importer import import_records, read_records, batched
+
+
+@pytest.fixture(scope="function")
+def import_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'import.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(id=1, email="owner@example.com", password="hashed"))
+        conn.execute(Tags.__table__.insert().values(tag="existing"))
+    yield engine
+    engine.dispose()
+
+def count(engine, table) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table)).scalar()
+
+def make_records(n: int):
+    return [
+        {
+            "id": 100 + i,
+            "photo_urls": f"http://example.com/upload/photo_{i}.jpg",
+            "description": f"Photo {i}",
+            "created_by_id": 1,
+            "tags": ["existing", f"tag_{i % 3}", "existing"],
+            "transformations": [
+                {"transformation_url": "http://example.com/t.jpg", "qr_code_url": "http://example.com/qr.png",
+                 "created_at": "2024-07-29T12:00:00"}
+            ] if i == 0 else [],
+            "comments": [{"user_id": 1, "content": f"Comment {i}", "created_at": "2024-07-29T12:00:00"}],
+        }
+        for i in range(n)
+    ]
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+def test_import_records(import_engine):
+    batches = []
+    stats = import_records(import_engine, make_records(7), batch_size=3, progress=lambda s: batches.append(s.photos))
+
+    assert batches == [3, 6, 7]
+    assert stats.photos == 7
+    assert stats.tags == 3  # tag_0, tag_1, tag_2; "existing" resolved from the dictionary
+    assert stats.photo_tags == 14  # duplicate tags within a record are linked once
+    assert stats.rows_per_second > 0
+
+    assert count(import_engine, Photos.__table__) == 7
+    assert count(import_engine, Tags.__table__) == 4
+    assert count(import_engine, photo_tags) == 14
+    assert count(import_engine, Comment.__table__) == 7
+    assert count(import_engine, Transformation.__table__) == 1
+
+def test_import_records_owner_override(import_engine):
+    with import_engine.begin() as conn:
+        conn.execute(User.__table__.insert().values(id=2, email="partner@example.com", password="hashed"))
+    import_records(import_engine, make_records(2), owner_id=2)
+    with import_engine.connect() as conn:
+        owners = conn.execute(select(Photos.__table__.c.created_by_id)).scalars().all()
+    assert owners == [2, 2]
+
+def test_import_records_copy_requires_postgres(import_engine):
+    with pytest.raises(ValueError):
+        import_records(import_engine, make_records(1), use_copy=True)
+
+def test_read_records(tmp_path):
+    ndjson_path = tmp_path / "photos.ndjson"
+    ndjson_path.write_bytes(b"\n".join(orjson.dumps(record) for record in make_records(2)) + b"\n\n")
+    assert [record["id"] for record in read_records(str(ndjson_path))] == [100, 101]
+
+    csv_path = tmp_path / "photos.csv"
+    csv_path.write_text("photo_urls,description,created_by_id,tags\n"
+                        "http://example.com/a.jpg,First,1,nature; sky\n"
+                        "http://example.com/b.jpg,,1,\n")
+    records = list(read_records(str(csv_path)))
+    assert records[0]["tags"] == ["nature", "sky"]
+    assert records[1]["description"] is None
+    assert records[1]["tags"] == []
@@ -0,0 +1,134 @@
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from sqlalchemy.orm import Session
+
+from pymasters.database.models import User
+from pymasters.repository.auth import create_access_token, user_claims
+from pymasters.repository.photos_repo import PhotoService
+from pymasters.repository.users_repo import UserService
+from pymasters.services.cache import LocalCache, photo_cache
+from pymasters.services.invalidation import (
+    Invalidator, MemoryBus, PostgresBus, encode_payloads, invalidate,
+)
+from pymasters.services.revocations import revocations
+
+
+@pytest.fixture
+def bus():
+    bus = MemoryBus()
+    with patch("pymasters.services.invalidation.get_bus", return_value=bus):
+        yield bus
+
+def worker(max_batch: int = 1000):
+    # Another worker process: its own invalidator and cache
+    other, cache = Invalidator(max_batch), LocalCache(max_size=100, ttl=60)
+    other.register("photo", cache.invalidate)
+    return other, cache
+
+def test_commit_evicts_locally_and_publishes(test_db: Session, bus: MemoryBus):
+    other, other_cache = worker()
+    bus._receivers.append(other.receive)
+    photo_cache.set("1", "cached")
+    other_cache.set("1", "cached")
+
+    invalidate(test_db, "photo:1", "photo:1")
+    test_db.commit()
+
+    assert photo_cache.get("1") is None
+    assert other_cache.get("1") == "cached"  # applied with the worker's next batch
+    assert other.flush() == 1
+    assert other_cache.get("1") is None
+
+def test_rollback_publishes_nothing(test_db: Session, bus: MemoryBus):
+    received = []
+    bus._receivers.append(received.append)
+    photo_cache.set("1", "cached")
+
+    invalidate(test_db, "photo:1")
+    test_db.rollback()
+    test_db.commit()
+
+    assert received == []
+    assert photo_cache.get("1") == "cached"
+
+def test_batches_coalesce_and_overflow_clears():
+    other, cache = worker(max_batch=3)
+    for key in "12345":
+        cache.set(key, key)
+
+    for _ in range(100):
+        other.receive(["photo:1", "photo:2"])
+    assert other.flush() == 2
+    assert other.applied == 1
+    assert len(cache) == 3
+
+    other.receive([f"photo:{n}" for n in range(10)])
+    other.flush()
+    assert len(cache) == 0
+
+def test_lost_connection_clears_everything():
+    other, cache = worker()
+    cache.set("1", "a")
+    other.receive(None)
+    other.receive(["photo:2"])
+    assert other.flush() == 0
+    assert len(cache) == 0
+
+def test_payloads_fit_notify_limit():
+    keys = {f"photo:{n}" for n in range(3000)}
+    payloads = encode_payloads("origin", keys, max_payload=1000)
+
+    assert len(payloads) > 1
+    assert all(len(payload.encode()) <= 1000 for payload in payloads)
+    decoded = [json.loads(payload) for payload in payloads]
+    assert {key for message in decoded for key in message["k"]} == keys
+    assert {message["o"] for message in decoded} == {"origin"}
+
+def test_postgres_bus_notifies_in_transaction():
+    connection = MagicMock()
+    PostgresBus(engine=None, channel="test_channel").publish(["photo:1", "photo:2"], connection)
+
+    statement, params = connection.execute.call_args.args
+    assert "pg_notify" in str(statement)
+    assert params["channel"] == "test_channel"
+    assert json.loads(params["payload"])["k"] == ["photo:1", "photo:2"]
+
+async def test_run_applies_events_from_other_workers():
+    bus, stop = MemoryBus(), asyncio.Event()
+    other, cache = worker()
+    cache.set("7", "cached")
+    task = asyncio.create_task(other.run(bus, interval=0.01, stop=stop))
+    await asyncio.sleep(0.01)
+
+    bus.publish(["photo:7"])
+    await asyncio.sleep(0.05)
+    stop.set()
+    await task
+
+    assert cache.get("7") is None
+
+def test_role_change_expires_revocation_sync(test_user: User, test_db: Session, bus: MemoryBus, clean_revocations):
+    revocations.sync(test_db)
+    assert not revocations.maybe_sync(test_db)
+
+    UserService.change_role(test_user.id, "moderator", test_db)
+    assert revocations.maybe_sync(test_db)
+
+def test_photo_writes_evict_cached_payload(client, test_user: User, test_db: Session):
+    headers = {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+    with patch("cloudinary.uploader.upload", return_value={"url": "http://res.cloudinary.com/demo/image/upload/a.jpg"}):
+        photo_id = client.post("/api/photos/upload", headers=headers, files={"file": ("a.jpg", b"jpeg")},
+                               data={"description": "before", "tags": ["cache"]}).json()["id"]
+
+    assert client.get(f"/api/photos/{photo_id}", headers=headers).json()["description"] == "before"
+    assert photo_cache.get(str(photo_id)) is not None
+
+    client.put(f"/api/photos/{photo_id}", headers=headers, params={"description": "after"})
+    assert client.get(f"/api/photos/{photo_id}", headers=headers).json()["description"] == "after"
+
+    PhotoService.delete_photos(test_db, photo_ids=[photo_id])
+    assert photo_cache.get(str(photo_id)) is None
+    assert client.get(f"/api/photos/{photo_id}", headers=headers).status_code == 404
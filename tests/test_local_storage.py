@@ -0,0 +1,31 @@
+import io
+
+import pytest
+
+from pymasters.services import cloudinary_service, local_storage
+
+
+@pytest.fixture
+def storage_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_storage, "STORAGE_LOCAL_DIR", str(tmp_path))
+    monkeypatch.setattr(local_storage, "STORAGE_LOCAL_URL", "http://localhost/media/upload")
+    monkeypatch.setattr(cloudinary_service, "STORAGE_BACKEND", "local")
+    return tmp_path
+
+def test_upload_and_delete(storage_dir):
+    url = cloudinary_service.upload_photo_to_cloudinary(io.BytesIO(b"jpeg"), public_id="photo_1")
+    assert url == "http://localhost/media/upload/photo_1"
+    assert (storage_dir / "photo_1").read_bytes() == b"jpeg"
+
+    result = cloudinary_service.delete_resources_from_cloudinary(
+        [cloudinary_service.public_id_from_url(url), "missing"])
+    assert sorted(result["deleted"]) == ["missing", "photo_1"]
+    assert not (storage_dir / "photo_1").exists()
+
+def test_upload_generates_safe_public_ids(storage_dir):
+    url = cloudinary_service.upload_photo_to_cloudinary(io.BytesIO(b"jpeg"))
+    public_id = cloudinary_service.public_id_from_url(url)
+    assert (storage_dir / public_id).exists()
+
+    qr_public_id = local_storage.upload(io.BytesIO(b"png"), public_id="http://localhost/a/b_qr_code")["public_id"]
+    assert qr_public_id == "http___localhost_a_b_qr_code"
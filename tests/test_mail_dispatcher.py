@@ -0,0 +1,121 @@
+import asyncio
+import time
+from unittest.mock import patch, AsyncMock
+
+import pytest
+from fastapi_mail import MessageSchema, MessageType
+
+from pymasters.services import mail_dispatcher
+from pymasters.services.email import send_email
+from pymasters.services.mail_dispatcher import MailDispatcher, RateLimiter, build_message
+from smtp_sink import SMTPSink, local_config
+
+
+def make_message(i: int) -> MessageSchema:
+    return MessageSchema(
+        subject="Confirm your email ",
+        recipients=[f"user{i}@example.com"],
+        template_body={"host": "http://localhost/", "token": f"token-{i}"},
+        subtype=MessageType.html,
+    )
+
+@pytest.fixture
+async def sink():
+    async with SMTPSink() as sink:
+        yield sink
+
+async def test_build_message_renders_template():
+    message = await build_message(make_message(1), "email_tamplate.html", local_config(1025))
+    assert message["To"] == "user1@example.com"
+    assert message["From"] == "PyMasters <noreply@example.com>"
+    parts = {part.get_content_type(): part.get_payload(decode=True).decode()
+             for part in message.walk() if not part.is_multipart()}
+    assert "http://localhost/api/users/confirmed_email/token-1" in parts["text/html"]
+    assert "http://localhost/api/users/confirmed_email/token-1" in parts["text/plain"]
+
+async def test_dispatcher_logs_in_with_credentials(sink):
+    config = local_config(sink.port).model_copy(update={"USE_CREDENTIALS": True})
+    dispatcher = MailDispatcher(config, pool_size=1, batch_size=10, rate_limiter=RateLimiter(0))
+    await dispatcher.start()
+    await dispatcher.send(make_message(1), "email_tamplate.html")
+    await dispatcher.stop()
+    assert len(sink.messages) == 1
+
+async def test_dispatcher_reuses_pooled_connections(sink):
+    dispatcher = MailDispatcher(local_config(sink.port), pool_size=2, batch_size=10, rate_limiter=RateLimiter(0))
+    await dispatcher.start()
+    futures = [await dispatcher.submit(make_message(i), "email_tamplate.html") for i in range(25)]
+    await asyncio.gather(*futures)
+    await dispatcher.stop()
+
+    assert dispatcher.sent == 25
+    assert len(sink.messages) == 25
+    assert sink.connections <= 2
+    assert dispatcher.pool.connects == sink.connections
+
+async def test_dispatcher_reconnects_after_disconnect(sink):
+    dispatcher = MailDispatcher(local_config(sink.port), pool_size=1, rate_limiter=RateLimiter(0))
+    await dispatcher.start()
+    await dispatcher.send(make_message(1), "email_tamplate.html")
+    # Simulate the server dropping the idle connection
+    dispatcher.pool._idle[0].close()
+    await dispatcher.send(make_message(2), "email_tamplate.html")
+    await dispatcher.stop()
+
+    assert len(sink.messages) == 2
+    assert sink.connections == 2
+
+async def test_dispatcher_fails_futures_when_server_is_down():
+    dispatcher = MailDispatcher(local_config(1), pool_size=1, rate_limiter=RateLimiter(0))
+    await dispatcher.start()
+    with pytest.raises(Exception):
+        await dispatcher.send(make_message(1), "email_tamplate.html")
+    await dispatcher.stop()
+    assert dispatcher.failed == 1
+
+async def test_refused_recipient_fails_only_its_message():
+    async with SMTPSink(refused={"user1@example.com"}) as sink:
+        dispatcher = MailDispatcher(local_config(sink.port), pool_size=1, batch_size=10, rate_limiter=RateLimiter(0))
+        await dispatcher.start()
+        futures = [await dispatcher.submit(make_message(i), "email_tamplate.html") for i in range(3)]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await dispatcher.stop()
+
+    assert results[0] is None and results[2] is None
+    assert type(results[1]).__name__ == "SMTPRecipientsRefused"
+    assert (dispatcher.sent, dispatcher.failed) == (2, 1)
+    assert len(sink.messages) == 2 and sink.connections == 1
+
+async def test_rate_limiter_throttles():
+    limiter = RateLimiter(rate=20, burst=1)
+    start = time.monotonic()
+    for _ in range(5):
+        await limiter.acquire()
+    assert time.monotonic() - start >= 0.18
+
+async def test_send_email_uses_running_dispatcher(test_user, sink):
+    dispatcher = MailDispatcher(local_config(sink.port), pool_size=1, rate_limiter=RateLimiter(0))
+    await dispatcher.start()
+    with patch.object(mail_dispatcher, "dispatcher", dispatcher), \
+            patch("fastapi_mail.FastMail.send_message", new_callable=AsyncMock) as mock_send_message:
+        await send_email(test_user.email, "http://localhost/")
+    await dispatcher.stop()
+
+    mock_send_message.assert_not_called()
+    assert len(sink.messages) == 1
+    assert b"test@example.com" in sink.messages[0]
+
+async def test_app_dispatcher_starts_on_first_use_once_enabled():
+    assert await mail_dispatcher.app_dispatcher() is None
+
+    mail_dispatcher.enable_dispatcher()
+    try:
+        with patch.object(mail_dispatcher, "MAIL_POOL_SIZE", 1):
+            dispatcher = await mail_dispatcher.app_dispatcher()
+            assert dispatcher is not None and dispatcher.running
+            assert await mail_dispatcher.app_dispatcher() is dispatcher
+    finally:
+        await mail_dispatcher.stop_dispatcher()
+
+    assert mail_dispatcher.dispatcher is None
+    assert await mail_dispatcher.app_dispatcher() is None
@@ -0,0 +1,48 @@
+import pytest
+
+from pymasters.metrics import Counter, Histogram, db_queries, http_requests, storage_latency, time_storage
+
+
+def test_histogram_render():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(3, "/a")
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1"} 2',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a"} 3.55',
+        'latency_seconds_count{route="/a"} 3',
+    ]
+
+def test_counter_escapes_labels():
+    counter = Counter("requests_total", "Requests.", ("path",))
+    counter.inc('say "hi"')
+    counter.inc('say "hi"')
+    assert counter.render()[-1] == 'requests_total{path="say \\"hi\\""} 2'
+
+def test_time_storage_records_outcome():
+    with time_storage("test_upload"):
+        pass
+    with pytest.raises(RuntimeError):
+        with time_storage("test_upload"):
+            raise RuntimeError("storage down")
+    assert storage_latency.count("test_upload", "ok") == 1
+    assert storage_latency.count("test_upload", "error") == 1
+
+def test_metrics_endpoint(client):
+    queries_before = db_queries.count("/api/users/login")
+    client.get("/")
+    client.post("/api/users/login", data={"username": "nobody@example.com", "password": "wrong"})
+    assert http_requests.value("GET", "/", "200") >= 1
+    assert http_requests.value("POST", "/api/users/login", "401") >= 1
+    assert db_queries.count("/api/users/login") == queries_before + 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'pymasters_http_requests_total{method="POST",route="/api/users/login",status="401"}' in response.text
+    assert 'pymasters_db_queries_per_request_bucket{route="/api/users/login",le="+Inf"}' in response.text
@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from pymasters.database.models import User, Photos, Tags, Comment, Transformation, photo_tags
+from pymasters.repository.photos_repo import PhotoService
+
+
+@pytest.fixture(scope="function")
+def other_user(test_db: Session, test_user: User):
+    user = User(email="other@example.com", password="hashed")
+    test_db.add(user)
+    test_db.commit()
+    test_db.refresh(user)
+    yield user
+    PhotoService.delete_photos(test_db, user_id=user.id)
+    test_db.delete(user)
+    test_db.commit()
+
+def get_tag(test_db: Session, name: str) -> Tags:
+    return test_db.query(Tags).filter(Tags.tag == name).first() or Tags(tag=name)
+
+def create_photo(test_db: Session, owner: User, tags=(), with_children: bool = False) -> Photos:
+    photo = Photos(photo_urls=f"http://example.com/upload/{owner.id}_{len(tags)}.jpg", created_by_id=owner.id)
+    for name in tags:
+        photo.tags.append(get_tag(test_db, name))
+    test_db.add(photo)
+    test_db.commit()
+    if with_children:
+        test_db.add(Transformation(photo_id=photo.id, transformation_url="http://example.com/t.jpg",
+                                   qr_code_url=f"http://example.com/upload/qr_{photo.id}.png"))
+        test_db.add(Comment(content="Nice!", user_id=owner.id, photo_id=photo.id))
+        test_db.commit()
+    return photo
+
+def remaining(test_db: Session, model_column, photo_ids) -> int:
+    return test_db.execute(select(func.count()).where(model_column.in_(photo_ids))).scalar()
+
+def test_delete_photos_by_ids(test_db: Session, test_user: User):
+    photo = create_photo(test_db, test_user, tags=["bulk-a"], with_children=True)
+    keep = create_photo(test_db, test_user)
+    photo_id, photo_url = photo.id, photo.photo_urls
+
+    counts, asset_urls = PhotoService.delete_photos(test_db, photo_ids=[photo_id])
+
+    assert counts == {"photos": 1, "photo_tags": 1, "comments": 1, "transformations": 1}
+    assert asset_urls == [photo_url, f"http://example.com/upload/qr_{photo_id}.png"]
+    assert remaining(test_db, Photos.id, [photo_id]) == 0
+    assert remaining(test_db, photo_tags.c.photo_id, [photo_id]) == 0
+    assert remaining(test_db, Comment.photo_id, [photo_id]) == 0
+    assert remaining(test_db, Transformation.photo_id, [photo_id]) == 0
+    assert test_db.get(Photos, keep.id) is not None
+    # Tags themselves are shared and stay
+    assert test_db.query(Tags).filter(Tags.tag == "bulk-a").count() == 1
+
+def test_delete_photos_by_tag_respects_owner(test_db: Session, test_user: User, other_user: User):
+    own = create_photo(test_db, test_user, tags=["bulk-b"]).id
+    foreign = create_photo(test_db, other_user, tags=["bulk-b"]).id
+    untagged = create_photo(test_db, test_user).id
+
+    counts, _ = PhotoService.delete_photos(test_db, tag="bulk-b", owner_id=test_user.id)
+
+    assert counts["photos"] == 1
+    assert remaining(test_db, Photos.id, [own]) == 0
+    assert remaining(test_db, Photos.id, [foreign, untagged]) == 2
+
+def test_delete_photos_by_user(test_db: Session, test_user: User, other_user: User):
+    photo_ids = [create_photo(test_db, other_user, with_children=True).id for _ in range(3)]
+
+    counts, asset_urls = PhotoService.delete_photos(test_db, user_id=other_user.id)
+
+    assert counts["photos"] == 3
+    assert counts["comments"] == 3
+    assert len(asset_urls) == 6
+    assert remaining(test_db, Photos.id, photo_ids) == 0
+
+def test_delete_photos_no_match(test_db: Session):
+    counts, asset_urls = PhotoService.delete_photos(test_db, photo_ids=[-1])
+    assert counts["photos"] == 0
+    assert asset_urls == []
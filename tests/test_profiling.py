@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from fastapi import status
+
+from pymasters.profiling import SamplingProfiler, ProfilingMiddleware
+from pymasters.repository.auth import create_access_token
+
+
+def admin_headers(role: str = "admin") -> dict:
+    token = create_access_token({"sub": "admin@example.com", "uid": 10 ** 6, "role": role, "rv": 0})
+    return {"Authorization": f"Bearer {token}"}
+
+def slow_handler(profiler: SamplingProfiler):
+    profiler.sample()
+
+@pytest.mark.asyncio
+async def test_profiler_records_sampled_requests_only():
+    profiler = SamplingProfiler()
+    profiler.enabled = True
+    profiler.pattern = "/api/photos/*"
+
+    async def app(scope, receive, send):
+        slow_handler(profiler)
+
+    middleware = ProfilingMiddleware(app, profiler)
+    await middleware({"type": "http", "method": "POST", "path": "/api/photos/transform"}, None, None)
+    await middleware({"type": "http", "method": "GET", "path": "/api/users/admin"}, None, None)
+
+    assert profiler.requests == 1
+    assert profiler.samples == 1
+    line = profiler.collapsed().strip()
+    assert line.startswith("POST unmatched;app (")
+    assert ";slow_handler (test_profiling.py:" in line
+    assert line.endswith(" 1")
+
+@pytest.mark.asyncio
+async def test_profiler_disabled_skips_sampling():
+    profiler = SamplingProfiler()
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+
+    await ProfilingMiddleware(app, profiler)({"type": "http", "method": "GET", "path": "/"}, None, None)
+    assert calls == ["/"]
+    assert profiler.requests == 0
+
+def test_profiler_routes(client):
+    assert client.post("/api/profiler", json={}, headers=admin_headers("user")).status_code == status.HTTP_403_FORBIDDEN
+
+    response = client.post("/api/profiler", json={"route": "/", "interval_ms": 1}, headers=admin_headers())
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["enabled"]
+    client.get("/")
+    assert client.get("/api/profiler", headers=admin_headers()).json()["requests"] == 1
+
+    response = client.get("/api/profiler/stacks", headers=admin_headers())
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+
+    assert not client.delete("/api/profiler", headers=admin_headers()).json()["enabled"]
+
+def test_stop_waits_for_the_sampling_thread_at_most_the_timeout():
+    profiler = SamplingProfiler()
+    profiler.start(interval=0.001)
+    sampling = profiler._thread
+    with profiler._lock:  # the thread is stuck in a sample
+        profiler._active[0] = 1
+        profiler.stop(timeout=0.05)
+    assert not profiler.enabled and profiler._thread is None
+
+    sampling.join(1)
+    assert not sampling.is_alive()
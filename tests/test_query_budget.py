@@ -0,0 +1,57 @@
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from pymasters.database.models import User
+from pymasters.query_budget import QueryBudgetMiddleware, QueryReport, record_queries
+from pymasters.repository.auth import create_access_token, user_claims
+from pymasters.repository.photos_repo import PhotoService
+
+UPLOADED_URL = "http://res.cloudinary.com/demo/image/upload/budget.jpg"
+
+
+@pytest.fixture(scope="function")
+def auth_headers(test_user: User, test_db: Session):
+    yield {"Authorization": f"Bearer {create_access_token(user_claims(test_user))}"}
+    PhotoService.delete_photos(test_db, user_id=test_user.id)
+
+def upload(client, headers, tags):
+    with patch("cloudinary.uploader.upload", return_value={"url": UPLOADED_URL}):
+        return client.post("/api/photos/upload", headers=headers, files={"file": ("budget.jpg", b"jpeg")},
+                           data={"description": "budget", "tags": tags})
+
+def test_query_report_flags_repeated_statements():
+    report = QueryReport("GET", "/api/photos/{photo_id}", budget=2, queries=4, query_time=0.01)
+    report.statements.update({"SELECT tags.id FROM tags WHERE tags.tag = ?": 3, "SELECT 1": 1})
+    assert report.over_budget
+    assert report.repeated() == {"SELECT tags.id FROM tags WHERE tags.tag = ?": 3}
+    assert len(report.problems()) == 2
+
+def test_photo_routes_within_budget(client, auth_headers):
+    with record_queries() as reports:
+        response = upload(client, auth_headers, ["a", "b", "c", "d"])
+        assert response.status_code == 200
+        photo_id = response.json()["id"]
+        assert client.get(f"/api/photos/{photo_id}", headers=auth_headers).status_code == 200
+
+    assert [report.route for report in reports] == ["/api/photos/upload", "/api/photos/{photo_id}"]
+    assert [report.budget for report in reports] == [6, 4]
+    reports.assert_within_budget()
+
+def test_upload_queries_do_not_grow_with_tags(client, auth_headers):
+    with record_queries() as reports:
+        upload(client, auth_headers, ["one"])
+        upload(client, auth_headers, [f"many-{i}" for i in range(20)])
+    few, many = reports.for_route("/api/photos/upload")
+    assert many.queries <= few.queries + 1  # + a revocation cache sync
+
+@pytest.mark.asyncio
+async def test_warn_mode_logs_repeated_statements(test_db: Session, caplog):
+    async def app(scope, receive, send):
+        for _ in range(3):
+            test_db.execute(text("SELECT 1"))
+
+    await QueryBudgetMiddleware(app, mode="warn")({"type": "http", "method": "GET", "path": "/"}, None, None)
+    assert "ran the same statement 3 times (possible N+1): SELECT 1" in caplog.text
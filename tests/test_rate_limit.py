@@ -0,0 +1,70 @@
+import pytest
+from fastapi import HTTPException, status
+
+from pymasters.services.rate_limit import Limit, MemoryBucketStore, RateLimiter, parse_limits, limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_parse_limits():
+    parsed = parse_limits("login=10/minute, upload=100 per 2 hours")
+    assert parsed["login"] == Limit(rate=10 / 60, burst=10)
+    assert parsed["upload"] == Limit(rate=100 / 7200, burst=100)
+    with pytest.raises(ValueError):
+        parse_limits("login")
+
+@pytest.mark.asyncio
+async def test_memory_bucket_refills():
+    clock = FakeClock()
+    store = MemoryBucketStore(clock=clock)
+    limit = Limit(rate=1, burst=2)
+
+    assert (await store.acquire("a", limit))[0]
+    assert (await store.acquire("a", limit))[0]
+    allowed, retry_after = await store.acquire("a", limit)
+    assert not allowed and retry_after == pytest.approx(1)
+    # Other keys have their own bucket
+    assert (await store.acquire("b", limit))[0]
+
+    clock.now = 1.5
+    assert (await store.acquire("a", limit))[0]
+    allowed, retry_after = await store.acquire("a", limit)
+    assert not allowed and retry_after == pytest.approx(0.5)
+
+@pytest.mark.asyncio
+async def test_memory_bucket_sweeps_full_buckets():
+    clock = FakeClock()
+    store = MemoryBucketStore(max_keys=2, clock=clock)
+    limit = Limit(rate=1, burst=1)
+    await store.acquire("a", limit)
+    await store.acquire("b", limit)
+
+    clock.now = 5
+    await store.acquire("c", limit)
+    assert len(store) == 1
+
+@pytest.mark.asyncio
+async def test_rate_limiter_raises_429():
+    rate_limiter = RateLimiter({"login": Limit(rate=0.1, burst=1)}, MemoryBucketStore(clock=FakeClock()))
+    await rate_limiter.check("login", "ip:1")
+    await rate_limiter.check("signup", "ip:1")  # not limited
+    with pytest.raises(HTTPException) as excinfo:
+        await rate_limiter.check("login", "ip:1")
+    assert excinfo.value.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert excinfo.value.headers["Retry-After"] == "10"
+
+def test_login_rate_limited(client, monkeypatch):
+    monkeypatch.setattr(limiter, "limits", {"login": Limit(rate=0.01, burst=2)})
+    monkeypatch.setattr(limiter, "store", MemoryBucketStore())
+    form = {"username": "nobody@example.com", "password": "wrong"}
+    assert client.post("/api/users/login", data=form).status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.post("/api/users/login", data=form).status_code == status.HTTP_401_UNAUTHORIZED
+    response = client.post("/api/users/login", data=form)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response.headers["Retry-After"] == "100"
@@ -0,0 +1,50 @@
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+from pymasters import responses
+from pymasters.responses import ModelResponse, respond
+from pymasters.schemas import PhotoDisplay, TransformationDisplay
+
+
+def make_photo(photo_id: int = 1) -> PhotoDisplay:
+    return PhotoDisplay(
+        id=photo_id,
+        photo_urls="http://example.com/photo.jpg",
+        description="A photo",
+        tags=["tag1", "tag2"],
+        transformations=[
+            TransformationDisplay(
+                id=1,
+                transformation_url="http://example.com/transform.jpg",
+                qr_code_url="http://example.com/qr_code.jpg",
+                created_at=datetime(2024, 7, 29, 12, 0, 0)
+            )
+        ]
+    )
+
+def test_model_response_renders_model():
+    photo = make_photo()
+    response = ModelResponse(photo)
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == json.loads(photo.model_dump_json())
+
+def test_model_response_renders_model_list():
+    photos = [make_photo(1), make_photo(2)]
+    body = json.loads(ModelResponse(photos).body)
+    assert [item["id"] for item in body] == [1, 2]
+    assert body[0]["transformations"][0]["created_at"] == "2024-07-29T12:00:00"
+
+def test_model_response_renders_plain_content():
+    assert json.loads(ModelResponse({"detail": "ok"}).body) == {"detail": "ok"}
+
+def test_respond_disabled_returns_model():
+    photo = make_photo()
+    with patch.object(responses, "FAST_JSON_RESPONSES", False):
+        assert respond(photo) is photo
+
+def test_respond_enabled_returns_response():
+    photo = make_photo()
+    with patch.object(responses, "FAST_JSON_RESPONSES", True):
+        result = respond(photo)
+    assert isinstance(result, ModelResponse)
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+
+from pymasters.database.models import RevokedToken
+from pymasters.services.revocations import RevocationCache, revoke, consume_refresh_token, purge_expired, JTI, FAMILY
+
+LIFETIME = timedelta(days=7)
+
+
+@pytest.fixture(scope="function")
+def revoked(test_db: Session):
+    test_db.query(RevokedToken).delete()
+    test_db.commit()
+    yield test_db
+    test_db.query(RevokedToken).delete()
+    test_db.commit()
+
+def expiry(**delta) -> datetime:
+    return datetime.utcnow() + timedelta(**delta)
+
+def test_consume_refresh_token_once(revoked: Session):
+    cache = RevocationCache()
+    assert consume_refresh_token(revoked, "jti-1", "fam-1", expiry(days=1), LIFETIME, cache)
+    assert cache.is_revoked(JTI, "jti-1")
+
+    # Reuse is rejected and revokes the family
+    assert not consume_refresh_token(revoked, "jti-1", "fam-1", expiry(days=1), LIFETIME, cache)
+    assert cache.is_revoked(FAMILY, "fam-1")
+    assert not consume_refresh_token(revoked, "jti-2", "fam-1", expiry(days=1), LIFETIME, cache)
+
+def test_reuse_detected_across_processes(revoked: Session):
+    # Two caches stand in for two worker processes that have not synced yet
+    first, second = RevocationCache(), RevocationCache()
+    first.sync(revoked)
+    second.sync(revoked)
+    assert consume_refresh_token(revoked, "jti-1", "fam-1", expiry(days=1), LIFETIME, first)
+    assert not consume_refresh_token(revoked, "jti-1", "fam-1", expiry(days=1), LIFETIME, second)
+
+    # The family revocation reaches the first process on its next sync
+    first.sync(revoked)
+    assert first.is_revoked(FAMILY, "fam-1")
+
+def test_maybe_sync_respects_interval(revoked: Session):
+    cache = RevocationCache(sync_interval=3600)
+    assert cache.maybe_sync(revoked)
+    revoke(revoked, FAMILY, "fam-1", expiry(days=1), RevocationCache())
+    assert not cache.maybe_sync(revoked)
+    assert not cache.is_revoked(FAMILY, "fam-1")
+
+def test_sync_drops_expired(revoked: Session):
+    cache = RevocationCache()
+    cache.add(JTI, "old", expiry(seconds=-1))
+    revoke(revoked, JTI, "stale", expiry(seconds=-1), RevocationCache())
+    revoke(revoked, JTI, "live", expiry(days=1), RevocationCache())
+    cache.sync(revoked)
+    assert len(cache) == 1
+    assert cache.is_revoked(JTI, "live")
+
+    assert purge_expired(revoked) == 1
+    assert revoked.query(RevokedToken).count() == 1
@@ -0,0 +1,174 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from pymasters.database.models import Base, Photos, Tags
+from pymasters.database.routing import (
+    PIN_COOKIE, ReplicaRoutingMiddleware, ReplicaSet, RequestRouting, RoutingSession, replica_reads, request_routing,
+)
+from pymasters.repository.auth import Principal
+from pymasters.routes.photos import get_photo
+from pymasters.services.cache import photo_cache
+
+
+def sqlite_file(path, tag=None):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    if tag:
+        with Session(engine) as db:
+            db.add(Tags(tag=tag))
+            db.commit()
+    return engine
+
+@pytest.fixture
+def engines(tmp_path):
+    # The files hold different rows, so a query's result shows where it ran
+    primary = sqlite_file(tmp_path / "primary.db", "on-primary")
+    replica = sqlite_file(tmp_path / "replica.db", "on-replica")
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+def read_route(method="GET"):
+    @replica_reads
+    def endpoint():
+        pass
+    return RequestRouting({"method": method, "endpoint": endpoint})
+
+def tag_names(db: Session):
+    return db.scalars(select(Tags.tag)).all()
+
+def test_round_robin_alternates(tmp_path):
+    first, second = create_engine(f"sqlite:///{tmp_path}/a.db"), create_engine(f"sqlite:///{tmp_path}/b.db")
+    replicas = ReplicaSet([first, second], selection="round_robin")
+    assert [replicas.choose() for _ in range(4)] == [first, second, first, second]
+
+def test_least_busy_prefers_idle_replica(tmp_path):
+    first, second = create_engine(f"sqlite:///{tmp_path}/a.db"), create_engine(f"sqlite:///{tmp_path}/b.db")
+    replicas = ReplicaSet([first, second], selection="least_busy")
+    with first.connect():
+        assert {replicas.choose() for _ in range(4)} == {second}
+
+def test_unknown_selection():
+    with pytest.raises(ValueError):
+        ReplicaSet([], selection="random")
+
+def test_lagging_replica_is_skipped(tmp_path):
+    lagging, current = create_engine(f"sqlite:///{tmp_path}/a.db"), create_engine(f"sqlite:///{tmp_path}/b.db")
+    lag = {lagging: 30.0, current: 0.5}
+    replicas = ReplicaSet([lagging, current], max_lag=5, lag_probe=lambda conn: lag[conn.engine])
+    assert {replicas.choose() for _ in range(4)} == {current}
+
+    lag[current] = 10.0
+    replicas.lag_check_interval = 0
+    assert replicas.choose() is None
+
+def test_reads_of_replica_routes_use_replica(engines):
+    primary, replica = engines
+    db = RoutingSession(bind=primary, replicas=ReplicaSet([replica]))
+    token = request_routing.set(read_route())
+    try:
+        assert tag_names(db) == ["on-replica"]
+    finally:
+        request_routing.reset(token)
+        db.close()
+
+def test_other_requests_and_sessions_use_primary(engines):
+    primary, replica = engines
+    replicas = ReplicaSet([replica])
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        assert tag_names(db) == ["on-primary"]
+
+    for routing in (read_route("POST"), RequestRouting({"method": "GET", "endpoint": lambda: None}),
+                    RequestRouting({"method": "GET", "endpoint": read_route().scope["endpoint"]}, pinned=True)):
+        token = request_routing.set(routing)
+        try:
+            with RoutingSession(bind=primary, replicas=replicas) as db:
+                assert tag_names(db) == ["on-primary"]
+        finally:
+            request_routing.reset(token)
+
+def test_writes_go_to_primary_and_pin_the_session(engines):
+    primary, replica = engines
+    routing = read_route()
+    token = request_routing.set(routing)
+    try:
+        with RoutingSession(bind=primary, replicas=ReplicaSet([replica])) as db:
+            assert tag_names(db) == ["on-replica"]
+            db.add(Tags(tag="written"))
+            db.commit()
+            assert sorted(tag_names(db)) == ["on-primary", "written"]
+    finally:
+        request_routing.reset(token)
+    assert routing.wrote
+
+def test_failing_replica_falls_back_to_primary(engines, tmp_path):
+    primary, _ = engines
+    broken = create_engine(f"sqlite:///{tmp_path}/empty.db")  # no tables
+    replicas = ReplicaSet([broken], retry_after=60)
+    token = request_routing.set(read_route())
+    try:
+        with RoutingSession(bind=primary, replicas=replicas) as db:
+            assert tag_names(db) == ["on-primary"]
+        assert replicas.choose() is None
+    finally:
+        request_routing.reset(token)
+        broken.dispose()
+
+def test_middleware_pins_client_after_write(engines):
+    primary, replica = engines
+    factory = sessionmaker(class_=RoutingSession, replicas=ReplicaSet([replica]), bind=primary)
+
+    def get_session():
+        with factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.add_middleware(ReplicaRoutingMiddleware, pin_seconds=60)
+
+    @app.get("/tags")
+    @replica_reads
+    def list_tags(db: Session = Depends(get_session)):
+        return tag_names(db)
+
+    @app.post("/tags")
+    def add_tag(db: Session = Depends(get_session)):
+        db.add(Tags(tag="written"))
+        db.commit()
+
+    with TestClient(app) as client:
+        assert client.get("/tags").json() == ["on-replica"]
+        response = client.post("/tags")
+        assert PIN_COOKIE in response.cookies
+        assert sorted(client.get("/tags").json()) == ["on-primary", "written"]
+
+        client.cookies.clear()
+        assert client.get("/tags").json() == ["on-replica"]
+
+async def test_photo_cache_misses_read_from_the_primary(engines):
+    primary, replica = engines
+    for engine, description in ((primary, "after"), (replica, "before")):
+        with Session(engine) as db:
+            db.add(Photos(id=1, photo_urls="http://example.com/upload/1.jpg", description=description, created_by_id=1))
+            db.commit()
+    owner = Principal(id=1, email="owner@example.com", role="user")
+
+    replicas = ReplicaSet([replica])
+    token = request_routing.set(read_route())
+    try:
+        with RoutingSession(bind=primary, replicas=replicas) as db:
+            assert tag_names(db) == ["on-replica"]  # e.g. the user lookup
+            assert db.info["replica"] is replica
+            await get_photo(1, db=db, current_user=owner)
+        assert photo_cache.get("1")[1].description == "after"
+
+        # The second read is a cache hit, without a query
+        with RoutingSession(bind=primary, replicas=replicas) as db, \
+                patch.object(RoutingSession, "execute", side_effect=AssertionError("queried")):
+            await get_photo(1, db=db, current_user=owner)
+    finally:
+        request_routing.reset(token)
@@ -0,0 +1,86 @@
+import random
+import pytest
+from collections import Counter
+from sqlalchemy import create_engine, select, func
+
+from pymasters.database.models import Base, User, Photos, Tags, Comment, Transformation, photo_tags
+from pymasters.seed import SeedConfig, ZipfSampler, heavy_tailed, seed_database
+
+CONFIG = SeedConfig(users=50, photos=400, tags=100, seed=7)
+
+
+def make_engine(path):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+def dump(engine):
+    with engine.connect() as conn:
+        return {
+            table.name: conn.execute(select(table).order_by(*table.primary_key.columns)).all()
+            for table in (User.__table__, Photos.__table__, Tags.__table__, photo_tags,
+                          Comment.__table__, Transformation.__table__)
+        }
+
+def test_zipf_sampler_skew():
+    sampler = ZipfSampler(100, 1.1, random.Random(1))
+    counts = Counter(sampler.sample() for _ in range(20000))
+    assert set(counts) <= set(range(100))
+    assert counts[0] > 5 * counts[20] > 0
+    distinct = sampler.sample_distinct(10)
+    assert len(distinct) == len(set(distinct))
+
+def test_heavy_tailed():
+    rng = random.Random(1)
+    counts = [heavy_tailed(rng, 1.2, 500) for _ in range(10000)]
+    assert min(counts) == 0
+    assert max(counts) <= 500
+    assert sorted(counts)[len(counts) // 2] <= 1  # most photos get few comments
+    assert max(counts) > 50  # ... and a few get many
+
+def test_seed_database(tmp_path):
+    engine = make_engine(tmp_path / "seed.db")
+    batches = []
+    stats = seed_database(engine, CONFIG, batch_size=100, password_hash="hashed",
+                          progress=lambda s: batches.append(s.photos))
+
+    assert batches[-4:] == [100, 200, 300, 400]
+    assert stats.users == 50
+    assert stats.photos == 400
+    assert stats.tags == 100
+    rows = dump(engine)
+    assert len(rows["photos"]) == 400
+    assert len(rows["photo_tags"]) == stats.photo_tags
+    assert len(rows["comments"]) == stats.comments
+    assert len(rows["transformations"]) == stats.transformations
+
+    tag_use = Counter(tag_id for _, tag_id in rows["photo_tags"])
+    tag_ids = {tag: tag_id for tag_id, tag in rows["tags"]}
+    assert tag_use[tag_ids["seed-tag-0"]] > tag_use[tag_ids["seed-tag-50"]]
+    engine.dispose()
+
+def test_seed_database_is_deterministic(tmp_path):
+    first, second = make_engine(tmp_path / "first.db"), make_engine(tmp_path / "second.db")
+    seed_database(first, CONFIG, batch_size=64, password_hash="hashed")
+    seed_database(second, CONFIG, batch_size=128, password_hash="hashed")
+
+    assert dump(first) == dump(second)
+    first.dispose()
+    second.dispose()
+
+def test_seed_database_appends(tmp_path):
+    engine = make_engine(tmp_path / "seed.db")
+    seed_database(engine, CONFIG, password_hash="hashed")
+    stats = seed_database(engine, CONFIG, password_hash="hashed")
+
+    assert stats.tags == 0  # tags of the first run are reused
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(Photos.__table__)).scalar() == 800
+        assert conn.execute(select(func.count()).select_from(User.__table__)).scalar() == 100
+    engine.dispose()
+
+def test_seed_database_needs_users(tmp_path):
+    engine = make_engine(tmp_path / "seed.db")
+    with pytest.raises(ValueError):
+        seed_database(engine, SeedConfig(users=0, photos=1), password_hash="hashed")
+    engine.dispose()
@@ -0,0 +1,42 @@
+import argparse
+from unittest.mock import patch
+
+from pymasters import serve
+
+
+def test_default_workers():
+    with patch.object(serve, "WEB_CONCURRENCY", 3):
+        assert serve.default_workers() == 3
+    with patch.object(serve, "WEB_CONCURRENCY", 0):
+        assert serve.default_workers() >= 1
+
+def test_build_options():
+    args = argparse.Namespace(
+        bind="127.0.0.1:9000", workers=2, max_requests=500, max_requests_jitter=50, graceful_timeout=30,
+        timeout=30, keepalive=5, access_log=False,
+    )
+    options = serve.build_options(args)
+
+    assert options["preload_app"] is True
+    assert options["worker_class"] == "pymasters.serve.UvicornWorker"
+    assert (options["workers"], options["max_requests"], options["max_requests_jitter"]) == (2, 500, 50)
+    assert options["accesslog"] is None
+
+def test_server_loads_options():
+    server = serve.Server({"bind": "127.0.0.1:9000", "workers": 2, "preload_app": True,
+                           "worker_class": "pymasters.serve.UvicornWorker", "post_fork": serve.post_fork})
+
+    assert server.cfg.workers == 2
+    assert server.cfg.preload_app
+    assert server.cfg.worker_class is serve.UvicornWorker
+    assert serve.UvicornWorker.CONFIG_KWARGS["loop"] == "uvloop"
+    assert serve.UvicornWorker.CONFIG_KWARGS["http"] == "httptools"
+
+def test_preload_loads_deferred_subsystems():
+    import sys
+    from pymasters.services.templates import get_template_service
+
+    serve.preload()
+
+    assert {"fastapi_mail", "aiosmtplib", "qrcode", "cloudinary.uploader"} <= set(sys.modules)
+    assert get_template_service.cache_info().currsize == 1
@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from pymasters.services import cache as cache_module
+from pymasters.services.shared_cache import SEQ, SharedCache, WAYS, table_sets
+from pymasters.services.token_codec import TokenCodec
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "test.cache")
+
+def one_set(path: str, **kwargs) -> SharedCache:
+    # A single set of WAYS slots, so every key competes for the same slots
+    return SharedCache(path, 64 + WAYS * 256, slot_size=256, **{"ttl": 60, **kwargs})
+
+def test_values_round_trip_and_expire(path: str):
+    clock = FakeClock()
+    cache = SharedCache(path, 1024 * 1024, ttl=5, clock=clock)
+    cache.set("1", (7, {"url": "http://a"}))
+    cache.set(b"\x00key", [1, 2])
+    assert cache.get("1") == (7, {"url": "http://a"})
+    assert cache.get(b"\x00key") == [1, 2]
+    assert len(cache) == 2
+
+    clock.now += 5
+    assert cache.get("1") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+def test_least_recently_used_slot_of_the_set_is_evicted(path: str):
+    clock = FakeClock()
+    cache = one_set(path, clock=clock)
+    for n in range(WAYS):
+        cache.set(n, n)
+        clock.now += 1
+    cache.get(0)  # now the most recently used
+    cache.set("new", "new")
+
+    assert cache.get(1) is None
+    assert cache.get(0) == 0 and cache.get("new") == "new"
+    assert len(cache) == WAYS
+
+def test_invalidate_keys_or_everything(path: str):
+    cache = SharedCache(path, 1024 * 1024, ttl=60)
+    for key in "123":
+        cache.set(key, key)
+    cache.invalidate({"1"})
+    assert cache.get("1") is None and len(cache) == 2
+
+    cache.clear()
+    assert len(cache) == 0
+    cache.set("1", "again")
+    assert cache.get("1") == "again"
+
+def test_set_after_invalidation_is_ignored(path: str):
+    cache = SharedCache(path, 1024 * 1024, ttl=60)
+    token = cache.begin()
+    SharedCache(path, 1024 * 1024, ttl=60).invalidate({"1"})  # by another worker
+    cache.set("1", "old", token)
+    assert cache.get("1") is None
+
+    cache.set("1", "new", cache.begin())
+    assert cache.get("1") == "new"
+
+def test_oversized_values_are_not_cached(path: str):
+    cache = one_set(path)
+    cache.set("big", "x" * 1000)
+    assert cache.get("big") is None and cache.oversized == 1
+
+def test_slot_being_written_reads_as_a_miss(path: str):
+    cache = one_set(path)
+    cache.set("1", "a")
+    offset = next(offset for offset in range(64, 64 + WAYS * 256, 256) if SEQ.unpack_from(cache._map, offset)[0])
+    SEQ.pack_into(cache._map, offset, 3)  # a writer died halfway
+    assert cache.get("1") is None
+
+    cache.set("1", "b")
+    assert cache.get("1") == "b"
+    assert SEQ.unpack_from(cache._map, offset)[0] % 2 == 0
+
+def test_different_layout_replaces_the_file(path: str):
+    old = SharedCache(path, 1024 * 1024, ttl=60)
+    old.set("1", "a")
+    cache = SharedCache(path, 2 * 1024 * 1024, ttl=60)
+    assert cache.get("1") is None
+    assert SharedCache(path, 2 * 1024 * 1024, ttl=60).get("1") is None
+
+    cache.set("1", "b")
+    assert SharedCache(path, 2 * 1024 * 1024, ttl=60).get("1") == "b"
+    # A process still on the old layout keeps its intact mapping instead of a truncated one
+    assert old.get("1") == "a" and len(old) == 1
+    assert sorted(os.listdir(os.path.dirname(path))) == ["test.cache"]
+
+def test_create_cache_names_the_file_by_its_layout(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "SHARED_CACHE_DIR", str(tmp_path))
+    small = cache_module.create_cache("photo", 100, 60, shared_mb=1)
+    large = cache_module.create_cache("photo", 100, 60, shared_mb=2)
+    small.set("1", "a")
+
+    assert os.path.basename(small.path) == f"pymasters-photo-{table_sets(1024 * 1024, small.slot_size)}x{small.slot_size}.cache"
+    assert small.path != large.path and large.get("1") is None
+
+def test_budget_too_small_is_rejected(path: str):
+    with pytest.raises(ValueError):
+        SharedCache(path, 1024, ttl=60)
+
+def fill(path: str, count: int):
+    cache = SharedCache(path, 1024 * 1024, ttl=60)
+    for n in range(count):
+        cache.set(str(n), {"id": n})
+
+def test_entries_are_shared_between_processes(path: str):
+    cache = SharedCache(path, 1024 * 1024, ttl=60)
+    process = multiprocessing.get_context("fork").Process(target=fill, args=(path, 100))
+    process.start()
+    process.join(10)
+
+    assert all(cache.get(str(n)) == {"id": n} for n in range(100))
+
+def test_token_codec_verifies_once_per_host(path: str):
+    token = TokenCodec("HS256", "secret").encode({"sub": "a@example.com", "exp": int(time.time()) + 60})
+    first = TokenCodec("HS256", "secret", shared_cache=SharedCache(path, 1024 * 1024, ttl=60))
+    second = TokenCodec("HS256", "secret", shared_cache=SharedCache(path, 1024 * 1024, ttl=60))
+
+    assert first.decode(token)["sub"] == "a@example.com"
+    assert second.decode(token)["sub"] == "a@example.com"
+    assert second.shared_cache.hits == 1
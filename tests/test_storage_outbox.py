@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.orm import Session
+
+from pymasters.database.models import StorageDeletion
+from pymasters.metrics import storage_outbox_pending
+from pymasters.services.storage_outbox import (
+    enqueue_storage_deletions, drain_once, drain, pending_count, backoff_delay, run_dispatcher,
+)
+
+
+@pytest.fixture(scope="function")
+def outbox(test_db: Session):
+    test_db.query(StorageDeletion).delete()
+    test_db.commit()
+    yield test_db
+    test_db.query(StorageDeletion).delete()
+    test_db.commit()
+
+def queue(db: Session, *names: str):
+    enqueue_storage_deletions(db, [f"http://res.cloudinary.com/demo/image/upload/{name}.jpg" for name in names])
+    db.commit()
+
+def test_enqueue_storage_deletions_deduplicates(outbox: Session):
+    queue(outbox, "photo_1", "photo_2", "photo_1")
+    queue(outbox, "photo_2")
+    assert sorted(row.public_id for row in outbox.query(StorageDeletion)) == ["photo_1", "photo_2"]
+
+def test_enqueue_keeps_qr_codes_apart_from_their_photo(outbox: Session):
+    transformation_url = "http://res.cloudinary.com/demo/image/upload/w_300,h_300,c_fill/v1/abc.jpg"
+    enqueue_storage_deletions(outbox, ["http://res.cloudinary.com/demo/image/upload/v1/abc.jpg",
+                                       f"http://res.cloudinary.com/demo/image/upload/v2/{transformation_url}_qr_code.png"])
+    outbox.commit()
+    assert sorted(row.public_id for row in outbox.query(StorageDeletion)) == ["abc", f"{transformation_url}_qr_code"]
+
+def test_drain_once_deletes_rows(outbox: Session, caplog):
+    queue(outbox, "photo_1", "photo_2")
+    with patch('cloudinary.api.delete_resources') as mock_delete_resources, \
+         caplog.at_level(logging.INFO, logger="pymasters.services.storage_outbox"):
+        mock_delete_resources.return_value = {"deleted": {"photo_1": "deleted", "photo_2": "not_found"}}
+        stats = drain_once(outbox)
+
+    assert stats == {"claimed": 2, "deleted": 2, "failed": 0, "remaining": 0}
+    assert "2/2 assets of the batch processed" in caplog.text
+    assert storage_outbox_pending.value() == 0
+    mock_delete_resources.assert_called_once_with(["photo_1", "photo_2"], invalidate=True)
+    assert pending_count(outbox) == 0
+
+def test_drain_once_retries_with_backoff(outbox: Session):
+    queue(outbox, "photo_1")
+    with patch('cloudinary.api.delete_resources', side_effect=Exception("Rate limited")):
+        stats = drain_once(outbox)
+
+    assert stats["failed"] == 1 and stats["remaining"] == 1
+    assert storage_outbox_pending.value() == 1
+    row = outbox.query(StorageDeletion).one()
+    assert row.attempts == 1
+    assert row.last_error == "Rate limited"
+    assert row.next_attempt_at > datetime.utcnow() + backoff_delay(1) - timedelta(seconds=5)
+
+    # Not due yet, so nothing is claimed
+    with patch('cloudinary.api.delete_resources') as mock_delete_resources:
+        assert drain_once(outbox)["claimed"] == 0
+    mock_delete_resources.assert_not_called()
+
+def test_drain_skips_exhausted_rows(outbox: Session):
+    queue(outbox, "photo_1", "photo_2")
+    row = outbox.query(StorageDeletion).filter(StorageDeletion.public_id == "photo_1").one()
+    row.attempts = 3
+    outbox.commit()
+
+    with patch('cloudinary.api.delete_resources') as mock_delete_resources:
+        mock_delete_resources.return_value = {"deleted": {"photo_2": "deleted"}}
+        totals = drain(outbox, batch_size=1, max_attempts=3)
+
+    assert totals == {"claimed": 1, "deleted": 1, "failed": 0, "remaining": 1}
+    assert [row.public_id for row in outbox.query(StorageDeletion)] == ["photo_1"]
+
+def test_backoff_delay():
+    assert backoff_delay(1) == timedelta(seconds=5)
+    assert backoff_delay(3) == timedelta(seconds=20)
+    assert backoff_delay(30) == timedelta(seconds=3600)
+
+async def test_run_dispatcher_finishes_drain_when_stopped():
+    stop = asyncio.Event()
+    drains = []
+
+    def drain_with_new_session(batch_size, max_attempts):
+        drains.append(batch_size)
+        stop.set()  # shutdown starts while a drain is in progress
+
+    with patch("pymasters.services.storage_outbox._drain_with_new_session", drain_with_new_session):
+        await asyncio.wait_for(run_dispatcher(interval=60, batch_size=10, stop=stop), timeout=5)
+
+    assert drains == [10]
@@ -0,0 +1,40 @@
+from unittest.mock import patch
+
+from fastapi_mail import MessageSchema, MessageType
+from fastapi_mail.schemas import MultipartSubtypeEnum
+
+from pymasters.services.templates import TemplateService, get_template_service, render_message
+
+
+def test_template_service_precompiles_all_templates():
+    templates = get_template_service()
+    assert {"email_tamplate.html", "email_tamplate.txt"} <= set(templates.names)
+
+def test_render_pair_with_text_alternate():
+    html, text = get_template_service().render_pair("email_tamplate.html", {"host": "http://localhost/", "token": "abc"})
+    assert 'href="http://localhost/api/users/confirmed_email/abc"' in html
+    assert "http://localhost/api/users/confirmed_email/abc" in text
+    assert "<" not in text
+
+def test_render_pair_without_alternate(tmp_path):
+    (tmp_path / "notice.html").write_text("<p>{{ name }}</p>")
+    templates = TemplateService(tmp_path, cache_dir=str(tmp_path / "cache")).load()
+    assert templates.render_pair("notice.html", {"name": "<b>"}) == ("<p>&lt;b&gt;</p>", None)
+    # The folder is listed once, not on every render
+    with patch.object(templates.env, "list_templates", side_effect=AssertionError("listed")):
+        assert templates.render_pair("notice.html", {"name": "x"}) == ("<p>x</p>", None)
+    # Bytecode was written to the cache directory
+    assert any((tmp_path / "cache").iterdir())
+
+def test_render_message():
+    message = MessageSchema(
+        subject="Confirm your email ",
+        recipients=["user@example.com"],
+        template_body={"host": "http://localhost/", "token": "abc"},
+        subtype=MessageType.html,
+    )
+    rendered = render_message(message, "email_tamplate.html")
+    assert "confirmed_email/abc" in rendered.template_body
+    assert "confirmed_email/abc" in rendered.alternative_body
+    assert rendered.multipart_subtype == MultipartSubtypeEnum.alternative
+    assert message.template_body == {"host": "http://localhost/", "token": "abc"}
@@ -0,0 +1,78 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from jose import jwt, JWTError
+
+from pymasters.services.token_codec import TokenCodec, load_pem
+
+
+def pem_pair(private_key):
+    private_pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                            serialization.NoEncryption()).decode()
+    public_pem = private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                       serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+    return private_pem, public_pem
+
+KEYS = {
+    "RS256": pem_pair(rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+    "ES256": pem_pair(ec.generate_private_key(ec.SECP256R1())),
+    "EdDSA": pem_pair(ed25519.Ed25519PrivateKey.generate()),
+}
+
+def claims(**extra):
+    return {"sub": "test@example.com", "exp": int(time.time()) + 60, **extra}
+
+def test_hmac_round_trip_is_compatible_with_jose():
+    codec = TokenCodec("HS256", "secret")
+    token = codec.encode(claims())
+    assert jwt.decode(token, "secret", algorithms=["HS256"])["sub"] == "test@example.com"
+    assert codec.decode(jwt.encode(claims(), "secret", algorithm="HS256"))["sub"] == "test@example.com"
+
+@pytest.mark.parametrize("algorithm", sorted(KEYS))
+def test_asymmetric_verify_with_public_key_only(algorithm):
+    private_pem, public_pem = KEYS[algorithm]
+    token = TokenCodec(algorithm, private_key=private_pem).encode(claims())
+
+    verifier = TokenCodec(algorithm, public_key=public_pem)
+    assert not verifier.can_sign
+    assert verifier.decode(token)["sub"] == "test@example.com"
+    with pytest.raises(JWTError):
+        verifier.encode(claims())
+
+def test_rejects_tampered_and_foreign_tokens():
+    codec = TokenCodec("EdDSA", private_key=KEYS["EdDSA"][0])
+    token = codec.encode(claims())
+    with pytest.raises(JWTError):
+        codec.decode(token[:-2] + ("AA" if not token.endswith("AA") else "BB"))
+    with pytest.raises(JWTError):
+        codec.decode(TokenCodec("HS256", "secret").encode(claims()))
+
+def test_claims_cache_verifies_once():
+    codec = TokenCodec("HS256", "secret")
+    token = codec.encode(claims())
+    with patch("pymasters.services.token_codec.jwt.decode", wraps=jwt.decode) as mock_decode:
+        first = codec.decode(token)
+        first["sub"] = "changed"
+        assert codec.decode(token)["sub"] == "test@example.com"
+    assert mock_decode.call_count == 1
+
+def test_claims_cache_respects_expiry_and_size():
+    codec = TokenCodec("HS256", "secret", cache_size=2, cache_ttl=60)
+    token = codec.encode(claims(exp=int(time.time()) + 1))
+    codec.decode(token)
+    time.sleep(2.1)
+    with pytest.raises(JWTError):
+        codec.decode(token)
+
+    for i in range(3):
+        codec.decode(codec.encode(claims(n=i)))
+    assert len(codec._cache) == 2
+
+def test_load_pem_from_file(tmp_path):
+    path = tmp_path / "public.pem"
+    path.write_text(KEYS["ES256"][1])
+    assert load_pem(str(path)) == KEYS["ES256"][1]
+    assert load_pem(KEYS["ES256"][1]) == KEYS["ES256"][1]
@@ -1,4 +1,5 @@
 import pytest
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi import HTTPException
@@ -46,8 +47,43 @@ def test_login_user_invalid_password(test_user, test_db: Session):
 def test_refresh_token(test_user, test_db: Session):
     login_data = OAuth2PasswordRequestForm(username=test_user.email, password="testpassword", scope="")
     _, refresh_token = UserService.login_user(body=login_data, db=test_db)
-    new_access_token = UserService.refresh_token(refresh_token=refresh_token, db=test_db)
+    new_access_token, new_refresh_token = UserService.refresh_token(refresh_token=refresh_token, db=test_db)
     assert new_access_token is not None
+    assert jwt.decode(new_refresh_token, SECRET_KEY, algorithms=[ALGORITHM])["fam"] == \
+        jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])["fam"]
+
+# Test that a rotated refresh token cannot be used again
+def test_refresh_token_reuse_revokes_family(test_user, test_db: Session):
+    login_data = OAuth2PasswordRequestForm(username=test_user.email, password="testpassword", scope="")
+    _, refresh_token = UserService.login_user(body=login_data, db=test_db)
+    _, rotated_token = UserService.refresh_token(refresh_token=refresh_token, db=test_db)
+
+    with pytest.raises(InvalidRefreshtoken):
+        UserService.refresh_token(refresh_token=refresh_token, db=test_db)
+    # The whole family is revoked, including the rotated token
+    with pytest.raises(InvalidRefreshtoken):
+        UserService.refresh_token(refresh_token=rotated_token, db=test_db)
+
+# Test that a role change bumps the role version and refreshing issues the new role
+def test_change_role(test_user, test_db: Session, clean_revocations):
+    login_data = OAuth2PasswordRequestForm(username=test_user.email, password="testpassword", scope="")
+    _, refresh_token = UserService.login_user(body=login_data, db=test_db)
+
+    user = UserService.change_role(test_user.id, "moderator", test_db)
+    assert (user.role, user.role_version) == ("moderator", 1)
+    assert UserService.change_role(-1, "admin", test_db) is None
+
+    access_token, _ = UserService.refresh_token(refresh_token=refresh_token, db=test_db)
+    claims = jwt.decode(access_token, SECRET_KEY, algorithms=[ALGORITHM])
+    assert (claims["role"], claims["rv"]) == ("moderator", 1)
+
+# Test that login does not write to the users table
+def test_login_user_is_read_only(test_user, test_db: Session):
+    login_data = OAuth2PasswordRequestForm(username=test_user.email, password="testpassword", scope="")
+    UserService.login_user(body=login_data, db=test_db)
+    assert not test_db.dirty
+    test_db.refresh(test_user)
+    assert test_user.refresh_token is None
 
 # Test for saving user information
 def test_save_user(test_user, test_db: Session):
@@ -81,3 +117,31 @@ def test_refresh_token_invalid(test_user, test_db: Session):
     assert exc_info.value.status_code == 401
     assert exc_info.value.detail == 'Could not validate credentials'
 
+
+# Test that the first user becomes the bootstrap admin
+def test_create_new_user_bootstraps_admin(test_db: Session):
+    test_db.query(User).delete()
+    test_db.commit()
+
+    first = UserService.creat_new_user(body=UserModel(username="first@example.com", password="password"), db=test_db)
+    second = UserService.creat_new_user(body=UserModel(username="second@example.com", password="password"), db=test_db)
+    assert (first.role, first.bootstrap) == ("admin", True)
+    assert (second.role, second.bootstrap) == ("user", None)
+
+# Test for creating a user with an email that is already taken
+def test_create_new_user_taken(test_user, test_db: Session):
+    with pytest.raises(UsernameTaken):
+        UserService.creat_new_user(body=UserModel(username=test_user.email, password="password"), db=test_db)
+
+# Test that signup is a single statement
+def test_create_new_user_single_statement(test_user, test_db: Session):
+    statements = []
+    engine = test_db.get_bind()
+    listener = lambda conn, cursor, statement, *args: "SAVEPOINT" not in statement and statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        UserService.creat_new_user(body=UserModel(username="single@example.com", password="password"), db=test_db)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT INTO users")